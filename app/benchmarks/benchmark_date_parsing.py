@@ -0,0 +1,67 @@
+"""
+Benchmarks the vectorized `parse_dates` against the previous row-by-row parser.
+
+Usage example:
+    python -m benchmarks.benchmark_date_parsing --rows 1000000 10000000
+
+The row-by-row parser is timed on a sample and extrapolated to the full row
+count, since running it on millions of rows takes tens of minutes.
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from etl_project.assets.presupuesto_etl import parse_dates
+
+
+def parse_dates_row_by_row(dates: pd.Series) -> pd.Series:
+    """The per-row parser that `parse_dates` replaced."""
+
+    def parse_date(date_str):
+        for fmt in ("%Y/%m/%d", "%d-%m-%Y"):
+            try:
+                return pd.to_datetime(date_str, format=fmt)
+            except ValueError:
+                continue
+        return pd.NaT
+
+    return dates.apply(parse_date)
+
+
+def make_dates(rows: int, seed: int = 0) -> pd.Series:
+    """Daily dates over ten years, randomly written in either known format."""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2015-01-01", periods=3653, freq="D")
+    picked = days[rng.integers(0, len(days), size=rows)]
+    slashed = pd.Series(picked.strftime("%Y/%m/%d"))
+    dashed = pd.Series(picked.strftime("%d-%m-%Y"))
+    return slashed.where(rng.random(rows) < 0.5, dashed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--legacy-sample", type=int, default=20_000)
+    args = parser.parse_args()
+
+    sample = make_dates(args.legacy_sample)
+    start = time.perf_counter()
+    parse_dates_row_by_row(sample)
+    legacy_seconds_per_row = (time.perf_counter() - start) / len(sample)
+
+    print(f"{'rows':>12} {'row-by-row (est.)':>18} {'vectorized':>12} {'speedup':>9}")
+    for rows in args.rows:
+        dates = make_dates(rows)
+        start = time.perf_counter()
+        parse_dates(dates)
+        vectorized_seconds = time.perf_counter() - start
+        legacy_seconds = legacy_seconds_per_row * rows
+        print(
+            f"{rows:>12,} {legacy_seconds:>17.1f}s {vectorized_seconds:>11.2f}s "
+            f"{legacy_seconds / vectorized_seconds:>8.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
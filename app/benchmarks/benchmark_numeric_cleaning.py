@@ -0,0 +1,92 @@
+"""
+Benchmarks `clean_numeric_columns` against the previous per-cell cleaners.
+
+Usage example:
+    python -m benchmarks.benchmark_numeric_cleaning --rows 1000000
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from etl_project.assets.presupuesto_etl import NUMERIC_COLUMNS, clean_numeric_columns
+
+
+def clean_row_by_row(df: pd.DataFrame) -> pd.DataFrame:
+    """The per-cell cleaners that `clean_numeric_columns` replaced."""
+
+    def clean_currency_values(value):
+        try:
+            value = (
+                str(value)
+                .replace(",", "")
+                .replace("$", "")
+                .replace("MXN", "")
+                .replace("mex$", "")
+                .replace("pesos", "")
+                .replace("MEX$", "")
+                .replace("MEX", "")
+            )
+            return float(value) if value else None
+        except Exception:
+            return None
+
+    def clean_gdp_contribution(value):
+        try:
+            return float(value.replace("%", "")) if value else None
+        except Exception:
+            return None
+
+    for column in ("Revenue", "Expenses", "Tax Income", "Debt"):
+        df[column] = df[column].apply(clean_currency_values).astype("float64")
+    df["GDP Contribution"] = df["GDP Contribution"].apply(clean_gdp_contribution)
+    return df
+
+
+def make_amounts(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Amount columns decorated the same way as the presupuesto files."""
+    rng = np.random.default_rng(seed)
+    decorations = {
+        "Revenue": "${}",
+        "Expenses": "{} MXN",
+        "Tax Income": "{} pesos",
+        "Debt": "{} MEX$",
+        "GDP Contribution": "{}%",
+    }
+    return pd.DataFrame(
+        {
+            column: [
+                decoration.format(value)
+                for value in rng.uniform(0, 1000, rows).round(2)
+            ]
+            for column, decoration in decorations.items()
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'row-by-row':>11} {'vectorized':>11} {'speedup':>8}")
+    for rows in args.rows:
+        df = make_amounts(rows)
+
+        start = time.perf_counter()
+        expected = clean_row_by_row(df.copy())
+        row_by_row_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual, _ = clean_numeric_columns(df.copy(), NUMERIC_COLUMNS)
+        vectorized_seconds = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(actual, expected)
+        print(
+            f"{rows:>12,} {row_by_row_seconds:>10.2f}s {vectorized_seconds:>10.2f}s "
+            f"{row_by_row_seconds / vectorized_seconds:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
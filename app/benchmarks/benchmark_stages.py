@@ -0,0 +1,224 @@
+"""
+Benchmarks the extract, transform and validate stages on synthetic presupuesto
+files, with the pandas and the pyarrow CSV readers.
+
+Usage example:
+    python -m benchmarks.benchmark_stages --rows 10000 1000000 10000000 \
+        --output results.json --baseline baseline.json
+
+Files are generated with `benchmarks.generate_financial_data` on first use and
+kept in --data-folder-path. Each stage is run --repeat times and reports its
+best rows/s and its peak memory, measured as the peak resident memory it added
+on top of its input. Results saved with --output can be passed as --baseline
+to a later run, which flags stages that got slower than --tolerance and then
+exits with status 1. No database is needed.
+"""
+
+import argparse
+import functools
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import pandas as pd
+import pyarrow as pa
+from benchmarks.generate_financial_data import write_financial_data_file
+from etl_project.assets.data_validation import validate_financial_data
+from etl_project.assets.presupuesto_etl import (
+    extract_financial_data_file,
+    transform_financial_data,
+)
+from etl_project.assets.stage_metrics import read_peak_memory, reset_peak_memory
+
+
+def _read_memory_status(field: str) -> int:
+    """Reads a memory field of /proc/self/status, in bytes."""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def measure_stage(function, *args) -> tuple[object, float, int]:
+    """
+    Runs a stage once.
+
+    Returns:
+        The stage result, its wall time in seconds and the peak resident
+        memory it added in bytes, or None where that cannot be measured.
+    """
+    gc.collect()
+    can_measure_memory = reset_peak_memory()
+    if can_measure_memory:
+        memory_before = _read_memory_status("VmRSS")
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    peak_memory = read_peak_memory() - memory_before if can_measure_memory else None
+    return result, seconds, peak_memory
+
+
+def get_synthetic_file(data_folder_path: str, rows: int) -> str:
+    """Returns the path of a synthetic file with `rows` rows, generating it once."""
+    os.makedirs(data_folder_path, exist_ok=True)
+    file_path = os.path.join(data_folder_path, f"synthetic_{rows}.csv")
+    if not os.path.exists(file_path):
+        print(f"Generating {rows:,} rows in {file_path}")
+        write_financial_data_file(file_path=file_path, rows=rows)
+    return file_path
+
+
+def run_benchmarks(
+    row_counts: list[int],
+    data_folder_path: str,
+    repeat: int = 3,
+    csv_engines: list[str] = ("pandas", "pyarrow"),
+) -> dict:
+    """
+    Benchmarks each stage at each row count, keeping the fastest of `repeat`
+    runs and the highest peak memory.
+
+    The extract and transform stages are run with each CSV engine, and are
+    named with the engine unless it is pandas, e.g. `extract_pyarrow`. The
+    validate stage runs on the output of the first engine.
+    """
+    # the rejected values of the synthetic files are expected, keep them quiet
+    logger = logging.getLogger("benchmarks.quiet")
+    logger.setLevel(logging.ERROR)
+    results = {}
+    for rows in row_counts:
+        file_path = get_synthetic_file(data_folder_path, rows)
+        runs = {}
+        for _ in range(repeat):
+            for csv_engine in csv_engines:
+                suffix = "" if csv_engine == "pandas" else f"_{csv_engine}"
+                df, seconds, peak_memory = measure_stage(
+                    functools.partial(
+                        extract_financial_data_file, csv_engine=csv_engine
+                    ),
+                    file_path,
+                )
+                runs.setdefault(f"extract{suffix}", []).append((seconds, peak_memory))
+                df, seconds, peak_memory = measure_stage(
+                    functools.partial(transform_financial_data, logger=logger), df
+                )
+                runs.setdefault(f"transform{suffix}", []).append((seconds, peak_memory))
+                if csv_engine == csv_engines[0]:
+                    _, seconds, peak_memory = measure_stage(validate_financial_data, df)
+                    runs.setdefault("validate", []).append((seconds, peak_memory))
+                del df
+        for stage, stage_runs in runs.items():
+            results.setdefault(stage, {})[str(rows)] = _stage_result(rows, stage_runs)
+    return results
+
+
+def _stage_result(rows: int, runs: list[tuple[float, int]]) -> dict:
+    seconds = min(run_seconds for run_seconds, _ in runs)
+    peak_memories = [peak_memory for _, peak_memory in runs if peak_memory is not None]
+    return {
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(rows / seconds),
+        "peak_memory_mb": (
+            round(max(peak_memories) / 2**20, 1) if peak_memories else None
+        ),
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns the (stage, rows) pairs whose rows/s fell more than `tolerance`
+    below the baseline.
+    """
+    regressions = []
+    for stage, stage_results in results.items():
+        for rows, result in stage_results.items():
+            baseline_result = baseline.get(stage, {}).get(rows)
+            if baseline_result is None:
+                continue
+            change = result["rows_per_second"] / baseline_result["rows_per_second"] - 1
+            result["change_vs_baseline"] = round(change, 3)
+            if change < -tolerance:
+                regressions.append((stage, rows))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument(
+        "--data-folder-path",
+        default=os.path.join(tempfile.gettempdir(), "presupuesto_benchmark"),
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage")
+    parser.add_argument(
+        "--csv-engines",
+        nargs="+",
+        choices=["pandas", "pyarrow"],
+        default=["pandas", "pyarrow"],
+        help="CSV readers to extract the files with",
+    )
+    parser.add_argument("--output", help="file to save the results to, as JSON")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="slowdown against the baseline allowed before flagging, 0.1 is 10%%",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.rows, args.data_folder_path, args.repeat, args.csv_engines
+    )
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+
+    print(f"{'stage':<18} {'rows':>12} {'rows/s':>12} {'peak MB':>9} {'vs base':>8}")
+    for stage, stage_results in results.items():
+        for rows, result in stage_results.items():
+            peak_memory = result["peak_memory_mb"]
+            change = result.get("change_vs_baseline")
+            print(
+                f"{stage:<18} {int(rows):>12,} {result['rows_per_second']:>12,} "
+                f"{'n/a' if peak_memory is None else peak_memory:>9} "
+                f"{'' if change is None else f'{change:+.0%}':>8}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {
+                    "environment": {
+                        "python": platform.python_version(),
+                        "pandas": pd.__version__,
+                        "pyarrow": pa.__version__,
+                        "machine": platform.machine(),
+                        "cpus": os.cpu_count(),
+                    },
+                    "results": results,
+                },
+                output_file,
+                indent=2,
+            )
+        print(f"Saved results to {args.output}")
+
+    if regressions:
+        for stage, rows in regressions:
+            print(
+                f"Regression: {stage} at {int(rows):,} rows is slower than the baseline"
+            )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Generates large synthetic presupuesto files with the same dirt as the real ones.
+
+Usage example:
+    python -m benchmarks.generate_financial_data --rows 1000000 --output data.csv
+
+Rows mix `Y/m/d` and `d-m-Y` dates, decorate amounts with `$`, `MXN`, `pesos`
+and `MEX$`, give the GDP contribution as a `%` and use the misspelled
+currencies of the real files. A small share of cells is empty or holds an
+unparseable value.
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+
+CURRENCIES = ("Pesos", "pesoss", "mex", "mxn", "MEX$", "MXN")
+AMOUNT_DECORATIONS = {
+    "Revenue": ("$", ""),
+    "Expenses": ("", " MXN"),
+    "Tax Income": ("", " pesos"),
+    "Debt": ("", " MEX$"),
+}
+
+
+def _with_dirt(
+    values: np.ndarray, rng: np.random.Generator, dirty_fraction: float
+) -> np.ndarray:
+    """Blanks out or garbles a share of the values."""
+    values = values.astype(object)
+    dirt = rng.random(len(values))
+    values[dirt < dirty_fraction / 2] = np.nan
+    values[(dirt >= dirty_fraction / 2) & (dirt < dirty_fraction)] = "N/D"
+    return values
+
+
+def generate_financial_data(
+    rows: int, year: int = 2024, seed: int = 0, dirty_fraction: float = 0.002
+) -> pd.DataFrame:
+    """
+    Generates a dataframe shaped like an extracted presupuesto file.
+
+    Args:
+        rows: number of rows
+        year: year of the dates
+        seed: random seed, the same seed gives the same rows
+        dirty_fraction: share of cells that are empty or unparseable
+
+    Returns:
+        A dataframe with the columns and string values of the presupuesto files.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp(f"{year}-01-01") + pd.to_timedelta(
+        rng.integers(0, 365, rows), unit="D"
+    )
+    dates = np.where(
+        rng.random(rows) < 0.5,
+        days.strftime("%Y/%m/%d"),
+        days.strftime("%d-%m-%Y"),
+    )
+    df = pd.DataFrame({"Date": _with_dirt(dates, rng, dirty_fraction)})
+    for column, (prefix, suffix) in AMOUNT_DECORATIONS.items():
+        amounts = rng.uniform(0, 1000, rows).round(2).astype(str)
+        df[column] = _with_dirt(
+            np.char.add(np.char.add(prefix, amounts), suffix), rng, dirty_fraction
+        )
+    gdp = rng.uniform(0, 10, rows).round(2).astype(str)
+    df["GDP Contribution"] = _with_dirt(np.char.add(gdp, "%"), rng, dirty_fraction)
+    df["Currency"] = np.array(CURRENCIES, dtype=object)[
+        rng.integers(0, len(CURRENCIES), rows)
+    ]
+    return df
+
+
+def write_financial_data_file(
+    file_path: str,
+    rows: int,
+    year: int = 2024,
+    seed: int = 0,
+    chunk_rows: int = 1_000_000,
+) -> None:
+    """Writes a synthetic presupuesto CSV file, generating it chunk by chunk."""
+    for chunk_number, start in enumerate(range(0, rows, chunk_rows)):
+        df = generate_financial_data(
+            rows=min(chunk_rows, rows - start), year=year, seed=seed + chunk_number
+        )
+        df.to_csv(
+            file_path, mode="w" if start == 0 else "a", header=start == 0, index=False
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_financial_data_file(
+        file_path=args.output, rows=args.rows, year=args.year, seed=args.seed
+    )
+    print(f"Wrote {args.rows:,} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import threading
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import BigInteger, Column, Date, Float, MetaData, String, Table
+from etl_project.assets.presupuesto_etl import add_row_hash
+from etl_project.connectors.postgresql import PostgreSqlClient
+
+# Transformed columns every row needs. Amounts that could not be parsed are
+# NaN after the transform, so they fail as missing.
+REQUIRED_COLUMNS = (
+    "CURRENCY",
+    "REVENUE",
+    "EXPENSES",
+    "TAX_INCOME",
+    "DEBT",
+    "GDP_CONTRIBUTION_PERCENTAGE",
+)
+NON_NEGATIVE_COLUMNS = ("REVENUE", "EXPENSES", "TAX_INCOME", "DEBT")
+GDP_CONTRIBUTION_RANGE = (0, 100)
+
+# Reason codes of the validation rules, in the order they are reported.
+VALIDATION_RULES = (
+    "invalid_date",
+    *[f"missing_{column.lower()}" for column in REQUIRED_COLUMNS],
+    *[f"negative_{column.lower()}" for column in NON_NEGATIVE_COLUMNS],
+    "gdp_contribution_out_of_range",
+)
+
+# Columns of the unique key of quarantined rows.
+ROW_KEY_COLUMNS = ("SOURCE_TABLE", "ROW_HASH")
+
+
+def get_rule_masks(df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Evaluates the validation rules on a transformed dataframe.
+
+    Returns:
+        reason code -> boolean array, True for the rows that fail the rule
+    """
+    masks = {"invalid_date": df["DATE"].isna().to_numpy()}
+    for column in REQUIRED_COLUMNS:
+        masks[f"missing_{column.lower()}"] = df[column].isna().to_numpy()
+    for column in NON_NEGATIVE_COLUMNS:
+        masks[f"negative_{column.lower()}"] = df[column].to_numpy() < 0
+    low, high = GDP_CONTRIBUTION_RANGE
+    gdp = df["GDP_CONTRIBUTION_PERCENTAGE"].to_numpy()
+    masks["gdp_contribution_out_of_range"] = (gdp < low) | (gdp > high)
+    return masks
+
+
+def validate_financial_data(
+    df: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame, dict[str, int]]:
+    """
+    Splits transformed rows into valid rows and rows that fail a validation rule.
+
+    Rules are evaluated as vectorized masks over whole columns. Reason codes
+    are only built for the failing rows, and a dataframe without failing rows
+    is returned as is.
+
+    Usage example:
+        df, quarantined, rule_counts = validate_financial_data(df)
+
+    Returns:
+        A tuple of the valid rows, the failing rows with a `REASON_CODES`
+        column of comma separated `VALIDATION_RULES` codes, and the number of
+        rows failing each rule.
+    """
+    masks = get_rule_masks(df)
+    rule_counts = {code: int(np.count_nonzero(mask)) for code, mask in masks.items()}
+    failed = np.logical_or.reduce(list(masks.values()))
+    if not failed.any():
+        return df, df.iloc[:0].assign(REASON_CODES=pd.Series(dtype=object)), rule_counts
+
+    reason_codes = np.full(np.count_nonzero(failed), "", dtype=object)
+    for code, mask in masks.items():
+        failed_rule = mask[failed]
+        if failed_rule.any():
+            reason_codes[failed_rule] += f"{code},"
+    quarantined = df[failed].assign(
+        REASON_CODES=pd.Series(reason_codes).str[:-1].to_numpy()
+    )
+    return df[~failed], quarantined, rule_counts
+
+
+class RowQuarantine:
+    """
+    Validates transformed rows before they are loaded, and keeps the rows
+    that fail a rule in a quarantine table.
+
+    Quarantined rows are stored with their target table, reason codes and
+    the time they were last quarantined, keyed by target table and
+    `ROW_HASH`, so a row that fails again on the next run is updated rather
+    than appended. The rows failing each rule are counted across the calls
+    in `rule_counts`.
+
+    Usage example:
+        quarantine = RowQuarantine(postgresql_client)
+        df = quarantine.validate(df, source_table=table.name)
+        load(df=df, ...)
+    """
+
+    def __init__(
+        self,
+        postgresql_client: PostgreSqlClient,
+        quarantine_table_name: str = "presupuesto_financials_quarantine",
+    ):
+        self.postgresql_client = postgresql_client
+        self.metadata = MetaData()
+        self.table = Table(
+            quarantine_table_name,
+            self.metadata,
+            Column("id", BigInteger, primary_key=True, autoincrement=True),
+            Column("SOURCE_TABLE", String),
+            Column("REASON_CODES", String),
+            Column("QUARANTINED_AT", String),
+            Column("DATE", Date),
+            Column("CURRENCY", String),
+            Column("REVENUE", Float),
+            Column("EXPENSES", Float),
+            Column("TAX_INCOME", Float),
+            Column("DEBT", Float),
+            Column("GDP_CONTRIBUTION_PERCENTAGE", Float),
+            Column("QUARTER", String),
+            Column("ROW_HASH", BigInteger),
+        )
+        self._create_quarantine_table()
+        self.rule_counts = Counter({code: 0 for code in VALIDATION_RULES})
+        self.rows_quarantined = 0
+        self._lock = threading.Lock()
+
+    def _create_quarantine_table(self) -> None:
+        """
+        Create the quarantine table if it does not exist, and add the
+        `ROW_HASH` column and the unique index on the row key to a table
+        created before rows were keyed.
+        """
+        self.postgresql_client.create_table(metadata=self.metadata)
+        self.postgresql_client.add_missing_columns(table=self.table)
+        preparer = self.postgresql_client.engine.dialect.identifier_preparer
+        self.postgresql_client.engine.execute(
+            "create unique index if not exists "
+            f"{preparer.quote(f'{self.table.name}_row_key')} "
+            f"on {preparer.format_table(self.table)} "
+            f"({', '.join(preparer.quote(column) for column in ROW_KEY_COLUMNS)})"
+        )
+
+    def validate(self, df: pd.DataFrame, source_table: str) -> pd.DataFrame:
+        """
+        Quarantines the rows of `df` that fail a validation rule.
+
+        Returns:
+            The valid rows
+        """
+        df, quarantined, rule_counts = validate_financial_data(df)
+        if len(quarantined):
+            self.postgresql_client.staged_upsert(
+                data=add_row_hash(
+                    quarantined.assign(
+                        SOURCE_TABLE=source_table,
+                        QUARANTINED_AT=datetime.now().isoformat(),
+                    )
+                ).drop_duplicates(subset=ROW_KEY_COLUMNS),
+                table=self.table,
+                metadata=self.metadata,
+                key_columns=list(ROW_KEY_COLUMNS),
+            )
+        with self._lock:
+            self.rule_counts.update(rule_counts)
+            self.rows_quarantined += len(quarantined)
+        return df
+
+    def describe(self) -> str:
+        """Describes the quarantined rows and the rules they failed, for run logs."""
+        failed_rules = ", ".join(
+            f"{code}: {count}" for code, count in self.rule_counts.items() if count
+        )
+        return f"Rows quarantined: {self.rows_quarantined}" + (
+            f" ({failed_rules})" if failed_rules else ""
+        )
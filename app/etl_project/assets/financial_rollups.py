@@ -0,0 +1,260 @@
+import pandas as pd
+from sqlalchemy import BigInteger, Column, Float, MetaData, String, Table
+from sqlalchemy import select, func
+from etl_project.connectors.postgresql import PostgreSqlClient
+
+# Period of each row's `DATE`, in the format of the `QUARTER` column for quarters.
+ROLLUP_PERIODS = {"quarter": 'YYYY"Q"Q', "month": "YYYY-MM"}
+
+# Columns summed per period. GDP_CONTRIBUTION_PERCENTAGE is averaged instead,
+# from its sum and count of non-null values.
+ROLLUP_SUM_COLUMNS = ("REVENUE", "EXPENSES", "TAX_INCOME", "DEBT")
+ROLLUP_AVERAGE_COLUMNS = ("GDP_CONTRIBUTION_PERCENTAGE",)
+
+_ROLLUP_KEY_COLUMNS = ("SOURCE_TABLE", "PERIOD_TYPE", "PERIOD")
+# temp table of the deltas staged by the upserts of a transaction
+_DELTA_TABLE_NAME = "financials_rollup_deltas"
+
+
+class FinancialsRollup:
+    """
+    Maintains per period aggregates of the financials tables, so they do not
+    have to be recomputed from the daily rows.
+
+    Each period of a source table has one row with its `ROW_COUNT`, the sums
+    of `ROLLUP_SUM_COLUMNS`, and the sum and non-null count of
+    `ROLLUP_AVERAGE_COLUMNS`. Upserts update the rollup incrementally, in the
+    same transaction as the rows, with the difference between the upserted
+    rows and the rows they replace. Other load methods rebuild the rollup of
+    the table with `refresh`, as does the first upsert into a table without
+    rollup rows for every period type, e.g. one loaded before rollups were
+    enabled. Call `refresh` after changing a table without the rollup. NaN
+    amounts are left out of the aggregates, like missing ones.
+
+    Usage example:
+        rollup = FinancialsRollup(postgresql_client, periods=["quarter", "month"])
+        load(df=df, ..., load_method="upsert", rollup=rollup)
+        rollup.read(source_table="Nuevo_Leon_Financials_2024")
+    """
+
+    def __init__(
+        self,
+        postgresql_client: PostgreSqlClient,
+        periods: list[str] = ("quarter",),
+        rollup_table_name: str = "presupuesto_financials_rollup",
+    ):
+        unsupported_periods = set(periods) - set(ROLLUP_PERIODS)
+        if unsupported_periods or not periods:
+            raise Exception(
+                f"Rollup periods {sorted(unsupported_periods)} are not supported, "
+                "use 'quarter' and/or 'month'"
+            )
+        self.postgresql_client = postgresql_client
+        self.periods = list(periods)
+        self._initialized_tables = set()
+        self.metadata = MetaData()
+        self.table = Table(
+            rollup_table_name,
+            self.metadata,
+            Column("SOURCE_TABLE", String, primary_key=True),
+            Column("PERIOD_TYPE", String, primary_key=True),
+            Column("PERIOD", String, primary_key=True),
+            Column("ROW_COUNT", BigInteger),
+            *[Column(column, Float) for column in ROLLUP_SUM_COLUMNS],
+            *[Column(f"{column}_SUM", Float) for column in ROLLUP_AVERAGE_COLUMNS],
+            *[
+                Column(f"{column}_COUNT", BigInteger)
+                for column in ROLLUP_AVERAGE_COLUMNS
+            ],
+        )
+        self.postgresql_client.ensure_tables(self.metadata)
+        self._preparer = self.postgresql_client.engine.dialect.identifier_preparer
+        self._quote = self._preparer.quote
+        self._rollup_name = self._preparer.format_table(self.table)
+        self._value_columns = [
+            column.name
+            for column in self.table.columns
+            if column.name not in _ROLLUP_KEY_COLUMNS
+        ]
+        self._column_list = ", ".join(
+            self._quote(column.name) for column in self.table.columns
+        )
+
+    def _select_aggregates(self, new: str, old: str = None) -> list[str]:
+        """
+        Returns the aggregate expressions of the value columns, over the rows
+        aliased `new` minus the rows aliased `old` they replace.
+        """
+        q = self._quote
+
+        # NaN amounts are missing values, like NULL
+        def value(alias: str, column: str) -> str:
+            return f"COALESCE(NULLIF({alias}.{q(column)}, 'NaN'), 0)"
+
+        def is_present(alias: str, column: str) -> str:
+            return f"(NULLIF({alias}.{q(column)}, 'NaN') IS NOT NULL)::int"
+
+        if old is None:
+            expressions = ["COUNT(*)"]
+            expressions += [f"SUM({value(new, c)})" for c in ROLLUP_SUM_COLUMNS]
+            expressions += [f"SUM({value(new, c)})" for c in ROLLUP_AVERAGE_COLUMNS]
+            expressions += [
+                f"SUM({is_present(new, c)})" for c in ROLLUP_AVERAGE_COLUMNS
+            ]
+            return expressions
+        expressions = [f"SUM(CASE WHEN {old}.{q('DATE')} IS NULL THEN 1 ELSE 0 END)"]
+        expressions += [
+            f"SUM({value(new, c)} - {value(old, c)})"
+            for c in ROLLUP_SUM_COLUMNS + ROLLUP_AVERAGE_COLUMNS
+        ]
+        expressions += [
+            f"SUM({is_present(new, c)} - {is_present(old, c)})"
+            for c in ROLLUP_AVERAGE_COLUMNS
+        ]
+        return expressions
+
+    def initialize(self, table: Table) -> None:
+        """
+        Refreshes the rollup of a table that has no rollup rows for some of
+        the period types. Checked once per table.
+        """
+        if table.name in self._initialized_tables:
+            return
+        self.postgresql_client.ensure_tables(table.metadata)
+        with self.postgresql_client.engine.connect() as connection:
+            period_types = connection.execute(
+                select(self.table.c.PERIOD_TYPE)
+                .where(self.table.c.SOURCE_TABLE == table.name)
+                .distinct()
+            ).scalars()
+            missing_periods = set(self.periods) - set(period_types)
+        if missing_periods:
+            self.refresh(table)
+        self._initialized_tables.add(table.name)
+
+    def _create_delta_table(self, cursor) -> None:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {_DELTA_TABLE_NAME} "
+            f"(LIKE {self._rollup_name}) ON COMMIT DROP"
+        )
+
+    def stage_deltas(
+        self, cursor, staging_name: str, target_name: str, source_table: str
+    ) -> None:
+        """
+        Stages the rollup deltas of a batch about to be merged, for the
+        `before_merge` hook of `PostgreSqlClient.staged_upsert`.
+
+        Args:
+            cursor: cursor of the upsert's transaction
+            staging_name: quoted name of the table of staged rows
+            target_name: quoted name of the table the rows are merged into,
+                which can be a partition of `source_table`
+            source_table: name of the table the rollup rows are kept for
+        """
+        self._create_delta_table(cursor)
+        for period_type in self.periods:
+            cursor.execute(
+                f"INSERT INTO {_DELTA_TABLE_NAME} ({self._column_list}) "
+                f"SELECT %s, %s, to_char(new.{self._quote('DATE')}, %s), "
+                + ", ".join(self._select_aggregates("new", "old"))
+                + f" FROM {staging_name} AS new LEFT JOIN {target_name} AS old "
+                f"ON old.{self._quote('DATE')} = new.{self._quote('DATE')} "
+                "GROUP BY 3",
+                (source_table, period_type, ROLLUP_PERIODS[period_type]),
+            )
+
+    def apply_staged_deltas(self, cursor) -> None:
+        """
+        Adds the staged deltas to the rollup, for the `before_commit` hook of
+        `PostgreSqlClient.staged_upsert`. Rollup rows are only locked from
+        here to the commit, so parallel partition loads do not wait on each
+        other.
+        """
+        self._create_delta_table(cursor)
+        q = self._quote
+        key_list = ", ".join(q(column) for column in _ROLLUP_KEY_COLUMNS)
+        cursor.execute(
+            f"INSERT INTO {self._rollup_name} ({self._column_list}) "
+            f"SELECT {key_list}, "
+            + ", ".join(f"SUM({q(column)})" for column in self._value_columns)
+            + f" FROM {_DELTA_TABLE_NAME} GROUP BY {key_list} "
+            f"ON CONFLICT ({key_list}) DO UPDATE SET "
+            + ", ".join(
+                f"{q(column)} = {self._rollup_name}.{q(column)} "
+                f"+ EXCLUDED.{q(column)}"
+                for column in self._value_columns
+            )
+        )
+        cursor.execute(f"TRUNCATE {_DELTA_TABLE_NAME}")
+
+    def refresh(self, table: Table) -> None:
+        """Recomputes the rollup rows of a table from all of its rows."""
+        q = self._quote
+        source_name = self._preparer.format_table(table)
+        connection = self.postgresql_client.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                f"DELETE FROM {self._rollup_name} WHERE {q('SOURCE_TABLE')} = %s",
+                (table.name,),
+            )
+            for period_type in self.periods:
+                cursor.execute(
+                    f"INSERT INTO {self._rollup_name} ({self._column_list}) "
+                    f"SELECT %s, %s, to_char(new.{q('DATE')}, %s), "
+                    + ", ".join(self._select_aggregates("new"))
+                    + f" FROM {source_name} AS new GROUP BY 3",
+                    (table.name, period_type, ROLLUP_PERIODS[period_type]),
+                )
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def read(
+        self,
+        source_table: str = None,
+        period_type: str = "quarter",
+        periods: list[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads the precomputed aggregates.
+
+        Usage example:
+            rollup.read("Nuevo_Leon_Financials_2024", periods=["2024Q1", "2024Q2"])
+
+        Args:
+            source_table: table to read the aggregates of, or None for every table
+            period_type: "quarter" or "month"
+            periods: periods to read, e.g. "2024Q1" or "2024-01". None for all.
+
+        Returns:
+            A dataframe with one row per source table and period: `ROW_COUNT`,
+            the sums of `ROLLUP_SUM_COLUMNS` and the averages of
+            `ROLLUP_AVERAGE_COLUMNS`, e.g. `AVG_GDP_CONTRIBUTION_PERCENTAGE`.
+        """
+        columns = self.table.c
+        statement = select(
+            columns.SOURCE_TABLE,
+            columns.PERIOD,
+            columns.ROW_COUNT,
+            *[columns[column] for column in ROLLUP_SUM_COLUMNS],
+            *[
+                (
+                    columns[f"{column}_SUM"]
+                    / func.nullif(columns[f"{column}_COUNT"], 0)
+                ).label(f"AVG_{column}")
+                for column in ROLLUP_AVERAGE_COLUMNS
+            ],
+        ).where(columns.PERIOD_TYPE == period_type)
+        if source_table is not None:
+            statement = statement.where(columns.SOURCE_TABLE == source_table)
+        if periods is not None:
+            statement = statement.where(columns.PERIOD.in_(periods))
+        statement = statement.order_by(columns.SOURCE_TABLE, columns.PERIOD)
+        with self.postgresql_client.engine.connect() as connection:
+            result = connection.execute(statement)
+            return pd.DataFrame(result.all(), columns=list(result.keys()))
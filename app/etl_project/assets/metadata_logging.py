@@ -1,7 +1,21 @@
+import atexit
+import logging
+import queue
+import threading
 from etl_project.connectors.postgresql import PostgreSqlClient
 from datetime import datetime, timezone
-from sqlalchemy import Table, Column, Integer, String, MetaData, JSON
-from sqlalchemy import insert, select, func
+from sqlalchemy import Table, Column, Integer, String, MetaData, JSON, Sequence
+from sqlalchemy import insert, select, text
+
+_STOP = object()
+
+
+class _FlushRequest:
+    """A flush waiting for the rows queued before it to be written."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.written = False
 
 
 class MetaDataLoggingStatus:
@@ -12,19 +26,31 @@ class MetaDataLoggingStatus:
     RUN_FAILURE = "fail"
 
 
-class MetaDataLogging:
+class MetaDataLogWriter:
+    """
+    Writes metadata log rows to a database from a background thread.
+
+    Rows are queued by `MetaDataLogging.log` and inserted in batches on a
+    connection dedicated to the writer, so a slow logging database does not
+    delay pipeline runs. Rows that fail to insert are kept and retried on the
+    next flush. Queued rows are flushed when the process exits.
+    """
+
     def __init__(
         self,
-        pipeline_name: str,
         postgresql_client: PostgreSqlClient,
-        config: dict = {},
         log_table_name: str = "presupuesto_pipeline_logs",
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
     ):
-        self.pipeline_name = pipeline_name
-        self.log_table_name = log_table_name
         self.postgresql_client = postgresql_client
-        self.config = config
+        self.log_table_name = log_table_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
         self.metadata = MetaData()
+        self.run_id_sequence = Sequence(
+            f"{log_table_name}_run_id_seq", metadata=self.metadata
+        )
         self.table = Table(
             self.log_table_name,
             self.metadata,
@@ -34,41 +60,209 @@ class MetaDataLogging:
             Column("status", String, primary_key=True),
             Column("config", JSON),
             Column("logs", String),
+            Column("run_stats", JSON),
+        )
+        self._create_log_table()
+        self._queue = queue.Queue()
+        self._connection = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"{log_table_name}_writer", daemon=True
         )
-        self.run_id: int = self._get_run_id()
+        self._thread.start()
+        atexit.register(self.close)
 
     def _create_log_table(self) -> None:
-        """Create log table if it does not exist."""
+        """
+        Create log table and run id sequence if they do not exist, and add
+        columns added since. The sequence is moved past run ids written before
+        it existed.
+        """
         self.postgresql_client.create_table(metadata=self.metadata)
+        self.postgresql_client.add_missing_columns(table=self.table)
+        preparer = self.postgresql_client.engine.dialect.identifier_preparer
+        table_name = preparer.format_table(self.table)
+        sequence_name = preparer.format_sequence(self.run_id_sequence)
+        self.postgresql_client.engine.execute(
+            text(
+                f"select setval('{sequence_name}', max_run_id) "
+                f"from (select max(run_id) as max_run_id from {table_name}) as runs "
+                f"where max_run_id > (select last_value from {sequence_name})"
+            )
+        )
 
-    def _get_run_id(self):
-        """Gets the next run id. Sets run id to 1 if no run id exists."""
-        self._create_log_table()
-        run_id = self.postgresql_client.engine.execute(
-            select(func.max(self.table.c.run_id)).where(
-                self.table.c.pipeline_name == self.pipeline_name
+    def next_run_id(self, connection) -> int:
+        """Gets the next run id from the run id sequence."""
+        return connection.execute(select(self.run_id_sequence.next_value())).scalar()
+
+    def write(self, run: "MetaDataLogging", row: dict) -> None:
+        """Queues a log row of a run to be written."""
+        self._queue.put((run, row))
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until the rows queued before this call are written.
+
+        Returns:
+            False if the rows were not written within `timeout` seconds, or
+            failed to be written
+        """
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout) and request.written
+
+    def close(self) -> None:
+        """Writes the queued rows and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        pending = []
+        stopping = False
+        while not stopping:
+            waiters = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            # take everything already queued, up to one batch of rows
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                else:
+                    pending.append(item)
+                if len(pending) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            if pending:
+                pending = self._write_rows(pending)
+            for waiter in waiters:
+                # the rows queued before a flush are in this batch
+                waiter.written = not pending
+                waiter.done.set()
+        if pending:
+            logging.getLogger(__name__).error(
+                f"Dropped {len(pending)} metadata log rows for "
+                f"{self.log_table_name} that could not be written"
             )
-        ).first()[0]
-        if run_id is None:
-            return 1
-        else:
-            return run_id + 1
+        if self._connection is not None:
+            self._connection.close()
+
+    def _write_rows(self, rows: list[tuple]) -> list[tuple]:
+        """
+        Inserts a batch of queued rows in one statement.
+
+        Returns:
+            The rows that could not be written
+        """
+        try:
+            if self._connection is None:
+                self._connection = self.postgresql_client.engine.connect()
+            with self._connection.begin():
+                self._connection.execute(
+                    insert(self.table),
+                    [
+                        dict(row, run_id=run.assign_run_id(self._connection))
+                        for run, row in rows
+                    ],
+                )
+            return []
+        except Exception as e:
+            logging.getLogger(__name__).error(
+                f"Failed to write metadata log rows to {self.log_table_name}, "
+                f"retrying on the next flush: {e}"
+            )
+            if self._connection is not None:
+                self._connection.invalidate()
+                self._connection = None
+            return rows
+
+
+_log_writers: dict[tuple, MetaDataLogWriter] = {}
+_log_writers_lock = threading.Lock()
+
+
+def get_log_writer(
+    postgresql_client: PostgreSqlClient,
+    log_table_name: str = "presupuesto_pipeline_logs",
+) -> MetaDataLogWriter:
+    """Returns the process-wide log writer for a database and log table."""
+    key = (postgresql_client.engine, log_table_name)
+    with _log_writers_lock:
+        if key not in _log_writers:
+            _log_writers[key] = MetaDataLogWriter(
+                postgresql_client=postgresql_client, log_table_name=log_table_name
+            )
+        return _log_writers[key]
+
+
+class MetaDataLogging:
+    def __init__(
+        self,
+        pipeline_name: str,
+        postgresql_client: PostgreSqlClient,
+        config: dict = {},
+        log_table_name: str = "presupuesto_pipeline_logs",
+    ):
+        self.pipeline_name = pipeline_name
+        self.log_table_name = log_table_name
+        self.postgresql_client = postgresql_client
+        self.config = config
+        self.writer = get_log_writer(
+            postgresql_client=postgresql_client, log_table_name=log_table_name
+        )
+        self.table = self.writer.table
+        # taken from the run id sequence when the first row is written
+        self._run_id = None
+        self._run_id_lock = threading.Lock()
+
+    def assign_run_id(self, connection) -> int:
+        """Gets the run id, taking the next one from the sequence on first use."""
+        with self._run_id_lock:
+            if self._run_id is None:
+                self._run_id = self.writer.next_run_id(connection)
+            return self._run_id
+
+    @property
+    def run_id(self) -> int:
+        return self.assign_run_id(self.postgresql_client.engine)
 
     def log(
         self,
         status: MetaDataLoggingStatus = MetaDataLoggingStatus.RUN_START,
         timestamp: datetime = None,
         logs: str = None,
+        run_stats: dict = None,
     ) -> None:
-        """Writes pipeline metadata log to a database"""
+        """Queues a pipeline metadata log to be written to a database"""
         if timestamp is None:
             timestamp = datetime.now()
-        insert_statement = insert(self.table).values(
-            pipeline_name=self.pipeline_name,
-            timestamp=timestamp,
-            run_id=self.run_id,
-            status=status,
-            config=self.config,
-            logs=logs,
+        self.writer.write(
+            run=self,
+            row=dict(
+                pipeline_name=self.pipeline_name,
+                timestamp=str(timestamp),
+                status=status,
+                config=self.config,
+                logs=logs,
+                run_stats=run_stats,
+            ),
         )
-        self.postgresql_client.engine.execute(insert_statement)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until the logs queued so far are written to the database.
+
+        Returns:
+            False if the logs were not written within `timeout` seconds, or
+            failed to be written
+        """
+        return self.writer.flush(timeout=timeout)
@@ -0,0 +1,286 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+import pandas as pd
+import pyarrow as pa
+from etl_project.assets.presupuesto_etl import (
+    DATE_FORMATS,
+    extract_financial_data,
+    get_financial_data_file_path,
+    transform_financial_data,
+)
+from etl_project.assets.stage_metrics import StageMetrics
+from etl_project.assets.transform_cache import TransformCache, arrow_to_dataframe
+
+
+class _MessageListHandler(logging.Handler):
+    """Keeps the levels and messages of a worker's log records."""
+
+    def __init__(self):
+        super().__init__(level=logging.INFO)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append((record.levelno, record.getMessage()))
+
+
+def to_columnar_payload(df: pd.DataFrame) -> bytes:
+    """Serializes a dataframe as an Arrow IPC stream, column by column."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_columnar_payload(payload: bytes) -> pd.DataFrame:
+    """Deserializes a dataframe written by `to_columnar_payload`."""
+    return arrow_to_dataframe(pa.ipc.open_stream(payload).read_all())
+
+
+def transform_quarter(
+    year: int,
+    quarter: str,
+    date_formats: tuple = DATE_FORMATS,
+    logger: logging.Logger = None,
+    transform_cache: TransformCache = None,
+    stage_metrics: StageMetrics = None,
+    csv_engine: str = "pandas",
+) -> pd.DataFrame:
+    """
+    Extracts and transforms one quarter file, through the transform cache if
+    one is given. The extract and transform stages, and the read from the
+    cache, which finds no rows on a miss, are measured in `stage_metrics`.
+    `csv_engine` is the CSV reader of `extract_financial_data`.
+    """
+    stage_metrics = stage_metrics or StageMetrics()
+    file_path = get_financial_data_file_path(year=year, quarter=quarter)
+
+    def extract_transform() -> pd.DataFrame:
+        bytes_read = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        with stage_metrics.measure("extract", bytes_read=bytes_read) as stage:
+            df = extract_financial_data(
+                year=year, quarter=quarter, csv_engine=csv_engine
+            )
+            stage.rows_out = 0 if df is None else len(df)
+        with stage_metrics.measure("transform", rows_in=stage.rows_out) as stage:
+            df = transform_financial_data(
+                df=df, date_formats=date_formats, logger=logger
+            )
+            stage.set_output(df)
+        return df
+
+    if transform_cache is None:
+        return extract_transform()
+    # the cache is read and written here rather than in `get_or_create`, so
+    # the read is measured on its own and not around the extract and transform
+    cache_path = transform_cache.get_cache_path(
+        file_path=file_path, date_formats=date_formats
+    )
+    with stage_metrics.measure("transform_cache_read") as stage:
+        df = transform_cache.get(cache_path)
+        stage.rows_out = 0 if df is None else len(df)
+    if df is not None:
+        (logger or logging.getLogger(__name__)).info(
+            f"Read transformed {Path(file_path).name} from cache"
+        )
+        return df
+    df = extract_transform()
+    transform_cache.put(cache_path, df)
+    return df
+
+
+def _extract_transform_quarter(
+    year: int,
+    quarter: str,
+    date_formats: tuple,
+    transform_cache: TransformCache = None,
+    csv_engine: str = "pandas",
+) -> tuple[bytes, list[tuple[int, str]], dict]:
+    """
+    Extracts and transforms one quarter file inside a worker process. Its
+    arguments are pickled, so it takes no loggers or clients.
+    """
+    worker_logger = logging.getLogger(f"{__name__}.worker")
+    worker_logger.setLevel(logging.INFO)
+    worker_logger.propagate = False
+    handler = _MessageListHandler()
+    worker_logger.addHandler(handler)
+    stage_metrics = StageMetrics()
+    try:
+        df = transform_quarter(
+            year=year,
+            quarter=quarter,
+            date_formats=date_formats,
+            logger=worker_logger,
+            transform_cache=transform_cache,
+            stage_metrics=stage_metrics,
+            csv_engine=csv_engine,
+        )
+    finally:
+        worker_logger.removeHandler(handler)
+    return to_columnar_payload(df), handler.messages, stage_metrics.to_dict()
+
+
+def extract_transform_quarters(
+    year_quarters: list[tuple[int, str]],
+    date_formats: tuple = DATE_FORMATS,
+    workers: int = 1,
+    logger: logging.Logger = None,
+    transform_cache: TransformCache = None,
+    stage_metrics: StageMetrics = None,
+    csv_engine: str = "pandas",
+) -> Iterator[tuple[int, str, pd.DataFrame]]:
+    """
+    Extracts and transforms quarter files, optionally in a process pool.
+
+    With more than one worker, each quarter is extracted and transformed in a
+    separate spawned process and sent back as an Arrow IPC payload. Results are
+    yielded in the order of `year_quarters` either way, and are the same as
+    running `extract_financial_data` and `transform_financial_data` serially.
+
+    Usage example:
+        for year, quarter, df in extract_transform_quarters(
+            [(2024, "Q1"), (2024, "Q2")], workers=4
+        ):
+            ...
+
+    Args:
+        year_quarters: The (year, quarter) pairs to process.
+        date_formats: The formats used to parse the `Date` column, in order.
+        workers: The number of worker processes. 1 runs in the calling process.
+        logger: Logger that receives the transform warnings of every quarter.
+        transform_cache: Cache of transformed quarters to read from and write
+            to. Files past its size limit are evicted once all quarters are
+            done.
+        stage_metrics: Collects the extract and transform metrics of every
+            quarter, including those measured in worker processes.
+        csv_engine: "pandas" or "pyarrow", the reader of the CSV files.
+
+    Returns:
+        An iterator of (year, quarter, transformed dataframe) tuples.
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    if workers <= 1 or len(year_quarters) <= 1:
+        for year, quarter in year_quarters:
+            df = transform_quarter(
+                year=year,
+                quarter=quarter,
+                date_formats=date_formats,
+                logger=logger,
+                transform_cache=transform_cache,
+                stage_metrics=stage_metrics,
+                csv_engine=csv_engine,
+            )
+            yield year, quarter, df
+        if transform_cache is not None:
+            transform_cache.evict()
+        return
+
+    # forking would copy the locks held by the caller's threads, such as the
+    # overlap loader thread and the database engine pool, into the workers
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(year_quarters)),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    try:
+        results = executor.map(
+            _extract_transform_quarter,
+            [year for year, _ in year_quarters],
+            [quarter for _, quarter in year_quarters],
+            [tuple(date_formats)] * len(year_quarters),
+            [transform_cache] * len(year_quarters),
+            [csv_engine] * len(year_quarters),
+        )
+        for (year, quarter), (payload, messages, stages) in zip(year_quarters, results):
+            for level, message in messages:
+                logger.log(level, f"{year} {quarter}: {message}")
+            if stage_metrics is not None:
+                stage_metrics.merge(stages)
+            yield year, quarter, from_columnar_payload(payload)
+        if transform_cache is not None:
+            transform_cache.evict()
+    finally:
+        # quarters not started yet are dropped if the caller stops early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def run_overlapped(
+    batches: Iterable, load_batch: Callable, queue_size: int = 2
+) -> None:
+    """
+    Loads batches on a loader thread while the next batches are produced.
+
+    The calling thread consumes `batches`, so extraction and transformation
+    run while the loader thread waits on the database. At most `queue_size`
+    produced batches wait to be loaded, so a slow database holds back the
+    producer instead of filling memory.
+
+    If `load_batch` raises, no further batches are produced or loaded and the
+    error is raised in the calling thread. If producing a batch raises, the
+    loader stops after the batch it is loading.
+
+    Usage example:
+        run_overlapped(
+            batches=(transform(df) for df in extract()),
+            load_batch=lambda df: load(df=df, ...),
+        )
+
+    Args:
+        batches: The batches to load, typically a generator doing the CPU work.
+        load_batch: Function called with each batch on the loader thread.
+        queue_size: The maximum number of batches waiting to be loaded.
+    """
+    batch_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+    errors = []
+
+    def loader():
+        while True:
+            batch = batch_queue.get()
+            if batch is done or stop.is_set():
+                return
+            try:
+                load_batch(batch)
+            except BaseException as error:
+                errors.append(error)
+                stop.set()
+                return
+
+    loader_thread = threading.Thread(target=loader, name="loader", daemon=True)
+    loader_thread.start()
+
+    def put(item) -> bool:
+        """Queues an item, giving up if the loader has stopped."""
+        while loader_thread.is_alive():
+            if stop.is_set() and item is not done:
+                return False
+            try:
+                batch_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for batch in batches:
+            if not put(batch):
+                break
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        close = getattr(batches, "close", None)
+        if close is not None:
+            close()
+        put(done)
+        loader_thread.join()
+    if errors:
+        raise errors[0]
@@ -1,29 +1,143 @@
+import json
 import logging
 import time
+from collections import deque
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each log record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the most recent formatted log lines in memory, up to `max_chars`.
+
+    When the cap is reached the oldest lines are dropped, and `get_value`
+    starts with a marker saying how many lines were dropped.
+    """
+
+    def __init__(self, max_chars: int = 1_000_000, level: int = logging.NOTSET):
+        super().__init__(level=level)
+        self.max_chars = max_chars
+        self._lines = deque()
+        self._chars = 0
+        self._dropped_lines = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record)[: self.max_chars] + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+        self._lines.append(line)
+        self._chars += len(line)
+        while self._chars > self.max_chars:
+            self._chars -= len(self._lines.popleft())
+            self._dropped_lines += 1
+
+    def get_value(self) -> str:
+        self.acquire()
+        try:
+            lines = "".join(self._lines)
+            if self._dropped_lines:
+                return f"... {self._dropped_lines} earlier log lines truncated ...\n{lines}"
+            return lines
+        finally:
+            self.release()
+
+    def clear(self) -> None:
+        self.acquire()
+        try:
+            self._lines.clear()
+            self._chars = 0
+            self._dropped_lines = 0
+        finally:
+            self.release()
 
 
 class PipelineLogging:
-    def __init__(self, pipeline_name: str, log_folder_path: str):
+    """
+    Sets up the logger of a pipeline run and captures its logs.
+
+    With `capture="file"` each run logs to a new timestamped file under
+    `log_folder_path`. With `capture="memory"` logs are kept in a bounded ring
+    buffer of `max_log_chars` characters. `log_format="json"` writes JSON lines
+    instead of plain text. Call `close` at the end of the run to detach the
+    handlers.
+
+    Each run logs through its own logger named after the pipeline, so runs
+    of the same pipeline in flight at once capture only their own logs.
+    Records also propagate to the handlers of `logging.getLogger(pipeline_name)`.
+    """
+
+    def __init__(
+        self,
+        pipeline_name: str,
+        log_folder_path: str,
+        capture: str = "file",
+        log_format: str = "text",
+        max_log_chars: int = 1_000_000,
+    ):
         self.pipeline_name = pipeline_name
         self.log_folder_path = log_folder_path
-        logger = logging.getLogger(pipeline_name)
-        logger.setLevel(logging.INFO)
-        self.file_path = (
-            f"{self.log_folder_path}/{self.pipeline_name}_{time.time()}.log"
-        )
-        file_handler = logging.FileHandler(self.file_path)
-        file_handler.setLevel(logging.INFO)
-        stream_handler = logging.StreamHandler()
-        stream_handler.setLevel(logging.INFO)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        file_handler.setFormatter(formatter)
-        stream_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        logger.addHandler(stream_handler)
+        self.capture = capture
+        # not registered with the logging module, so it is freed with the run
+        logger = logging.Logger(pipeline_name, level=logging.INFO)
+        logger.parent = logging.getLogger(pipeline_name)
+        if log_format == "json":
+            formatter = JsonLinesFormatter()
+        elif log_format == "text":
+            formatter = logging.Formatter(LOG_FORMAT)
+        else:
+            raise Exception(
+                f"Log format {log_format} is not supported, use 'text' or 'json'"
+            )
+
+        if capture == "memory":
+            self.file_path = None
+            self._buffer_handler = RingBufferHandler(max_chars=max_log_chars)
+            self._handlers = [self._buffer_handler, logging.StreamHandler()]
+        elif capture == "file":
+            self.file_path = (
+                f"{self.log_folder_path}/{self.pipeline_name}_{time.time()}.log"
+            )
+            self._buffer_handler = None
+            self._handlers = [
+                logging.FileHandler(self.file_path),
+                logging.StreamHandler(),
+            ]
+        else:
+            raise Exception(
+                f"Log capture {capture} is not supported, use 'file' or 'memory'"
+            )
+
+        for handler in self._handlers:
+            handler.setLevel(logging.INFO)
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
         self.logger = logger
 
     def get_logs(self) -> str:
+        if self._buffer_handler is not None:
+            return self._buffer_handler.get_value()
         with open(self.file_path, "r") as file:
             return "".join(file.readlines())
+
+    def close(self) -> None:
+        """Detaches the run's handlers from its logger and closes them."""
+        for handler in self._handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
@@ -1,12 +1,363 @@
+import datetime
+import functools
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+import numpy as np
 import pandas as pd
-from sqlalchemy import MetaData, Table
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from pandas.api.types import union_categoricals
+from sqlalchemy import BigInteger, Column, Date, Float, MetaData, String, Table
+from sqlalchemy import select
 import os
+from etl_project.assets.financial_rollups import FinancialsRollup
 from etl_project.connectors.postgresql import PostgreSqlClient
 
+# Version of the output of transform_financial_data. Bump it whenever the
+# transform changes, so cached transformed files are not reused.
+TRANSFORM_VERSION = 3
 
-def extract_financial_data(year: int, quarter: str) -> pd.DataFrame:
+# Presupuesto file names, e.g. Nuevo_Leon_Financials_2024_Q1_daily.csv, and
+# the supported extensions in order of preference.
+FINANCIAL_DATA_FILE_PATTERN = re.compile(
+    r"^Nuevo_Leon_Financials_(\d{4})_(Q[1-4])_daily\.(csv|xlsx)$"
+)
+FINANCIAL_DATA_EXTENSIONS = (".csv", ".xlsx")
+
+# Columns of the presupuesto files. The pyarrow reader reads only these, as
+# strings, and the transform cleans them.
+FINANCIAL_DATA_COLUMNS = (
+    "Date",
+    "Revenue",
+    "Expenses",
+    "Tax Income",
+    "Debt",
+    "GDP Contribution",
+    "Currency",
+)
+FINANCIAL_DATA_SCHEMA = pa.schema(
+    [(column, pa.string()) for column in FINANCIAL_DATA_COLUMNS]
+)
+# Values read as missing by the pyarrow reader, the defaults of pd.read_csv.
+CSV_NULL_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+CSV_ENGINES = ("pandas", "pyarrow")
+
+# Date formats found in the presupuesto files, tried in order.
+DATE_FORMATS = ("%Y/%m/%d", "%d-%m-%Y")
+
+# Amount columns that arrive as strings decorated with currency tokens, and
+# thousands separators in groups of three digits, e.g. "1,619.40 MEX$".
+NUMERIC_COLUMNS = ("Revenue", "Expenses", "Tax Income", "Debt", "GDP Contribution")
+NUMERIC_TOKENS = ("MEX$", "mex$", "MXN", "MEX", "pesos", "$", "%")
+
+# Transformed columns stored in smaller dtypes by compact_financial_data.
+COMPACT_STRING_COLUMNS = ("CURRENCY", "QUARTER")
+COMPACT_FLOAT_COLUMNS = (
+    "REVENUE",
+    "EXPENSES",
+    "TAX_INCOME",
+    "DEBT",
+    "GDP_CONTRIBUTION_PERCENTAGE",
+)
+
+# Months in each `DATE` range partition of a year's table, by `partition_by`.
+PARTITION_MONTHS = {"quarter": 3, "month": 1}
+
+# Transformed columns covered by the optional ROW_HASH column.
+ROW_HASH_COLUMNS = [
+    "DATE",
+    "CURRENCY",
+    "REVENUE",
+    "EXPENSES",
+    "TAX_INCOME",
+    "DEBT",
+    "GDP_CONTRIBUTION_PERCENTAGE",
+    "QUARTER",
+]
+
+_TOKEN_PATTERN = "|".join(re.escape(token) for token in NUMERIC_TOKENS)
+# Tokens of several characters are replaced by a space and the value is then
+# trimmed of whitespace and single character tokens, which strips whole tokens
+# from both ends with plain substring replaces instead of a slower regex.
+_WORD_TOKENS = tuple(token for token in NUMERIC_TOKENS if len(token) > 1)
+_EDGE_CHARACTERS = " \t\n\r\f\v" + "".join(
+    token for token in NUMERIC_TOKENS if len(token) == 1
+)
+# Numbers with thousands separators, e.g. -1,619.40
+_GROUPED_NUMBER_PATTERN = r"^[+-]?\d{1,3}(,\d{3})+(\.\d*)?$"
+# Plain decimal numbers, all of which the Arrow float cast accepts.
+_NUMBER_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+# Quoted text and escaped characters of an Excel number format, which are
+# shown as they are, so a "%" in them does not scale the value.
+_NUMBER_FORMAT_LITERALS = re.compile(r'"[^"]*"|\\.')
+
+
+def get_financial_data_directory() -> str:
+    """Returns the directory holding the presupuesto files."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(
+        base_dir, "..", "data", "presupuestos"
+    )  # Go up to etl_project/data/presupuestos
+
+
+def get_financial_data_file_path(year: int, quarter: str) -> str:
     """
-    Extracts financial data for a given year and quarter from a CSV file.
+    Returns the path of the file holding a given year and quarter.
+
+    The CSV file is used if it exists, then the Excel workbook. If neither
+    exists, the CSV path is returned.
+
+    Args:
+        year: The year of the financial data (e.g., 2024).
+        quarter: The quarter ('Q1', 'Q2', 'Q3', 'Q4').
+    """
+    data_dir = get_financial_data_directory()
+    for extension in FINANCIAL_DATA_EXTENSIONS:
+        file_path = os.path.join(
+            data_dir, f"Nuevo_Leon_Financials_{year}_{quarter}_daily{extension}"
+        )
+        if os.path.exists(file_path):
+            return file_path
+    return os.path.join(data_dir, f"Nuevo_Leon_Financials_{year}_{quarter}_daily.csv")
+
+
+def discover_financial_data_files(data_dir: str = None) -> dict[tuple[int, str], str]:
+    """
+    Finds the presupuesto CSV and Excel files in a directory.
+
+    Usage example:
+        for (year, quarter), file_path in discover_financial_data_files().items():
+            ...
+
+    Args:
+        data_dir: The directory to search. Defaults to the presupuestos directory.
+
+    Returns:
+        The file path of each (year, quarter), in year and quarter order. When
+        a quarter has both a CSV and an Excel file, the CSV file is used.
+    """
+    data_dir = data_dir or get_financial_data_directory()
+    files = {}
+    for file_name in sorted(os.listdir(data_dir)):
+        match = FINANCIAL_DATA_FILE_PATTERN.match(file_name)
+        if match is None:
+            continue
+        year_quarter = (int(match.group(1)), match.group(2))
+        if year_quarter not in files or file_name.endswith(".csv"):
+            files[year_quarter] = os.path.join(data_dir, file_name)
+    return dict(sorted(files.items()))
+
+
+def _xlsx_cell_to_string(cell) -> object:
+    """
+    Converts an Excel cell to the string a CSV export would hold. Numbers in
+    a percent format are stored divided by 100, and are shown as percentages
+    the way Excel displays them, e.g. 0.0376 as "3.76%".
+    """
+    value = cell.value
+    if value is None:
+        return np.nan
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime(DATE_FORMATS[0])
+    if (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and "%" in _NUMBER_FORMAT_LITERALS.sub("", cell.number_format or "")
+    ):
+        # rounded to drop the float error of the scaling, e.g. 3.7600000000000002
+        return f"{round(value * 100, 10)}%"
+    return str(value)
+
+
+def _read_xlsx_chunks(file_path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Reads the first sheet of a workbook in chunks, streaming its rows.
+
+    The workbook is opened read-only, so rows are parsed as they are read
+    instead of loading the whole workbook into memory. Cells are converted to
+    the strings a CSV export of the sheet would hold, with percent-formatted
+    numbers as percentages, so the chunks look like the ones read from a CSV
+    file.
+    """
+    # openpyxl is only needed for Excel files
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows()
+        header = [str(cell.value) for cell in next(rows, ()) if cell.value is not None]
+        width = len(header)
+        chunk = []
+        for row in rows:
+            if all(cell.value is None for cell in row):
+                continue
+            values = [_xlsx_cell_to_string(cell) for cell in row[:width]]
+            chunk.append(values + [np.nan] * (width - len(values)))
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def _check_csv_engine(csv_engine: str) -> None:
+    if csv_engine not in CSV_ENGINES:
+        raise Exception(
+            f"CSV engine {csv_engine} is not supported, use 'pandas' or 'pyarrow'"
+        )
+
+
+def _get_arrow_csv_options(
+    use_threads: bool = True,
+) -> tuple[pa_csv.ReadOptions, pa_csv.ConvertOptions]:
+    """Returns the pyarrow CSV options reading `FINANCIAL_DATA_SCHEMA`."""
+    read_options = pa_csv.ReadOptions(use_threads=use_threads)
+    convert_options = pa_csv.ConvertOptions(
+        column_types=FINANCIAL_DATA_SCHEMA,
+        include_columns=list(FINANCIAL_DATA_COLUMNS),
+        null_values=CSV_NULL_VALUES,
+        strings_can_be_null=True,
+    )
+    return read_options, convert_options
+
+
+def read_financial_data_csv(file_path: str, use_threads: bool = True) -> pa.Table:
+    """
+    Reads the `FINANCIAL_DATA_COLUMNS` of a presupuesto CSV file with the
+    multithreaded pyarrow reader.
+
+    Every column is declared as a string, so no types are inferred, and the
+    other columns of the file are not parsed.
+
+    Usage example:
+        df = transform_financial_data(read_financial_data_csv(file_path))
+
+    Args:
+        file_path: The path of a `.csv` file.
+        use_threads: Parse blocks of the file on the pyarrow thread pool.
+
+    Returns:
+        An Arrow table with `FINANCIAL_DATA_SCHEMA`.
+    """
+    read_options, convert_options = _get_arrow_csv_options(use_threads)
+    return pa_csv.read_csv(
+        file_path, read_options=read_options, convert_options=convert_options
+    )
+
+
+def _read_financial_data_csv_chunks(
+    file_path: str, chunk_rows: int
+) -> Iterator[pa.Table]:
+    """Streams a presupuesto CSV file with pyarrow, in tables of `chunk_rows` rows."""
+    read_options, convert_options = _get_arrow_csv_options()
+    batches, pending_rows = [], 0
+    with pa_csv.open_csv(
+        file_path, read_options=read_options, convert_options=convert_options
+    ) as reader:
+        for batch in reader:
+            batches.append(batch)
+            pending_rows += batch.num_rows
+            while pending_rows >= chunk_rows:
+                pending = pa.Table.from_batches(batches, schema=FINANCIAL_DATA_SCHEMA)
+                yield pending.slice(0, chunk_rows)
+                pending = pending.slice(chunk_rows)
+                batches, pending_rows = pending.to_batches(), pending.num_rows
+    if pending_rows:
+        yield pa.Table.from_batches(batches, schema=FINANCIAL_DATA_SCHEMA)
+
+
+def arrow_to_extracted_dataframe(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow table of extracted strings to a dataframe of
+    `string[pyarrow]` columns. The strings stay in the Arrow buffers, which
+    the transform reads directly instead of Python string objects.
+    """
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+
+def extract_financial_data_file_chunks(
+    file_path: str, chunk_rows: int, csv_engine: str = "pandas"
+) -> Iterator[pd.DataFrame]:
+    """
+    Extracts a presupuesto CSV or Excel file in fixed-size chunks.
+
+    Args:
+        file_path: The path of a `.csv` or `.xlsx` file.
+        chunk_rows: The maximum number of rows in each chunk.
+        csv_engine: "pandas", or "pyarrow" to stream CSV files with
+            `read_financial_data_csv`'s schema and projection.
+
+    Returns:
+        An iterator of DataFrames.
+    """
+    _check_csv_engine(csv_engine)
+    if file_path.endswith(".xlsx"):
+        yield from _read_xlsx_chunks(file_path, chunk_rows)
+        return
+    if csv_engine == "pyarrow":
+        for table in _read_financial_data_csv_chunks(file_path, chunk_rows):
+            yield arrow_to_extracted_dataframe(table)
+        return
+    with pd.read_csv(file_path, chunksize=chunk_rows) as reader:
+        for df in reader:
+            yield df
+
+
+def extract_financial_data_file(
+    file_path: str, csv_engine: str = "pandas"
+) -> pd.DataFrame:
+    """
+    Extracts a whole presupuesto CSV or Excel file.
+
+    Args:
+        file_path: The path of a `.csv` or `.xlsx` file.
+        csv_engine: "pandas", or "pyarrow" to read CSV files with
+            `read_financial_data_csv`, into `string[pyarrow]` columns.
+
+    Returns:
+        A DataFrame containing the extracted data.
+    """
+    _check_csv_engine(csv_engine)
+    if file_path.endswith(".xlsx"):
+        return pd.concat(
+            _read_xlsx_chunks(file_path, chunk_rows=100_000), ignore_index=True
+        )
+    if csv_engine == "pyarrow":
+        return arrow_to_extracted_dataframe(read_financial_data_csv(file_path))
+    df = pd.read_csv(file_path)
+    return df
+
+
+def extract_financial_data(
+    year: int, quarter: str, csv_engine: str = "pandas"
+) -> pd.DataFrame:
+    """
+    Extracts financial data for a given year and quarter from a CSV or Excel file.
 
     Usage example:
         extract_financial_data(year=2024, quarter="Q1")
@@ -14,6 +365,7 @@ def extract_financial_data(year: int, quarter: str) -> pd.DataFrame:
     Args:
         year: The year of the financial data (e.g., 2024).
         quarter: The quarter ('Q1', 'Q2', 'Q3', 'Q4').
+        csv_engine: "pandas" or "pyarrow", see `extract_financial_data_file`.
 
     Returns:
         A DataFrame containing the extracted data, or None if the file does not exist.
@@ -21,24 +373,214 @@ def extract_financial_data(year: int, quarter: str) -> pd.DataFrame:
     Raises:
         FileNotFoundError: If the specified file does not exist.
     """
+    file_path = get_financial_data_file_path(year=year, quarter=quarter)
 
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(
-        base_dir, "..", "data", "presupuestos"
-    )  # Go up to etl_project/data/presupuestos
-    file_path = os.path.join(
-        data_dir, f"Nuevo_Leon_Financials_{year}_{quarter}_daily.csv"
-    )
-
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path)
-        return df
-    else:
+    if not os.path.exists(file_path):
         print(f"File {file_path} not found.")
         return None
+    return extract_financial_data_file(file_path, csv_engine=csv_engine)
+
+
+def extract_financial_data_chunks(
+    year: int, quarter: str, chunk_rows: int, csv_engine: str = "pandas"
+) -> Iterator[pd.DataFrame]:
+    """
+    Extracts financial data for a given year and quarter in fixed-size chunks.
+
+    Only one chunk is held in memory at a time, so memory use does not grow
+    with the size of the file. Excel workbooks are streamed row by row.
+
+    Usage example:
+        for df in extract_financial_data_chunks(year=2024, quarter="Q1", chunk_rows=50000):
+            ...
+
+    Args:
+        year: The year of the financial data (e.g., 2024).
+        quarter: The quarter ('Q1', 'Q2', 'Q3', 'Q4').
+        chunk_rows: The maximum number of rows in each chunk.
+        csv_engine: "pandas" or "pyarrow", see `extract_financial_data_file`.
+
+    Returns:
+        An iterator of DataFrames, which is empty if the file does not exist.
+    """
+    file_path = get_financial_data_file_path(year=year, quarter=quarter)
+
+    if not os.path.exists(file_path):
+        print(f"File {file_path} not found.")
+        return
+    yield from extract_financial_data_file_chunks(
+        file_path, chunk_rows, csv_engine=csv_engine
+    )
+
+
+def parse_dates(
+    dates: pd.Series, date_formats: tuple = DATE_FORMATS
+) -> tuple[pd.Series, int]:
+    """
+    Parses a column of date strings that mixes several formats.
+
+    Each distinct value is parsed only once, and every format is applied to
+    all still-unparsed values in one vectorized call. The first format that
+    matches a value wins, so the result is the same as trying the formats
+    one by one on every row.
+
+    Usage example:
+        parsed, unparsed_count = parse_dates(df["Date"], ("%Y/%m/%d", "%d-%m-%Y"))
+
+    Args:
+        dates: The column of date strings.
+        date_formats: The strftime formats to try, in order of preference.
+
+    Returns:
+        A tuple of the parsed datetime64 column and the number of rows that
+        could not be parsed with any format and were set to NaT.
+    """
+    codes, uniques = pd.factorize(dates)
+    parsed = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]")
+    pending = np.ones(len(uniques), dtype=bool)
+    for fmt in date_formats:
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(
+            uniques[pending], format=fmt, errors="coerce"
+        ).to_numpy()
+        pending = np.isnat(parsed)
+
+    # Missing values are factorized to -1, which picks the trailing NaT
+    lookup = np.append(parsed, np.datetime64("NaT"))
+    result = pd.Series(lookup[codes], index=dates.index, name=dates.name)
+    return result, int(result.isna().sum())
+
+
+def _to_string_array(values: pd.Series) -> "pa.Array | pa.ChunkedArray":
+    """
+    Converts a column to an Arrow string array, with missing values as nulls.
+    The buffers of `string[pyarrow]` columns are used as they are.
+    """
+    try:
+        return pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array(
+            values.astype(str).where(values.notna()), type=pa.string(), from_pandas=True
+        )
+
+
+def _null_if_empty(strings: pa.ChunkedArray) -> pa.ChunkedArray:
+    return pc.if_else(pc.equal(strings, ""), pa.scalar(None, pa.string()), strings)
 
 
-def transform_financial_data(df):
+def _strip_edge_tokens(strings: pa.ChunkedArray) -> pa.ChunkedArray:
+    """
+    Strips whole `NUMERIC_TOKENS` and whitespace from both ends of the values.
+    A token inside a value leaves a space there, so the value does not cast.
+    """
+    for token in _WORD_TOKENS:
+        strings = pc.replace_substring(strings, token, " ")
+    return _null_if_empty(pc.ascii_trim(strings, _EDGE_CHARACTERS))
+
+
+def _strip_thousands_separators(strings: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Removes the commas of numbers written in groups of three digits."""
+    is_grouped = pc.fill_null(
+        pc.match_substring_regex(strings, _GROUPED_NUMBER_PATTERN), False
+    )
+    if not pc.any(is_grouped).as_py():
+        return strings
+    return pc.if_else(is_grouped, pc.replace_substring(strings, ",", ""), strings)
+
+
+def _parse_numbers(
+    raw: pa.ChunkedArray, trimmed: pa.ChunkedArray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parses amounts that did not all cast cleanly after trimming.
+
+    Plain numbers are cast in bulk. The rest have every currency token removed
+    wherever it appears, e.g. "-$5.00", and are converted with `pd.to_numeric`.
+    """
+    is_number = pc.fill_null(pc.match_substring_regex(trimmed, _NUMBER_PATTERN), False)
+    numbers = np.array(
+        pc.cast(
+            pc.if_else(is_number, trimmed, pa.scalar(None, pa.string())), pa.float64()
+        ).to_numpy(),
+        dtype="float64",
+    )
+    failed = np.zeros(len(numbers), dtype=bool)
+
+    retry = np.flatnonzero(~is_number.to_numpy() & pc.is_valid(trimmed).to_numpy())
+    if len(retry):
+        retry_strings = pc.utf8_trim_whitespace(
+            pc.replace_substring_regex(raw.take(retry), _TOKEN_PATTERN, "")
+        )
+        retry_strings = _strip_thousands_separators(retry_strings)
+        retry_strings = _null_if_empty(retry_strings).to_pandas()
+        parsed = pd.to_numeric(retry_strings, errors="coerce").to_numpy(dtype="float64")
+        numbers[retry] = parsed
+        failed[retry] = (
+            np.isnan(parsed)
+            & retry_strings.notna().to_numpy()
+            & ~retry_strings.str.lower().eq("nan").to_numpy()
+        )
+    return numbers, failed
+
+
+def clean_numeric_columns(
+    df: pd.DataFrame, columns: tuple = NUMERIC_COLUMNS
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Strips currency tokens from amount columns and converts them to float64.
+
+    All columns are cleaned together in one vectorized Arrow pass: whole
+    `NUMERIC_TOKENS` and whitespace are stripped from both ends of each value
+    and the result is cast to float. If some values do not parse, thousands
+    separators are removed from numbers written in groups of three digits,
+    and the values that still do not parse fall back to removing the tokens
+    wherever they appear. Values that still cannot be converted, such as
+    "3,5%" or "12 MXN 3", become NaN and are flagged in the returned mask.
+
+    Usage example:
+        df, rejected = clean_numeric_columns(df, ("Revenue", "Debt"))
+        bad_rows = df[rejected.any(axis=1)]
+
+    Args:
+        df: The DataFrame containing the amount columns.
+        columns: The names of the columns to clean.
+
+    Returns:
+        A tuple of the DataFrame with cleaned columns and a boolean DataFrame,
+        with one column per cleaned column, marking the values that failed
+        conversion.
+    """
+    columns = list(columns)
+    # string[pyarrow] columns are chunked arrays, which are joined chunk by chunk
+    chunks = []
+    for column in columns:
+        strings = _to_string_array(df[column])
+        chunks.extend(
+            strings.chunks if isinstance(strings, pa.ChunkedArray) else [strings]
+        )
+    raw = pa.chunked_array(chunks, type=pa.string())
+
+    cleaned = _strip_edge_tokens(raw)
+    try:
+        numbers = np.array(pc.cast(cleaned, pa.float64()).to_numpy(), dtype="float64")
+        failed = np.zeros(len(numbers), dtype=bool)
+    except pa.ArrowInvalid:
+        numbers, failed = _parse_numbers(raw, _strip_thousands_separators(cleaned))
+
+    rejected = pd.DataFrame(index=df.index)
+    for i, column in enumerate(columns):
+        column_slice = slice(i * len(df), (i + 1) * len(df))
+        df[column] = numbers[column_slice]
+        rejected[column] = failed[column_slice]
+    return df, rejected
+
+
+def transform_financial_data(
+    df: "pd.DataFrame | pa.Table",
+    date_formats: tuple = DATE_FORMATS,
+    logger: logging.Logger = None,
+) -> pd.DataFrame:
     """
     Transforms financial data by standardizing columns and cleaning values.
 
@@ -46,34 +588,35 @@ def transform_financial_data(df):
         transform_financial_data(df)
 
     Args:
-        df: The input DataFrame containing financial data.
+        df: The input DataFrame containing financial data, or an Arrow table
+            from `read_financial_data_csv`. Arrow strings are cleaned without
+            being converted to Python strings; the result is the same.
+        date_formats: The formats used to parse the `Date` column, in order.
+        logger: Logger used to report rows that could not be cleaned.
 
     Returns:
-        A DataFrame with standardized and cleaned data.
+        A DataFrame with standardized and cleaned data. The number of rows with
+        a value that could not be parsed is in `df.attrs["rows_rejected"]`.
 
     Raises:
         ValueError: If the DataFrame contains invalid data that cannot be processed.
     """
-    # Datetime standardization
-    # df["Date"] = pd.to_datetime(df["Date"], errors="raise").dt.strftime("%Y-%m-%d")
-
-    # df["Date"] = pd.to_datetime(
-    #    df["Date"], format="%d-%m-%Y", errors="coerce"
-    # ).dt.strftime("%Y-%m-%d")
+    logger = logger or logging.getLogger(__name__)
+    if isinstance(df, pa.Table):
+        df = arrow_to_extracted_dataframe(df)
 
-    def parse_date(date_str):
-        for fmt in ("%Y/%m/%d", "%d-%m-%Y"):
-            try:
-                return pd.to_datetime(date_str, format=fmt)
-            except ValueError:
-                continue
-        return pd.NaT  # Return floating-point NaT for invalid dates
-
-    # df["Date"] = df["Date"].apply(parse_date).dt.strftime("%Y-%m-%d")
-    df["Date"] = df["Date"].apply(parse_date)
+    # Datetime standardization
+    df["Date"], unparsed_dates = parse_dates(df["Date"], date_formats)
+    if unparsed_dates:
+        logger.warning(f"{unparsed_dates} rows have an unparseable Date, set to NaT")
+    rejected_rows = df["Date"].isna().to_numpy()
     df["Quarter"] = df["Date"].dt.to_period("Q").astype(str)
 
     # VarChar standardization
+    if isinstance(df["Currency"].dtype, pd.StringDtype):
+        # same dtype and missing values as a column read by pd.read_csv, and
+        # replace() on string[pyarrow] is quadratic in the row count on pandas 1.4
+        df["Currency"] = df["Currency"].to_numpy(dtype=object, na_value=np.nan)
     df["Currency"] = (
         df["Currency"]
         .str.lower()
@@ -89,76 +632,406 @@ def transform_financial_data(df):
     )
 
     # Numeric column standardization
-    def clean_currency_values(value):
-        try:
-            value = (
-                str(value)
-                .replace(",", "")
-                .replace("$", "")
-                .replace("MXN", "")
-                .replace("mex$", "")
-                .replace("pesos", "")
-                .replace("MEX$", "")
-                .replace("MEX", "")
-            )
-            return float(value) if value else None
-        except Exception as e:
-            print(f"Error cleaning value: {value} - {e}")
-            return None
-
-    df["Revenue"] = df["Revenue"].apply(clean_currency_values)
-    df["Expenses"] = df["Expenses"].apply(clean_currency_values)
-    df["Tax Income"] = df["Tax Income"].apply(clean_currency_values)
-    df["Debt"] = df["Debt"].apply(clean_currency_values)
-
-    df["Revenue"] = df["Revenue"].astype("float64", errors="ignore")
-    df["Expenses"] = df["Expenses"].astype("float64", errors="ignore")
-    df["Tax Income"] = df["Tax Income"].astype("float64", errors="ignore")
-    df["Debt"] = df["Debt"].astype("float64", errors="ignore")
-
-    def clean_gdp_contribution(value):
-        try:
-            return float(value.replace("%", "")) if value else None
-        except:
-            return None
-
-    df["GDP Contribution"] = df["GDP Contribution"].apply(clean_gdp_contribution)
+    df, rejected = clean_numeric_columns(df, NUMERIC_COLUMNS)
+    for column, count in rejected.sum().items():
+        if count:
+            logger.warning(f"{count} rows have an unparseable {column}, set to NaN")
+    rejected_rows |= rejected.any(axis=1).to_numpy()
+
     df = df.rename(columns={"GDP Contribution": "GDP Contribution Percentage"})
     df.columns = df.columns.str.upper().str.replace(" ", "_")
+    df.attrs["rows_rejected"] = int(rejected_rows.sum())
+
+    return df
+
+
+def compact_financial_data(
+    df: pd.DataFrame,
+    string_dtype: str = "category",
+    float_dtype: str = "float32",
+) -> pd.DataFrame:
+    """
+    Stores a transformed frame in smaller dtypes.
+
+    `CURRENCY` and `QUARTER` become categorical or Arrow-backed strings, and the
+    numeric columns become `float_dtype`. A numeric column is kept as float64
+    when one of its values would not come back unchanged from
+    `restore_financial_data`, so the loaded values are always the same.
+
+    Usage example:
+        df = compact_financial_data(transform_financial_data(df))
+        load(df=restore_financial_data(df), ...)
+
+    Args:
+        df: transformed dataframe
+        string_dtype: "category" or "string[pyarrow]"
+        float_dtype: dtype of the numeric columns, e.g. "float32"
+
+    Returns:
+        The dataframe with compact dtypes.
+    """
+    for column in COMPACT_STRING_COLUMNS:
+        df[column] = df[column].astype(string_dtype)
+    for column in COMPACT_FLOAT_COLUMNS:
+        values = df[column]
+        compact = values.astype(float_dtype)
+        restored = compact.astype(str).astype("float64")
+        if ((restored == values) | (restored.isna() & values.isna())).all():
+            df[column] = compact
+    return df
+
+
+def restore_financial_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts a frame from `compact_financial_data` back to the dtypes of
+    `transform_financial_data`.
+
+    Compact floats are converted through their shortest string, so a float32
+    130.27 becomes the float64 130.27 rather than 130.27000427246094.
+    """
+    df = df.copy()
+    for column in COMPACT_STRING_COLUMNS:
+        if df[column].dtype != object:
+            values = df[column].astype(object)
+            df[column] = values.where(values.notna(), np.nan)
+    for column in COMPACT_FLOAT_COLUMNS:
+        if df[column].dtype != "float64":
+            df[column] = df[column].astype(str).astype("float64")
+    return df
+
+
+def concat_financial_data(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates transformed frames, keeping categorical columns categorical."""
+    frames = list(frames)
+    for column in COMPACT_STRING_COLUMNS:
+        columns = [df[column] for df in frames]
+        if len(frames) > 1 and all(
+            isinstance(values.dtype, pd.CategoricalDtype) for values in columns
+        ):
+            categories = union_categoricals(columns).categories
+            for df in frames:
+                df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def get_memory_usage(df: pd.DataFrame) -> int:
+    """Returns the bytes used by a dataframe, including its Python strings."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def get_date_partitions(
+    table_name: str, year: int, partition_by: str = "quarter"
+) -> dict[str, tuple[datetime.date, datetime.date]]:
+    """
+    Returns the `DATE` range partitions of a year's table.
+
+    Usage example:
+        get_date_partitions("Nuevo_Leon_Financials_2024", 2024)
+        # {"Nuevo_Leon_Financials_2024_q1": (date(2024, 1, 1), date(2024, 4, 1)), ...}
+
+    Args:
+        table_name: name of the partitioned table, used as the partition prefix
+        year: year of the table
+        partition_by: "quarter" or "month"
+
+    Returns:
+        partition name -> (first date, first date of the next partition)
+    """
+    if partition_by not in PARTITION_MONTHS:
+        raise Exception(
+            f"Partitioning by {partition_by} is not supported, use 'quarter' or 'month'"
+        )
+    months = PARTITION_MONTHS[partition_by]
+    partitions = {}
+    for start_month in range(1, 13, months):
+        end_month = start_month + months
+        suffix = (
+            f"q{(start_month - 1) // 3 + 1}"
+            if partition_by == "quarter"
+            else f"m{start_month:02d}"
+        )
+        partitions[f"{table_name}_{suffix}"] = (
+            datetime.date(year, start_month, 1),
+            datetime.date(year + (end_month > 12), (end_month - 1) % 12 + 1, 1),
+        )
+    return partitions
+
+
+def build_financials_table(
+    table_name: str,
+    metadata: MetaData,
+    row_hash: bool = False,
+    partition_by: str = None,
+    year: int = None,
+) -> Table:
+    """
+    Defines a table for transformed financial data, keyed by `DATE`.
 
+    Args:
+        table_name: name of the table
+        metadata: sqlalchemy metadata the table is added to
+        row_hash: add a `ROW_HASH` column used to detect changed rows
+        partition_by: "quarter" or "month" to define the table as partitioned
+            by `DATE` range, with the partitions of `year`. `load` creates the
+            partitions and loads them in parallel.
+        year: year of the partitions
+    """
+    columns = [
+        Column("DATE", Date, primary_key=True),
+        Column("CURRENCY", String),
+        Column("REVENUE", Float),
+        Column("EXPENSES", Float),
+        Column("TAX_INCOME", Float),
+        Column("DEBT", Float),
+        Column("GDP_CONTRIBUTION_PERCENTAGE", Float),
+        Column("QUARTER", String),
+    ]
+    if row_hash:
+        columns.append(Column("ROW_HASH", BigInteger))
+    if partition_by is None:
+        return Table(table_name, metadata, *columns)
+    table = Table(
+        table_name, metadata, *columns, postgresql_partition_by='RANGE ("DATE")'
+    )
+    table.info["partitions"] = get_date_partitions(
+        table_name=table_name, year=year, partition_by=partition_by
+    )
+    return table
+
+
+def add_row_hash(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds a `ROW_HASH` column with a 64-bit hash of each row's transformed values.
+    """
+    row_hashes = pd.util.hash_pandas_object(df[ROW_HASH_COLUMNS], index=False)
+    df["ROW_HASH"] = row_hashes.to_numpy().view("int64")
     return df
 
 
+def filter_changed_rows(
+    df: pd.DataFrame, postgresql_client: PostgreSqlClient, table: Table
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Keeps only the rows that are new or differ from the rows already loaded.
+
+    The row hashes are compared with the `ROW_HASH` values stored for the same
+    `DATE`s in the target table. This is meant for upserts: rows dropped here
+    are left untouched in the table.
+
+    Usage example:
+        df, row_counts = filter_changed_rows(df, postgresql_client, table)
+        load(df=df, ..., load_method="upsert")
+
+    Args:
+        df: transformed dataframe
+        postgresql_client: postgresql client
+        table: sqlalchemy table with a `ROW_HASH` column
+
+    Returns:
+        A tuple of the rows to load, with a `ROW_HASH` column, and a dict with
+        the number of inserted, updated and unchanged rows.
+    """
+    df = add_row_hash(df)
+    if df.empty:
+        return df, {"rows_inserted": 0, "rows_updated": 0, "rows_unchanged": 0}
+    postgresql_client.create_table(metadata=table.metadata)
+    postgresql_client.add_missing_columns(table=table)
+
+    existing = pd.DataFrame(
+        postgresql_client.engine.execute(
+            select(table.c.DATE, table.c.ROW_HASH).where(
+                table.c.DATE.between(df["DATE"].min(), df["DATE"].max())
+            )
+        ).all(),
+        columns=["DATE", "EXISTING_ROW_HASH"],
+    )
+    existing["DATE"] = pd.to_datetime(existing["DATE"])
+    existing["EXISTING_ROW_HASH"] = existing["EXISTING_ROW_HASH"].astype("Int64")
+    compared = df[["DATE", "ROW_HASH"]].merge(
+        existing, on="DATE", how="left", indicator=True
+    )
+
+    is_new = (compared["_merge"] == "left_only").to_numpy()
+    is_unchanged = (
+        compared["EXISTING_ROW_HASH"].eq(compared["ROW_HASH"]).fillna(False)
+    ).to_numpy(dtype=bool)
+    row_counts = {
+        "rows_inserted": int(is_new.sum()),
+        "rows_updated": int((~is_new & ~is_unchanged).sum()),
+        "rows_unchanged": int(is_unchanged.sum()),
+    }
+    return df[~is_unchanged], row_counts
+
+
+def split_partitions(
+    df: pd.DataFrame, table_name: str, partitions: dict[str, tuple]
+) -> dict[str, pd.DataFrame]:
+    """
+    Splits rows by the `DATE` range partition they belong to. Rows outside
+    every range go to the `{table_name}_default` partition. Partitions without
+    rows are left out.
+    """
+    dates = df["DATE"]
+    unassigned = pd.Series(True, index=df.index)
+    partition_frames = {}
+    for partition_name, (start, end) in partitions.items():
+        in_partition = (dates >= pd.Timestamp(start)) & (dates < pd.Timestamp(end))
+        unassigned &= ~in_partition
+        if in_partition.any():
+            partition_frames[partition_name] = df[in_partition]
+    if unassigned.any():
+        partition_frames[f"{table_name}_default"] = df[unassigned]
+    return partition_frames
+
+
+def _load_partitions(
+    df: pd.DataFrame,
+    postgresql_client: PostgreSqlClient,
+    table: Table,
+    metadata: MetaData,
+    load_method: str,
+    batch_size: int,
+    commit_every_batch: bool,
+    workers: int,
+    rollup_hooks: dict,
+) -> None:
+    """Loads each partition of a partitioned table on its own pooled connection."""
+    partitions = table.info["partitions"]
+    postgresql_client.ensure_tables(metadata)
+    postgresql_client.ensure_partitions(table=table, partitions=partitions)
+
+    def load_partition(partition_name: str, partition_df: pd.DataFrame) -> None:
+        if load_method == "replace_partitions" and partition_name in partitions:
+            postgresql_client.replace_partition(
+                data=partition_df,
+                table=table,
+                partition_name=partition_name,
+                bounds=partitions[partition_name],
+                partition_column="DATE",
+            )
+        else:
+            # rows of the default partition are upserted, it is never replaced
+            partition_table = postgresql_client.get_partition_table(
+                table=table, partition_name=partition_name
+            )
+            postgresql_client.staged_upsert(
+                data=partition_df,
+                table=partition_table,
+                metadata=partition_table.metadata,
+                batch_size=batch_size,
+                commit_every_batch=commit_every_batch,
+                **rollup_hooks,
+            )
+
+    partition_frames = split_partitions(
+        df=df, table_name=table.name, partitions=partitions
+    )
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(load_partition, partition_name, partition_df)
+            for partition_name, partition_df in partition_frames.items()
+        ]
+        for future in futures:
+            future.result()
+
+
 def load(
     df: pd.DataFrame,
     postgresql_client: PostgreSqlClient,
     table: Table,
     metadata: MetaData,
     load_method: str = "upsert",
+    batch_size: int = 100_000,
+    commit_every_batch: bool = False,
+    partition_workers: int = 4,
+    keep_previous_table: bool = False,
+    rollup: FinancialsRollup = None,
 ) -> None:
     """
     Load dataframe to a database.
 
+    Tables defined with `build_financials_table(partition_by=...)` are loaded
+    one partition per pooled connection, `partition_workers` at a time, with
+    `upsert` or `replace_partitions`.
+
     Args:
         df: dataframe to load
         postgresql_client: postgresql client
         table: sqlalchemy table
         metadata: sqlalchemy metadata
-        load_method: supports one of: [insert, upsert, overwrite]
+        load_method: supports one of: [insert, upsert, overwrite, copy, copy_overwrite,
+            replace_partitions]. `copy` and `copy_overwrite` are insert and
+            overwrite through the COPY protocol, for large dataframes.
+            `overwrite` and `copy_overwrite` load a shadow table and swap it
+            in, so readers never see a missing or partly loaded table.
+            `replace_partitions` replaces the partitions of a partitioned table
+            that have rows in `df`, with a detach/attach swap.
+        batch_size: maximum number of rows merged at a time by `upsert`
+        commit_every_batch: commit each `upsert` batch separately instead of
+            upserting all rows in one transaction
+        partition_workers: partitions loaded at once
+        keep_previous_table: `overwrite` and `copy_overwrite` keep the
+            replaced table as `{table}_previous` instead of dropping it
+        rollup: rollup of the table's per period aggregates. `upsert` updates
+            it in the same transaction as the rows; the other load methods
+            refresh it after loading.
     """
-    if load_method == "insert":
+    rollup_hooks = {}
+    if rollup is not None and load_method == "upsert":
+        rollup.initialize(table)
+        rollup_hooks = {
+            "before_merge": functools.partial(
+                rollup.stage_deltas, source_table=table.name
+            ),
+            "before_commit": rollup.apply_staged_deltas,
+        }
+    if table.info.get("partitions"):
+        if load_method not in ("upsert", "replace_partitions"):
+            raise Exception(
+                "Partitioned tables support the upsert and replace_partitions "
+                "load methods"
+            )
+        _load_partitions(
+            df=df,
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            load_method=load_method,
+            batch_size=batch_size,
+            commit_every_batch=commit_every_batch,
+            workers=partition_workers,
+            rollup_hooks=rollup_hooks,
+        )
+    elif load_method == "insert":
         postgresql_client.insert(
             data=df.to_dict(orient="records"), table=table, metadata=metadata
         )
     elif load_method == "upsert":
-        postgresql_client.upsert(
-            data=df.to_dict(orient="records"), table=table, metadata=metadata
+        postgresql_client.staged_upsert(
+            data=df,
+            table=table,
+            metadata=metadata,
+            batch_size=batch_size,
+            commit_every_batch=commit_every_batch,
+            **rollup_hooks,
         )
     elif load_method == "overwrite":
         postgresql_client.overwrite(
-            data=df.to_dict(orient="records"), table=table, metadata=metadata
+            data=df.to_dict(orient="records"),
+            table=table,
+            metadata=metadata,
+            keep_previous=keep_previous_table,
+        )
+    elif load_method == "copy":
+        postgresql_client.copy_insert(data=df, table=table, metadata=metadata)
+    elif load_method == "copy_overwrite":
+        postgresql_client.copy_overwrite(
+            data=df, table=table, metadata=metadata, keep_previous=keep_previous_table
         )
     else:
         raise Exception(
-            "Please specify a correct load method: [insert, upsert, overwrite]"
+            "Please specify a correct load method: "
+            "[insert, upsert, overwrite, copy, copy_overwrite]"
         )
+    if rollup is not None and load_method != "upsert":
+        rollup.refresh(table)
@@ -0,0 +1,348 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import struct
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable
+import schedule
+from etl_project.assets.presupuesto_etl import FINANCIAL_DATA_FILE_PATTERN
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+# a file finished being written, or was moved into the directory
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+# struct inotify_event: int wd, uint32 mask, uint32 cookie, uint32 len, name
+_EVENT_HEADER = struct.Struct("iIII")
+# returned by watchers when events were lost and any file may have changed
+ANY_FILE = "*"
+
+logger = logging.getLogger(__name__)
+
+
+class InotifyWatcher:
+    """
+    Watches a directory for files that are written or moved into it, using
+    Linux inotify through ctypes.
+
+    Raises:
+        OSError: if inotify is not available
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        file_name_pattern: re.Pattern = FINANCIAL_DATA_FILE_PATTERN,
+    ):
+        self.directory = directory
+        self.file_name_pattern = file_name_pattern
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"Cannot watch {directory}: {os.strerror(errno)}")
+
+    def wait(self, timeout: float) -> set[str]:
+        """
+        Waits up to `timeout` seconds for file events.
+
+        Returns:
+            The names of the matching files written or moved in, `ANY_FILE` if
+            the kernel dropped events, or an empty set on timeout.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        file_names = set()
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                _, mask, _, name_length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+                name = buffer[offset : offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & IN_Q_OVERFLOW:
+                    file_names.add(ANY_FILE)
+                elif self.file_name_pattern.match(os.fsdecode(name)):
+                    file_names.add(os.fsdecode(name))
+        return file_names
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Watches a directory by comparing the size and mtime of its files every
+    `poll_seconds`. Used where inotify is not available, such as on macOS or
+    on network and some container volume mounts.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        poll_seconds: float = 2.0,
+        file_name_pattern: re.Pattern = FINANCIAL_DATA_FILE_PATTERN,
+    ):
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.file_name_pattern = file_name_pattern
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if self.file_name_pattern.match(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout: float) -> set[str]:
+        """
+        Polls for up to `timeout` seconds.
+
+        Returns:
+            The names of the matching files that are new or changed since the
+            last poll, or an empty set on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(max(0.0, min(self.poll_seconds, deadline - time.monotonic())))
+            snapshot = self._scan()
+            file_names = {
+                file_name
+                for file_name, file_stat in snapshot.items()
+                if self._snapshot.get(file_name) != file_stat
+            }
+            self._snapshot = snapshot
+            if file_names or time.monotonic() >= deadline:
+                return file_names
+
+    def close(self) -> None:
+        pass
+
+
+def create_file_watcher(
+    directory: str, watch_method: str = "auto", poll_seconds: float = 2.0
+) -> "InotifyWatcher | PollingWatcher":
+    """
+    Creates a watcher for the presupuesto files in a directory.
+
+    Args:
+        directory: the directory to watch
+        watch_method: "inotify", "polling", or "auto" to use inotify and fall
+            back to polling where it is not available
+        poll_seconds: the polling interval of the polling watcher
+    """
+    if watch_method not in ("auto", "inotify", "polling"):
+        raise Exception(
+            f"Watch method {watch_method} is not supported, "
+            "use 'auto', 'inotify' or 'polling'"
+        )
+    if watch_method != "polling":
+        try:
+            return InotifyWatcher(directory=directory)
+        except OSError as e:
+            if watch_method == "inotify":
+                raise
+            logger.warning(f"inotify is not available, polling {directory}: {e}")
+    return PollingWatcher(directory=directory, poll_seconds=poll_seconds)
+
+
+class CoalescingRunner:
+    """
+    Runs a function on an executor, at most `max_concurrent_runs` at a time.
+
+    Runs requested while the limit is reached are coalesced into a single
+    follow-up run, which starts when a run in flight ends. Without an
+    `executor`, the runner uses its own threads.
+
+    Usage example:
+        runner = CoalescingRunner(run=run_pipeline)
+        runner.request("3 changed files")
+        runner.close()  # waits for the runs in flight
+    """
+
+    def __init__(
+        self,
+        run: Callable[[], None],
+        executor: Executor = None,
+        max_concurrent_runs: int = 1,
+        name: str = "pipeline_runner",
+    ):
+        self.run = run
+        self.name = name
+        self.max_concurrent_runs = max_concurrent_runs
+        self.runs = 0
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_concurrent_runs, thread_name_prefix=name
+        )
+        self._condition = threading.Condition()
+        self._requested = False
+        self._running = 0
+        self._closed = False
+
+    def request(self, reason: str) -> None:
+        """Starts a run, or queues one follow-up run if the limit is reached."""
+        with self._condition:
+            if self._closed:
+                return
+            if self._running < self.max_concurrent_runs:
+                logger.info(f"Starting {self.name} run: {reason}")
+                self._start()
+            elif not self._requested:
+                logger.info(f"{self.name} is running, queued a follow-up: {reason}")
+                self._requested = True
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Waits until no run is in flight or requested."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._requested and self._running == 0, timeout
+            )
+
+    def close(self) -> None:
+        """Waits for the runs in flight and stops the runner. Queued runs are dropped."""
+        with self._condition:
+            self._closed = True
+            self._requested = False
+            self._condition.wait_for(lambda: self._running == 0)
+        if self._own_executor:
+            self.executor.shutdown()
+
+    def _start(self) -> None:
+        # called with the condition held
+        self._running += 1
+        self.executor.submit(self._run_once)
+
+    def _run_once(self) -> None:
+        try:
+            self.run()
+        except Exception:
+            logger.exception(f"{self.name} run failed")
+        finally:
+            with self._condition:
+                self._running -= 1
+                self.runs += 1
+                if self._requested and not self._closed:
+                    self._requested = False
+                    self._start()
+                self._condition.notify_all()
+
+
+def run_trigger_loop(
+    scheduler: schedule.Scheduler,
+    watcher: "InotifyWatcher | PollingWatcher" = None,
+    on_files_changed: Callable[[set[str]], None] = None,
+    debounce_seconds: float = 2.0,
+    max_delay_seconds: float = 60.0,
+    poll_seconds: float = 2.0,
+    stop_event: threading.Event = None,
+) -> None:
+    """
+    Runs the pending jobs of `scheduler` and, with a `watcher`, calls
+    `on_files_changed` with the names of the files changed in each burst of
+    file events, until `stop_event` is set.
+
+    A burst ends once no event arrived for `debounce_seconds`, or
+    `max_delay_seconds` after its first event while files keep changing.
+    """
+    changed_file_names = set()
+    first_event_time = None
+    run_time = None
+    while stop_event is None or not stop_event.is_set():
+        timeout = poll_seconds if run_time is None else run_time - time.monotonic()
+        if scheduler.idle_seconds is not None:
+            timeout = min(timeout, scheduler.idle_seconds)
+        timeout = max(0.0, timeout)
+        if watcher is None:
+            time.sleep(timeout)
+            file_names = set()
+        else:
+            file_names = watcher.wait(timeout)
+        now = time.monotonic()
+        if file_names:
+            changed_file_names |= file_names
+            first_event_time = first_event_time or now
+            run_time = min(now + debounce_seconds, first_event_time + max_delay_seconds)
+        if run_time is not None and now >= run_time:
+            on_files_changed(changed_file_names)
+            changed_file_names = set()
+            first_event_time = None
+            run_time = None
+        scheduler.run_pending()
+
+
+def describe_changed_files(file_names: set[str]) -> str:
+    """Describes changed files for run trigger logs."""
+    return f"changed files {', '.join(sorted(file_names))}"
+
+
+def watch_and_run(
+    directory: str,
+    run: Callable[[], None],
+    debounce_seconds: float = 2.0,
+    watch_method: str = "auto",
+    poll_seconds: float = 2.0,
+    run_seconds: float = None,
+    max_concurrent_runs: int = 1,
+    max_delay_seconds: float = 60.0,
+    run_on_start: bool = True,
+    stop_event: threading.Event = None,
+) -> None:
+    """
+    Runs `run` when presupuesto files in `directory` are written or moved in.
+
+    A burst of file events starts one run, see `run_trigger_loop`. At most
+    `max_concurrent_runs` runs are in flight; changes during a run coalesce
+    into one follow-up run.
+
+    Args:
+        run_seconds: also request a run at this interval, as a safety net for
+            missed events. None to run only on file events.
+        run_on_start: request a run when watching starts, to pick up files
+            that arrived while the process was not running
+        stop_event: stops watching when set. Watches until interrupted if None.
+    """
+    watcher = create_file_watcher(
+        directory=directory, watch_method=watch_method, poll_seconds=poll_seconds
+    )
+    runner = CoalescingRunner(run=run, max_concurrent_runs=max_concurrent_runs)
+    scheduler = schedule.Scheduler()
+    if run_seconds:
+        scheduler.every(run_seconds).seconds.do(runner.request, reason="schedule")
+    if run_on_start:
+        runner.request(reason="start")
+    try:
+        run_trigger_loop(
+            scheduler=scheduler,
+            watcher=watcher,
+            on_files_changed=lambda file_names: runner.request(
+                reason=describe_changed_files(file_names)
+            ),
+            debounce_seconds=debounce_seconds,
+            max_delay_seconds=max_delay_seconds,
+            poll_seconds=poll_seconds,
+            stop_event=stop_event,
+        )
+    finally:
+        runner.close()
+        watcher.close()
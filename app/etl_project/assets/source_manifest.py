@@ -0,0 +1,103 @@
+import hashlib
+import os
+from datetime import datetime
+from sqlalchemy import Table, Column, String, MetaData, BigInteger, Float
+from etl_project.connectors.postgresql import PostgreSqlClient
+
+
+def compute_file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class SourceManifest:
+    """
+    Tracks the source files a pipeline has already loaded.
+
+    Each file is recorded with its size, mtime and content hash. A file whose
+    size and mtime are unchanged is not re-read. A file that was only touched
+    is detected by its unchanged hash, and recorded again with its new mtime.
+    """
+
+    def __init__(
+        self,
+        pipeline_name: str,
+        postgresql_client: PostgreSqlClient,
+        manifest_table_name: str = "presupuesto_pipeline_source_manifest",
+    ):
+        self.pipeline_name = pipeline_name
+        self.manifest_table_name = manifest_table_name
+        self.postgresql_client = postgresql_client
+        self.metadata = MetaData()
+        self.table = Table(
+            self.manifest_table_name,
+            self.metadata,
+            Column("pipeline_name", String, primary_key=True),
+            Column("file_path", String, primary_key=True),
+            Column("size", BigInteger),
+            Column("mtime", Float),
+            Column("content_hash", String),
+            Column("processed_at", String),
+        )
+        self.postgresql_client.create_table(metadata=self.metadata)
+        self._entries = self._get_entries()
+        # size, mtime and hash are captured when a file is checked, so an edit
+        # made while the file is being loaded is picked up by the next run
+        self._snapshots = {}
+
+    def _get_entries(self) -> dict:
+        """Gets the recorded files of this pipeline, keyed by file path."""
+        rows = self.postgresql_client.engine.execute(
+            self.table.select().where(self.table.c.pipeline_name == self.pipeline_name)
+        ).all()
+        return {row.file_path: row for row in rows}
+
+    def _get_snapshot(self, file_path: str) -> dict:
+        if file_path not in self._snapshots:
+            stat = os.stat(file_path)
+            self._snapshots[file_path] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "content_hash": compute_file_hash(file_path),
+            }
+        return self._snapshots[file_path]
+
+    def is_unchanged(self, file_path: str) -> bool:
+        """Returns True if the file was recorded and its content has not changed."""
+        file_path = os.path.realpath(file_path)
+        if not os.path.exists(file_path):
+            return False
+        entry = self._entries.get(file_path)
+        stat = os.stat(file_path)
+        if entry is not None and (stat.st_size, stat.st_mtime) == (
+            entry.size,
+            entry.mtime,
+        ):
+            return True
+        snapshot = self._get_snapshot(file_path)
+        if entry is None or snapshot["content_hash"] != entry.content_hash:
+            return False
+        # a touched file is recorded with its new mtime, so the next run does
+        # not hash it again
+        self.record(file_path)
+        return True
+
+    def record(self, file_path: str) -> None:
+        """Records the size, mtime and content hash of a processed file."""
+        file_path = os.path.realpath(file_path)
+        self.postgresql_client.upsert(
+            data=[
+                {
+                    "pipeline_name": self.pipeline_name,
+                    "file_path": file_path,
+                    **self._get_snapshot(file_path),
+                    "processed_at": datetime.now().isoformat(),
+                }
+            ],
+            table=self.table,
+            metadata=self.metadata,
+        )
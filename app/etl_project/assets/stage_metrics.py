@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+import pandas as pd
+
+# Counters summed across the calls of a stage. Peak memory is the maximum.
+STAGE_COUNTERS = ("seconds", "rows_in", "rows_out", "rows_rejected", "bytes_read")
+
+
+def read_peak_memory() -> int:
+    """
+    Returns the peak resident memory of the process in bytes, or None where
+    /proc is not available.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory() -> bool:
+    """
+    Resets the peak resident memory of the process. Linux only. The peak is
+    shared by every thread, so within a pipeline use `measure_peak_memory`.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+_peak_memory_lock = threading.Lock()
+_active_peak_memory_measurements = 0
+_peak_memory_measurements_started = 0
+
+
+class PeakMemory:
+    """The peak resident memory of a measurement, None if unavailable."""
+
+    def __init__(self):
+        self.bytes = None
+
+
+@contextmanager
+def measure_peak_memory() -> Iterator[PeakMemory]:
+    """
+    Measures the peak resident memory of the process while the block runs.
+
+    The peak is process-wide, so it is only reset when no other measurement
+    is active, and it is left unavailable for a block that overlapped another
+    measurement, such as a load on the overlap loader thread or a stage of a
+    concurrent run.
+    """
+    global _active_peak_memory_measurements, _peak_memory_measurements_started
+    with _peak_memory_lock:
+        _active_peak_memory_measurements += 1
+        _peak_memory_measurements_started += 1
+        started = _peak_memory_measurements_started
+        exclusive = _active_peak_memory_measurements == 1 and reset_peak_memory()
+    peak_memory = PeakMemory()
+    try:
+        yield peak_memory
+    finally:
+        with _peak_memory_lock:
+            _active_peak_memory_measurements -= 1
+            if exclusive and _peak_memory_measurements_started == started:
+                peak_memory.bytes = read_peak_memory()
+
+
+class StageRecord:
+    """The counts of one call of a stage, filled in by the caller."""
+
+    def __init__(self, rows_in: int = 0, bytes_read: int = 0):
+        self.rows_in = rows_in
+        self.rows_out = 0
+        self.rows_rejected = 0
+        self.bytes_read = bytes_read
+
+    def set_output(self, df: pd.DataFrame) -> None:
+        """
+        Counts the rows of a stage's output, and the rejected rows a transform
+        stores in `df.attrs["rows_rejected"]`.
+        """
+        self.rows_out = len(df)
+        self.rows_rejected = df.attrs.get("rows_rejected", 0)
+
+
+class StageMetrics:
+    """
+    Collects the wall time, row counts, bytes read and peak memory of the
+    stages of a pipeline run.
+
+    Calls of the same stage, such as the load of each chunk, are added up.
+    Peak memory is the highest resident memory of the process while a call
+    ran, the maximum over the calls. It is not measured for calls that
+    overlapped another measured stage, in this run or a concurrent one, and
+    is None for a stage none of whose calls could be measured.
+
+    Usage example:
+        stage_metrics = StageMetrics()
+        with stage_metrics.measure("transform", rows_in=len(df)) as stage:
+            df = transform_financial_data(df)
+            stage.set_output(df)
+        run_stats = {"stages": stage_metrics.to_dict()}
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(
+        self, stage: str, rows_in: int = 0, bytes_read: int = 0
+    ) -> Iterator[StageRecord]:
+        """Measures one call of a stage. The caller fills in the yielded record."""
+        record = StageRecord(rows_in=rows_in, bytes_read=bytes_read)
+        start = time.perf_counter()
+        try:
+            with measure_peak_memory() as peak_memory:
+                yield record
+        finally:
+            self.record(
+                stage,
+                seconds=time.perf_counter() - start,
+                rows_in=record.rows_in,
+                rows_out=record.rows_out,
+                rows_rejected=record.rows_rejected,
+                bytes_read=record.bytes_read,
+                peak_memory_bytes=peak_memory.bytes,
+            )
+
+    def measure_chunks(
+        self, stage: str, chunks: Iterable[pd.DataFrame], bytes_read: int = 0
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Measures the production of each chunk of an iterator as a call of
+        `stage`. `bytes_read` is counted with the first chunk.
+        """
+        iterator = iter(chunks)
+        while True:
+            with self.measure(stage, bytes_read=bytes_read) as record:
+                chunk = next(iterator, None)
+                if chunk is not None:
+                    record.rows_out = len(chunk)
+            if chunk is None:
+                return
+            bytes_read = 0
+            yield chunk
+
+    def record(
+        self,
+        stage: str,
+        seconds: float = 0.0,
+        rows_in: int = 0,
+        rows_out: int = 0,
+        rows_rejected: int = 0,
+        bytes_read: int = 0,
+        peak_memory_bytes: int = None,
+    ) -> None:
+        """Adds the counts of a stage call."""
+        with self._lock:
+            totals = self.stages.setdefault(
+                stage,
+                {counter: 0 for counter in STAGE_COUNTERS}
+                | {"peak_memory_bytes": None},
+            )
+            totals["seconds"] += seconds
+            totals["rows_in"] += rows_in
+            totals["rows_out"] += rows_out
+            totals["rows_rejected"] += rows_rejected
+            totals["bytes_read"] += bytes_read
+            if peak_memory_bytes is not None:
+                totals["peak_memory_bytes"] = max(
+                    totals["peak_memory_bytes"] or 0, peak_memory_bytes
+                )
+
+    def merge(self, stages: dict) -> None:
+        """Adds the stages of another run's `to_dict`, e.g. from a worker process."""
+        for stage, totals in stages.items():
+            self.record(
+                stage,
+                **{counter: totals[counter] for counter in STAGE_COUNTERS},
+                peak_memory_bytes=totals["peak_memory_bytes"],
+            )
+
+    def to_dict(self) -> dict:
+        """Returns the totals of each stage, with its rows out per second."""
+        with self._lock:
+            return {
+                stage: dict(
+                    totals,
+                    seconds=round(totals["seconds"], 4),
+                    rows_per_second=(
+                        round(totals["rows_out"] / totals["seconds"])
+                        if totals["seconds"]
+                        else None
+                    ),
+                )
+                for stage, totals in self.stages.items()
+            }
+
+    def write_prometheus_textfile(
+        self, file_path: str, pipeline_name: str, run_id: int = None
+    ) -> None:
+        """
+        Writes the stage metrics in the Prometheus text format, for the
+        node_exporter textfile collector. The file is replaced atomically.
+        """
+        metrics = [
+            ("seconds", "stage_duration_seconds", "Wall time of the stage"),
+            ("rows_in", "stage_rows_in", "Rows passed to the stage"),
+            ("rows_out", "stage_rows_out", "Rows produced by the stage"),
+            ("rows_rejected", "stage_rows_rejected", "Rows with rejected values"),
+            ("bytes_read", "stage_bytes_read", "Bytes read from source files"),
+            (
+                "peak_memory_bytes",
+                "stage_peak_memory_bytes",
+                "Peak resident memory while the stage ran",
+            ),
+        ]
+        stages = self.to_dict()
+        lines = []
+        for key, name, description in metrics:
+            lines.append(f"# HELP presupuesto_{name} {description}, last run.")
+            lines.append(f"# TYPE presupuesto_{name} gauge")
+            for stage, totals in stages.items():
+                if totals[key] is not None:
+                    lines.append(
+                        f'presupuesto_{name}{{pipeline="{pipeline_name}",'
+                        f'stage="{stage}"}} {totals[key]}'
+                    )
+        lines.append(
+            "# HELP presupuesto_last_run_timestamp_seconds End of the last run."
+        )
+        lines.append("# TYPE presupuesto_last_run_timestamp_seconds gauge")
+        lines.append(
+            f'presupuesto_last_run_timestamp_seconds{{pipeline="{pipeline_name}"}} '
+            f"{time.time():.0f}"
+        )
+        if run_id is not None:
+            lines.append("# HELP presupuesto_last_run_id Run id of the last run.")
+            lines.append("# TYPE presupuesto_last_run_id gauge")
+            lines.append(
+                f'presupuesto_last_run_id{{pipeline="{pipeline_name}"}} {run_id}'
+            )
+
+        temporary_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as textfile:
+            textfile.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, file_path)
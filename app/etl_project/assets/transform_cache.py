@@ -0,0 +1,162 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from etl_project.assets.presupuesto_etl import DATE_FORMATS, TRANSFORM_VERSION
+from etl_project.assets.source_manifest import compute_file_hash
+
+
+def arrow_to_dataframe(table: pa.Table) -> pd.DataFrame:
+    """Converts an Arrow table to the dataframe the transform produces."""
+    df = table.to_pandas()
+    # Arrow returns missing strings as None, pandas string operations give NaN
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+class TransformCache:
+    """
+    Caches transformed quarter dataframes as Parquet files.
+
+    A cached file is keyed by the content hash of its source file, the
+    `TRANSFORM_VERSION` and the date formats, so an edited source file or a
+    changed transform is never served from the cache. When the cache grows
+    past `max_bytes`, the least recently used files are removed.
+    """
+
+    def __init__(self, cache_folder_path: str, max_bytes: int = 1 << 30):
+        self.cache_folder_path = cache_folder_path
+        self.max_bytes = max_bytes
+        os.makedirs(cache_folder_path, exist_ok=True)
+
+    def get_cache_path(self, file_path: str, date_formats: tuple = DATE_FORMATS) -> str:
+        """Returns the path of the cached transform of a source file."""
+        key = hashlib.sha256(
+            json.dumps(
+                [compute_file_hash(file_path), TRANSFORM_VERSION, list(date_formats)]
+            ).encode()
+        ).hexdigest()[:32]
+        return os.path.join(
+            self.cache_folder_path, f"{Path(file_path).stem}-{key}.parquet"
+        )
+
+    def get(self, cache_path: str) -> pd.DataFrame:
+        """Reads a cached dataframe. Returns None if it is not cached."""
+        try:
+            df = arrow_to_dataframe(pq.read_table(cache_path))
+        except FileNotFoundError:
+            return None
+        # eviction removes the files with the oldest modification time first
+        os.utime(cache_path)
+        return df
+
+    def put(self, cache_path: str, df: pd.DataFrame) -> None:
+        """Writes a dataframe to the cache."""
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temporary_path)
+        os.replace(temporary_path, cache_path)
+
+    def get_or_create(
+        self,
+        file_path: str,
+        create: Callable[[], pd.DataFrame],
+        date_formats: tuple = DATE_FORMATS,
+        logger: logging.Logger = None,
+    ) -> pd.DataFrame:
+        """
+        Reads the cached transform of a source file, creating and caching it
+        with `create` if it is not cached.
+        """
+        logger = logger or logging.getLogger(__name__)
+        cache_path = self.get_cache_path(file_path=file_path, date_formats=date_formats)
+        df = self.get(cache_path)
+        if df is not None:
+            logger.info(f"Read transformed {Path(file_path).name} from cache")
+            return df
+        df = create()
+        self.put(cache_path, df)
+        return df
+
+    def _cached_files(self) -> list[os.DirEntry]:
+        return [
+            entry
+            for entry in os.scandir(self.cache_folder_path)
+            if entry.is_file() and entry.name.endswith(".parquet")
+        ]
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used files until the cache fits in `max_bytes`.
+
+        Returns:
+            The number of files removed
+        """
+        cached_files = sorted(
+            self._cached_files(), key=lambda entry: entry.stat().st_mtime
+        )
+        total_bytes = sum(entry.stat().st_size for entry in cached_files)
+        removed = 0
+        for entry in cached_files:
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= entry.stat().st_size
+            Path(entry.path).unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def invalidate(self, source_file_names: list[str] = None) -> int:
+        """
+        Removes the cached transforms of the given source files, or of all files.
+
+        Args:
+            source_file_names: source file names, e.g.
+                `Nuevo_Leon_Financials_2024_Q1_daily.csv`. None removes all.
+
+        Returns:
+            The number of files removed
+        """
+        stems = (
+            None
+            if source_file_names is None
+            else {Path(name).stem for name in source_file_names}
+        )
+        removed = 0
+        for entry in self._cached_files():
+            if stems is None or entry.name.rsplit("-", 1)[0] in stems:
+                Path(entry.path).unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Manage the cache of transformed presupuesto files."
+    )
+    parser.add_argument(
+        "command", choices=["invalidate", "evict"], help="cache operation to run"
+    )
+    parser.add_argument(
+        "source_files",
+        nargs="*",
+        help="source file names to invalidate, all files if omitted",
+    )
+    parser.add_argument("--cache-folder-path", default="./etl_project/transform_cache")
+    parser.add_argument("--max-bytes", type=int, default=1 << 30)
+    args = parser.parse_args()
+
+    transform_cache = TransformCache(
+        cache_folder_path=args.cache_folder_path, max_bytes=args.max_bytes
+    )
+    if args.command == "invalidate":
+        removed = transform_cache.invalidate(args.source_files or None)
+    else:
+        removed = transform_cache.evict()
+    print(f"Removed {removed} cached files from {args.cache_folder_path}")
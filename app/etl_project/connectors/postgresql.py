@@ -1,11 +1,90 @@
-from sqlalchemy import create_engine, Table, MetaData
-from sqlalchemy.engine import URL, CursorResult
+import io
+import threading
+from typing import Callable, Iterator
+import pandas as pd
+from sqlalchemy import create_engine, inspect, select, text, and_
+from sqlalchemy import Column, Index, Table, MetaData
+from sqlalchemy.engine import URL, Connection, CursorResult, Engine
+from sqlalchemy.sql import ClauseElement, Select
 from sqlalchemy.dialects import postgresql
 
 
+class _EngineState:
+    """An engine shared by every client of one database, with its schema cache."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        # (schema, table name) of tables known to exist
+        self.known_tables = set()
+        # (schema, table name) -> column names known to exist
+        self.known_columns = {}
+        # (schema, partitioned table name) -> names of its known partitions
+        self.known_partitions = {}
+
+
+_engine_registry: dict[str, _EngineState] = {}
+_engine_registry_lock = threading.Lock()
+
+
+def get_engine_state(
+    connection_url: URL,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_pre_ping: bool = True,
+    pool_recycle: int = 1800,
+    pool_timeout: float = 30,
+) -> _EngineState:
+    """
+    Returns the process-wide engine for a connection url, creating it on first use.
+
+    The pool settings only apply when the engine is created; later callers with
+    the same url share the existing engine and its connection pool.
+
+    Args:
+        connection_url: sqlalchemy connection url
+        pool_size: number of connections kept open in the pool
+        max_overflow: connections allowed above `pool_size` under load
+        pool_pre_ping: test connections before handing them out, so
+            connections dropped by the server are replaced transparently
+        pool_recycle: seconds after which a pooled connection is reopened
+        pool_timeout: seconds to wait for a free connection when
+            `pool_size + max_overflow` connections are checked out
+
+    Returns:
+        The engine state shared by all clients of the url
+    """
+    key = connection_url.render_as_string(hide_password=False)
+    with _engine_registry_lock:
+        if key not in _engine_registry:
+            _engine_registry[key] = _EngineState(
+                create_engine(
+                    connection_url,
+                    pool_size=pool_size,
+                    max_overflow=max_overflow,
+                    pool_pre_ping=pool_pre_ping,
+                    pool_recycle=pool_recycle,
+                    pool_timeout=pool_timeout,
+                )
+            )
+        return _engine_registry[key]
+
+
+def dispose_engines() -> None:
+    """Closes the pooled connections of every registered engine and forgets them."""
+    with _engine_registry_lock:
+        for engine_state in _engine_registry.values():
+            engine_state.engine.dispose()
+        _engine_registry.clear()
+
+
 class PostgreSqlClient:
     """
     A client for querying postgresql database.
+
+    Clients with the same connection details share one engine, connection pool
+    and cache of tables known to exist, so constructing a client per pipeline
+    run does not open new connections or repeat catalog queries.
     """
 
     def __init__(
@@ -15,6 +94,11 @@ class PostgreSqlClient:
         username: str,
         password: str,
         port: int = 5432,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_pre_ping: bool = True,
+        pool_recycle: int = 1800,
+        pool_timeout: float = 30,
     ):
         self.host_name = server_name
         self.database_name = database_name
@@ -31,31 +115,531 @@ class PostgreSqlClient:
             database=database_name,
         )
 
-        self.engine = create_engine(connection_url)
+        self._engine_state = get_engine_state(
+            connection_url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=pool_pre_ping,
+            pool_recycle=pool_recycle,
+            pool_timeout=pool_timeout,
+        )
+        self.engine = self._engine_state.engine
 
     def select_all(self, table: Table) -> list[dict]:
         return [dict(row) for row in self.engine.execute(table.select()).all()]
 
+    @staticmethod
+    def _build_select(
+        table: Table, columns: list[str] = None, where: "ClauseElement | dict" = None
+    ) -> Select:
+        """
+        Selects `columns` of a table, or every column, filtered by a sqlalchemy
+        expression or a dict of column -> value equalities.
+        """
+        statement = select(
+            *([table.c[column] for column in columns] if columns else [table])
+        )
+        if isinstance(where, dict):
+            where = and_(*[table.c[column] == value for column, value in where.items()])
+        if where is not None:
+            statement = statement.where(where)
+        return statement
+
+    def iter_row_batches(
+        self,
+        table: Table,
+        columns: list[str] = None,
+        where: "ClauseElement | dict" = None,
+        batch_size: int = 10_000,
+    ) -> Iterator[list[dict]]:
+        """
+        Reads a table through a server-side cursor, `batch_size` rows at a time.
+
+        Only one batch is held in memory, and only the selected columns and
+        filtered rows are sent by the server. The connection is held until the
+        iterator is exhausted or closed.
+
+        Usage example:
+            for rows in client.iter_row_batches(
+                table, columns=["DATE", "REVENUE"], where={"QUARTER": "2024Q1"}
+            ):
+                ...
+
+        Args:
+            table: sqlalchemy table
+            columns: names of the columns to read, all if None
+            where: sqlalchemy expression, e.g. `table.c.DATE >= date(2024, 4, 1)`,
+                or a dict of column -> value equalities
+            batch_size: rows fetched from the server at a time
+
+        Returns:
+            An iterator of lists of rows as dicts
+        """
+        for keys, batch in self._iter_batches(table, columns, where, batch_size):
+            yield [dict(zip(keys, row)) for row in batch]
+
+    def iter_dataframes(
+        self,
+        table: Table,
+        columns: list[str] = None,
+        where: "ClauseElement | dict" = None,
+        chunk_rows: int = 100_000,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Reads a table through a server-side cursor as dataframes of up to
+        `chunk_rows` rows. See `iter_row_batches` for the arguments.
+        """
+        for keys, batch in self._iter_batches(table, columns, where, chunk_rows):
+            yield pd.DataFrame.from_records(batch, columns=keys)
+
+    def _iter_batches(
+        self,
+        table: Table,
+        columns: list[str],
+        where: "ClauseElement | dict",
+        batch_size: int,
+    ) -> Iterator[tuple[list[str], list[tuple]]]:
+        statement = self._build_select(table, columns, where)
+        with self.engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True, max_row_buffer=batch_size
+            ).execute(statement)
+            keys = list(result.keys())
+            for batch in result.partitions(batch_size):
+                yield keys, batch
+
     def create_table(self, metadata: MetaData) -> None:
         """
         Creates table provided in the metadata object
         """
-        metadata.create_all(self.engine)
+        self.ensure_tables(metadata)
+
+    def ensure_tables(self, metadata: MetaData) -> None:
+        """
+        Creates the tables in the metadata object that are not known to exist.
+
+        Tables created or found by an earlier call in this process are skipped
+        without querying the catalog. Tables dropped with `drop_table` are
+        forgotten and checked again on the next call.
+        """
+        engine_state = self._engine_state
+        with engine_state.lock:
+            unknown_tables = [
+                table
+                for table in metadata.sorted_tables
+                if (table.schema, table.name) not in engine_state.known_tables
+            ]
+            if unknown_tables:
+                metadata.create_all(self.engine, tables=unknown_tables)
+                engine_state.known_tables.update(
+                    (table.schema, table.name) for table in unknown_tables
+                )
+
+    def add_missing_columns(self, table: Table) -> None:
+        """
+        Adds columns defined on the table that the existing database table lacks.
+        """
+        engine_state = self._engine_state
+        table_key = (table.schema, table.name)
+        column_names = {column.name for column in table.columns}
+        with engine_state.lock:
+            if column_names <= engine_state.known_columns.get(table_key, set()):
+                return
+            existing_columns = {
+                column["name"]
+                for column in inspect(self.engine).get_columns(
+                    table.name, schema=table.schema
+                )
+            }
+            preparer = self.engine.dialect.identifier_preparer
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    self.engine.execute(
+                        f"alter table {preparer.format_table(table)} "
+                        f"add column if not exists {preparer.quote(column.name)} {column_type};"
+                    )
+            engine_state.known_columns[table_key] = existing_columns | column_names
 
     def drop_table(self, table_name: str) -> None:
         self.engine.execute(f"drop table if exists {table_name};")
+        self._forget_table(table_name)
+
+    def _forget_table(self, table_name: str) -> None:
+        """Removes a dropped table from the cache of tables known to exist."""
+        engine_state = self._engine_state
+        table_name = table_name.strip('"')
+        with engine_state.lock:
+            for table_key in list(engine_state.known_tables):
+                if table_key[1] == table_name:
+                    engine_state.known_tables.discard(table_key)
+            for table_key in list(engine_state.known_columns):
+                if table_key[1] == table_name:
+                    del engine_state.known_columns[table_key]
+            # partitions are dropped with their partitioned table
+            for table_key in list(engine_state.known_partitions):
+                if table_key[1] == table_name:
+                    for partition_name in engine_state.known_partitions.pop(table_key):
+                        engine_state.known_tables.discard(
+                            (table_key[0], partition_name)
+                        )
+
+    def ensure_partitions(
+        self, table: Table, partitions: dict[str, tuple], default: bool = True
+    ) -> None:
+        """
+        Creates the range partitions of a partitioned table that are not known
+        to exist.
+
+        Args:
+            table: sqlalchemy table created with `postgresql_partition_by`
+            partitions: partition name -> (from, to) bounds, `to` exclusive
+            default: also create a `{table}_default` partition for rows
+                outside every range
+
+        Raises:
+            Exception: if the table exists and is not partitioned
+        """
+        engine_state = self._engine_state
+        partition_names = list(partitions) + (
+            [f"{table.name}_default"] if default else []
+        )
+        with engine_state.lock:
+            if all(
+                (table.schema, name) in engine_state.known_tables
+                for name in partition_names
+            ):
+                return
+            parent_name = self.engine.dialect.identifier_preparer.format_table(table)
+            with self.engine.begin() as connection:
+                is_partitioned = connection.execute(
+                    text(
+                        "select exists (select 1 from pg_partitioned_table "
+                        "where partrelid = to_regclass(:table_name))"
+                    ),
+                    table_name=parent_name,
+                ).scalar()
+                if not is_partitioned:
+                    raise Exception(
+                        f"Table {parent_name} is not partitioned. Drop it, or "
+                        "rename it and copy its rows back after the first load, "
+                        "to load it as a partitioned table."
+                    )
+                for name, (start, end) in partitions.items():
+                    connection.execute(
+                        f"create table if not exists "
+                        f"{self._format_partition(table, name)} "
+                        f"partition of {parent_name} "
+                        f"for values from ('{start}') to ('{end}')"
+                    )
+                if default:
+                    connection.execute(
+                        f"create table if not exists "
+                        f"{self._format_partition(table, f'{table.name}_default')} "
+                        f"partition of {parent_name} default"
+                    )
+            engine_state.known_tables.update(
+                (table.schema, name) for name in partition_names
+            )
+            engine_state.known_partitions.setdefault(
+                (table.schema, table.name), set()
+            ).update(partition_names)
+
+    def _format_partition(self, table: Table, partition_name: str) -> str:
+        """Quotes a partition name, in the schema of its partitioned table."""
+        preparer = self.engine.dialect.identifier_preparer
+        if table.schema:
+            return f"{preparer.quote_schema(table.schema)}.{preparer.quote(partition_name)}"
+        return preparer.quote(partition_name)
+
+    @staticmethod
+    def get_partition_table(table: Table, partition_name: str) -> Table:
+        """Returns a table for one partition of `table`, to load it directly."""
+        return table.to_metadata(MetaData(), name=partition_name)
+
+    def replace_partition(
+        self,
+        data: pd.DataFrame,
+        table: Table,
+        partition_name: str,
+        bounds: tuple,
+        partition_column: str,
+    ) -> None:
+        """
+        Replaces the rows of one range partition.
+
+        The rows are copied into a standalone table, which gets its primary key
+        and a check constraint matching the partition bounds. The old partition
+        is then detached and the new table attached in its place in one short
+        transaction, so reads and loads of the other partitions are not blocked
+        while the rows are copied, and readers of this partition see either all
+        old or all new rows. The check constraint lets the attach skip scanning
+        the new rows.
+
+        Args:
+            data: the rows of the partition
+            table: the partitioned sqlalchemy table
+            partition_name: name of the partition, created by `ensure_partitions`
+            bounds: (from, to) bounds of the partition, `to` exclusive
+            partition_column: the column the table is partitioned by
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        parent_name = preparer.format_table(table)
+        partition = self._format_partition(table, partition_name)
+        rebuild_name = f"{partition_name}_rebuild"
+        rebuild = self._format_partition(table, rebuild_name)
+        start, end = bounds
+        columns = [column.name for column in table.columns if column.name in data]
+        key_list = ", ".join(
+            preparer.quote(column.name) for column in table.primary_key.columns
+        )
+        bounds_constraint = preparer.quote(f"{rebuild_name}_bounds")
+        quoted_column = preparer.quote(partition_column)
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP TABLE IF EXISTS {rebuild}")
+            cursor.execute(
+                f"CREATE TABLE {rebuild} (LIKE {parent_name} INCLUDING DEFAULTS)"
+            )
+            self._copy_dataframe(cursor, data, rebuild, columns)
+            # indexes and constraints are cheaper to build after the copy
+            cursor.execute(
+                f"ALTER TABLE {rebuild} ADD CONSTRAINT {bounds_constraint} "
+                f"CHECK ({quoted_column} >= '{start}' AND {quoted_column} < '{end}')"
+            )
+            cursor.execute(f"ALTER TABLE {rebuild} ADD PRIMARY KEY ({key_list})")
+            connection.commit()
+
+            cursor.execute(f"ALTER TABLE {parent_name} DETACH PARTITION {partition}")
+            cursor.execute(
+                f"ALTER TABLE {parent_name} ATTACH PARTITION {rebuild} "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+            cursor.execute(f"DROP TABLE {partition}")
+            cursor.execute(
+                f"ALTER TABLE {rebuild} RENAME TO {preparer.quote(partition_name)}"
+            )
+            cursor.execute(
+                f"ALTER INDEX {self._format_partition(table, f'{rebuild_name}_pkey')} "
+                f"RENAME TO {preparer.quote(f'{partition_name}_pkey')}"
+            )
+            cursor.execute(
+                f"ALTER TABLE {partition} DROP CONSTRAINT {bounds_constraint}"
+            )
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
 
     def insert(self, data: list[dict], table: Table, metadata: MetaData) -> None:
-        metadata.create_all(self.engine)
+        self.ensure_tables(metadata)
         insert_statement = postgresql.insert(table).values(data)
         self.engine.execute(insert_statement)
 
-    def overwrite(self, data: list[dict], table: Table, metadata: MetaData) -> None:
-        self.drop_table(table.name)
-        self.insert(data=data, table=table, metadata=metadata)
+    def overwrite(
+        self,
+        data: list[dict],
+        table: Table,
+        metadata: MetaData,
+        keep_previous: bool = False,
+    ) -> None:
+        """
+        Replaces the rows of a table through a shadow table swap, see
+        `swap_in_shadow_table`.
+        """
+
+        def load_shadow(connection, shadow_table: Table) -> None:
+            if data:
+                connection.execute(postgresql.insert(shadow_table).values(data))
+
+        self.swap_in_shadow_table(
+            table=table, load_shadow=load_shadow, keep_previous=keep_previous
+        )
+
+    def swap_in_shadow_table(
+        self,
+        table: Table,
+        load_shadow: Callable[[Connection, Table], None],
+        keep_previous: bool = False,
+    ) -> None:
+        """
+        Rebuilds a table in a shadow table and swaps it in with renames.
+
+        `load_shadow` fills `{table}_shadow`, created without indexes. Then the
+        primary key and the table's indexes are built on the shadow table, and
+        the live table is renamed to `{table}_previous`, or dropped, and the
+        shadow renamed to `table`. Everything runs in one transaction:
+        readers keep seeing the old rows until the commit, are blocked only for
+        the renames at the end, and a failed load leaves the table as it was.
+
+        Args:
+            table: sqlalchemy table to replace
+            load_shadow: called with the connection of the transaction and the
+                shadow table to load the rows
+            keep_previous: keep the replaced table as `{table}_previous`,
+                replacing an older one, instead of dropping it
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        shadow_name = f"{table.name}_shadow"
+        previous_name = f"{table.name}_previous"
+        shadow_metadata = MetaData()
+        shadow_table = Table(
+            shadow_name,
+            shadow_metadata,
+            *[
+                Column(column.name, column.type, nullable=column.nullable)
+                for column in table.columns
+            ],
+            schema=table.schema,
+        )
+        # (shadow name, final name, previous name) of each index
+        index_names = [
+            (
+                f"{shadow_name}_pkey",
+                table.primary_key.name or f"{table.name}_pkey",
+                f"{previous_name}_pkey",
+            )
+        ]
+        shadow_indexes = []
+        for index in table.indexes:
+            index_names.append(
+                (f"{index.name}_shadow", index.name, f"{index.name}_previous")
+            )
+            shadow_indexes.append(
+                Index(
+                    f"{index.name}_shadow",
+                    *[shadow_table.c[column.name] for column in index.columns],
+                    unique=index.unique,
+                )
+            )
+
+        def format_name(name: str) -> str:
+            if table.schema:
+                return f"{preparer.quote_schema(table.schema)}.{preparer.quote(name)}"
+            return preparer.quote(name)
+
+        key_list = ", ".join(
+            preparer.quote(column.name) for column in table.primary_key.columns
+        )
+        with self.engine.begin() as connection:
+            connection.execute(f"drop table if exists {format_name(shadow_name)}")
+            shadow_metadata.create_all(connection)
+            load_shadow(connection, shadow_table)
+            # indexes are cheaper to build once the rows are loaded
+            connection.execute(
+                f"alter table {format_name(shadow_name)} add constraint "
+                f"{preparer.quote(f'{shadow_name}_pkey')} primary key ({key_list})"
+            )
+            for index in shadow_indexes:
+                index.create(connection)
+
+            if keep_previous:
+                connection.execute(f"drop table if exists {format_name(previous_name)}")
+                connection.execute(
+                    f"alter table if exists {format_name(table.name)} "
+                    f"rename to {preparer.quote(previous_name)}"
+                )
+                for _, index_name, previous_index_name in index_names:
+                    connection.execute(
+                        f"alter index if exists {format_name(index_name)} "
+                        f"rename to {preparer.quote(previous_index_name)}"
+                    )
+            else:
+                connection.execute(f"drop table if exists {format_name(table.name)}")
+            connection.execute(
+                f"alter table {format_name(shadow_name)} "
+                f"rename to {preparer.quote(table.name)}"
+            )
+            for shadow_index_name, index_name, _ in index_names:
+                connection.execute(
+                    f"alter index {format_name(shadow_index_name)} "
+                    f"rename to {preparer.quote(index_name)}"
+                )
+
+        self._forget_table(table.name)
+        self._forget_table(previous_name)
+        with self._engine_state.lock:
+            self._engine_state.known_tables.add((table.schema, table.name))
+
+    def _copy_dataframe(
+        self, cursor, data: pd.DataFrame, table_name: str, columns: list[str]
+    ) -> None:
+        """
+        Streams the dataframe columns into a table with `COPY ... FROM STDIN`.
+
+        Empty fields are loaded as NULL, so float NaN is written out as 'NaN'
+        to be stored as NaN, the way INSERT statements bind it.
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        column_list = ", ".join(preparer.quote(column) for column in columns)
+        nan_columns = {
+            column: data[column].astype(object).where(data[column].notna(), "NaN")
+            for column in columns
+            if data[column].dtype.kind == "f" and data[column].isna().any()
+        }
+        if nan_columns:
+            data = data.assign(**nan_columns)
+        buffer = io.BytesIO()
+        data.to_csv(buffer, columns=columns, header=False, index=False)
+        buffer.seek(0)
+        cursor.execute(
+            f"COPY {table_name} ({column_list}) FROM STDIN WITH (FORMAT csv)",
+            stream=buffer,
+        )
+
+    def copy_insert(self, data: pd.DataFrame, table: Table, metadata: MetaData) -> None:
+        """
+        Inserts a dataframe with the COPY protocol.
+
+        The dataframe is written to an in-memory CSV buffer and streamed to the
+        server with `COPY ... FROM STDIN`, which avoids building an INSERT
+        statement with one bind parameter per value. Missing values are loaded
+        as NULL, except float NaN, which is stored as NaN.
+        """
+        self.ensure_tables(metadata)
+        columns = [column.name for column in table.columns if column.name in data]
+        table_name = self.engine.dialect.identifier_preparer.format_table(table)
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            self._copy_dataframe(cursor, data, table_name, columns)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def copy_overwrite(
+        self,
+        data: pd.DataFrame,
+        table: Table,
+        metadata: MetaData,
+        keep_previous: bool = False,
+    ) -> None:
+        """
+        Replaces the rows of a table with a dataframe copied into a shadow
+        table, see `swap_in_shadow_table`.
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        columns = [column.name for column in table.columns if column.name in data]
+
+        def load_shadow(connection, shadow_table: Table) -> None:
+            self._copy_dataframe(
+                connection.connection.cursor(),
+                data,
+                preparer.format_table(shadow_table),
+                columns,
+            )
+
+        self.swap_in_shadow_table(
+            table=table, load_shadow=load_shadow, keep_previous=keep_previous
+        )
 
     def upsert(self, data: list[dict], table: Table, metadata: MetaData) -> None:
-        metadata.create_all(self.engine)
+        self.ensure_tables(metadata)
         key_columns = [
             pk_column.name for pk_column in table.primary_key.columns.values()
         ]
@@ -67,3 +651,88 @@ class PostgreSqlClient:
             },
         )
         self.engine.execute(upsert_statement)
+
+    def staged_upsert(
+        self,
+        data: pd.DataFrame,
+        table: Table,
+        metadata: MetaData,
+        batch_size: int = 100_000,
+        commit_every_batch: bool = False,
+        before_merge: Callable[[object, str, str], None] = None,
+        before_commit: Callable[[object], None] = None,
+        key_columns: list[str] = None,
+    ) -> None:
+        """
+        Upserts a dataframe through a session temp table.
+
+        Each batch of rows is copied into a temp table with the COPY protocol
+        and merged into `table` with one set-based
+        `INSERT ... SELECT ... ON CONFLICT DO UPDATE`, so the number of rows is
+        not limited by the number of bind parameters. The conflict handling is
+        the same as `upsert`.
+
+        Args:
+            data: dataframe to upsert
+            table: sqlalchemy table
+            metadata: sqlalchemy metadata
+            batch_size: maximum number of rows copied and merged at a time
+            commit_every_batch: commit after each batch to keep transactions
+                and locks short, instead of one transaction for all batches
+            before_merge: called with the cursor and the quoted staging and
+                target table names before each batch is merged, e.g. to
+                compare the staged rows with the rows they replace
+            before_commit: called with the cursor before each commit, in the
+                transaction of the merged rows
+            key_columns: the columns of the unique index rows conflict on, the
+                primary key if not given
+        """
+        self.ensure_tables(metadata)
+        preparer = self.engine.dialect.identifier_preparer
+        key_columns = key_columns or [
+            pk_column.name for pk_column in table.primary_key.columns.values()
+        ]
+        columns = [column.name for column in table.columns if column.name in data]
+        target_name = preparer.format_table(table)
+        staging_name = preparer.quote(f"staging_{table.name}")
+        column_list = ", ".join(preparer.quote(column) for column in columns)
+        update_list = ", ".join(
+            f"{preparer.quote(column)} = EXCLUDED.{preparer.quote(column)}"
+            for column in columns
+            if column not in key_columns
+        )
+        merge_statement = (
+            f"INSERT INTO {target_name} ({column_list}) "
+            f"SELECT {column_list} FROM {staging_name} "
+            f"ON CONFLICT ({', '.join(preparer.quote(k) for k in key_columns)}) "
+            + (f"DO UPDATE SET {update_list}" if update_list else "DO NOTHING")
+        )
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{staging_name}")
+            cursor.execute(
+                f"CREATE TEMP TABLE {staging_name} "
+                f"(LIKE {target_name} INCLUDING DEFAULTS)"
+            )
+            for start in range(0, len(data), batch_size):
+                batch = data.iloc[start : start + batch_size]
+                cursor.execute(f"TRUNCATE {staging_name}")
+                self._copy_dataframe(cursor, batch, staging_name, columns)
+                if before_merge is not None:
+                    before_merge(cursor, staging_name, target_name)
+                cursor.execute(merge_statement)
+                if commit_every_batch:
+                    if before_commit is not None:
+                        before_commit(cursor)
+                    connection.commit()
+            cursor.execute(f"DROP TABLE {staging_name}")
+            if before_commit is not None and not commit_every_batch:
+                before_commit(cursor)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
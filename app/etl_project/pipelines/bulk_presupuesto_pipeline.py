@@ -1,23 +1,180 @@
 import os
+import signal
+import sys
 import time
+from collections import Counter
+from itertools import groupby
 from pathlib import Path
+from typing import Iterator
 import yaml
 import pandas as pd
 from dotenv import load_dotenv
 import schedule
-from sqlalchemy import Table, Column, Integer, String, MetaData, Float, Date
+from sqlalchemy import MetaData, Table
 from etl_project.assets.presupuesto_etl import (
-    extract_financial_data,
+    DATE_FORMATS,
+    add_row_hash,
+    build_financials_table,
+    compact_financial_data,
+    concat_financial_data,
+    discover_financial_data_files,
+    extract_financial_data_chunks,
+    filter_changed_rows,
+    get_financial_data_directory,
+    get_financial_data_file_path,
+    get_memory_usage,
+    restore_financial_data,
     transform_financial_data,
     load,
 )
+from etl_project.assets.pipeline_execution import (
+    extract_transform_quarters,
+    run_overlapped,
+)
 from etl_project.assets.pipeline_logging import PipelineLogging
+from etl_project.assets.run_triggers import watch_and_run
+from etl_project.assets.data_validation import RowQuarantine
+from etl_project.assets.financial_rollups import FinancialsRollup
 from etl_project.assets.metadata_logging import MetaDataLogging, MetaDataLoggingStatus
+from etl_project.assets.source_manifest import SourceManifest
+from etl_project.assets.stage_metrics import StageMetrics
+from etl_project.assets.transform_cache import TransformCache
 from etl_project.connectors.postgresql import PostgreSqlClient
 
 
-def pipeline(config: dict, pipeline_logging: PipelineLogging):
+def _load_dataframe(
+    df: pd.DataFrame,
+    postgresql_client: PostgreSqlClient,
+    table: Table,
+    metadata: MetaData,
+    config: dict,
+    row_counts: Counter,
+    stage_metrics: StageMetrics,
+    rollup: FinancialsRollup = None,
+    quarantine: RowQuarantine = None,
+) -> None:
+    """
+    Upserts transformed rows, skipping unchanged rows if `row_hash` is set.
+    With `rebuild_partitions` the partitions the rows belong to are replaced,
+    and with `rebuild_tables` the whole table. With a `quarantine`, rows
+    failing validation are quarantined instead of loaded.
+    """
+    if quarantine is not None:
+        with stage_metrics.measure("validate", rows_in=len(df)) as stage:
+            df = quarantine.validate(df, source_table=table.name)
+            stage.rows_out = len(df)
+            stage.rows_rejected = stage.rows_in - len(df)
+    with stage_metrics.measure("load", rows_in=len(df)) as stage:
+        if config.get("compact_dtypes"):
+            df = restore_financial_data(df)
+        load_method = "upsert"
+        if config.get("rebuild_partitions") or config.get("rebuild_tables"):
+            load_method = (
+                "replace_partitions"
+                if config.get("rebuild_partitions")
+                else "copy_overwrite"
+            )
+            if config.get("row_hash"):
+                df = add_row_hash(df)
+            row_counts["rows_replaced"] += len(df)
+        elif config.get("row_hash"):
+            df, changed_row_counts = filter_changed_rows(
+                df=df, postgresql_client=postgresql_client, table=table
+            )
+            row_counts.update(changed_row_counts)
+        load(
+            df=df,
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            load_method=load_method,
+            batch_size=config.get("upsert_batch_rows", 100_000),
+            commit_every_batch=config.get("commit_every_batch", False),
+            partition_workers=config.get("partition_load_workers", 4),
+            keep_previous_table=config.get("keep_previous_table", False),
+            rollup=rollup,
+        )
+        stage.rows_out = len(df)
+
+
+def _compact_dataframe(
+    df: pd.DataFrame, config: dict, pipeline_logging: PipelineLogging, label: str
+) -> pd.DataFrame:
+    """Stores a transformed frame in compact dtypes if `compact_dtypes` is set."""
+    compact_options = config.get("compact_dtypes")
+    if not compact_options:
+        return df
+    memory_before = get_memory_usage(df)
+    df = compact_financial_data(
+        df, **(compact_options if isinstance(compact_options, dict) else {})
+    )
+    pipeline_logging.logger.info(
+        f"Compacted {label} in memory: {memory_before / 2**20:.2f} MB -> "
+        f"{get_memory_usage(df) / 2**20:.2f} MB"
+    )
+    return df
+
+
+def _stream_chunks(
+    year_quarters: list[tuple[int, str]],
+    config: dict,
+    pipeline_logging: PipelineLogging,
+    stage_metrics: StageMetrics,
+) -> Iterator[tuple[int, str, pd.DataFrame]]:
+    """Extracts and transforms quarter files in chunks of `chunk_rows` rows."""
+    for year, q in year_quarters:
+        file_path = get_financial_data_file_path(year=year, quarter=q)
+        for chunk_number, extracted_chunk in enumerate(
+            stage_metrics.measure_chunks(
+                "extract",
+                extract_financial_data_chunks(
+                    year=year,
+                    quarter=q,
+                    chunk_rows=config.get("chunk_rows"),
+                    csv_engine=config.get("csv_engine", "pandas"),
+                ),
+                bytes_read=(
+                    os.path.getsize(file_path) if os.path.exists(file_path) else 0
+                ),
+            ),
+            start=1,
+        ):
+            with stage_metrics.measure(
+                "transform", rows_in=len(extracted_chunk)
+            ) as stage:
+                df_transformed = transform_financial_data(
+                    df=extracted_chunk,
+                    date_formats=config.get("date_formats", DATE_FORMATS),
+                    logger=pipeline_logging.logger,
+                )
+                stage.set_output(df_transformed)
+            yield year, f"{q} chunk {chunk_number}", df_transformed
+
+
+def pipeline(
+    config: dict,
+    pipeline_logging: PipelineLogging,
+    source_manifest: SourceManifest = None,
+    stage_metrics: StageMetrics = None,
+) -> dict:
     pipeline_logging.logger.info("Starting full year pipeline run")
+    stage_metrics = stage_metrics or StageMetrics()
+    if config.get("rebuild_partitions") and (
+        not config.get("partition_by") or config.get("chunk_rows")
+    ):
+        raise Exception(
+            "rebuild_partitions needs partition_by, and whole quarters: "
+            "it cannot be used with chunk_rows"
+        )
+    if config.get("rebuild_tables") and (
+        config.get("partition_by")
+        or config.get("chunk_rows")
+        or config.get("overlap_load")
+    ):
+        raise Exception(
+            "rebuild_tables loads whole years: it cannot be used with "
+            "chunk_rows or overlap_load. Use rebuild_partitions with partition_by."
+        )
 
     # set up environment variables
     pipeline_logging.logger.info("Getting pipeline environment variables")
@@ -27,55 +184,191 @@ def pipeline(config: dict, pipeline_logging: PipelineLogging):
     DB_PASSWORD = os.environ.get("DB_PASSWORD")
     PORT = os.environ.get("PORT")
 
-    # extract
-    pipeline_logging.logger.info("Extracting bulk data from Presupuesto Directory")
-
-    quarters = config.get("quarters")
-    transformed_dfs = []
-
-    for q in quarters:
-
-        extracted_quarter_data = extract_financial_data(
-            year=config.get("year"), quarter=q
-        )
-
-        df_transformed = transform_financial_data(df=extracted_quarter_data)
-
-        transformed_dfs.append(df_transformed)
-
-    pipeline_logging.logger.info("Transforming Presupuesto dataframes")
-    final_df = pd.concat(transformed_dfs, ignore_index=True)
-
-    # load
-    pipeline_logging.logger.info("Loading data to postgres")
+    # clients share one pooled engine per database across scheduled runs
     postgresql_client = PostgreSqlClient(
         server_name=SERVER_NAME,
         database_name=DATABASE_NAME,
         username=DB_USERNAME,
         password=DB_PASSWORD,
         port=PORT,
+        **config.get("database_pool", {}),
     )
     metadata = MetaData()
-    table = Table(
-        f"Nuevo_Leon_Financials_{config.get('year')}",
-        metadata,
-        Column("DATE", Date, primary_key=True),
-        Column("CURRENCY", String),
-        Column("REVENUE", Float),
-        Column("EXPENSES", Float),
-        Column("TAX_INCOME", Float),
-        Column("DEBT", Float),
-        Column("GDP_CONTRIBUTION_PERCENTAGE", Float),
-        Column("QUARTER", String),
-    )
-    load(
-        df=final_df,
-        postgresql_client=postgresql_client,
-        table=table,
-        metadata=metadata,
-        load_method="upsert",
+    row_counts = Counter()
+    rollup = None
+    if config.get("rollup_periods"):
+        rollup = FinancialsRollup(
+            postgresql_client=postgresql_client, periods=config.get("rollup_periods")
+        )
+    quarantine = None
+    if config.get("validate_rows"):
+        quarantine = RowQuarantine(postgresql_client=postgresql_client)
+    # years and quarters not set in the config are found in the directory
+    discovered_files = discover_financial_data_files()
+    years = (
+        config.get("years")
+        or ([config.get("year")] if config.get("year") else None)
+        or sorted({year for year, _ in discovered_files})
     )
+    tables = {
+        year: build_financials_table(
+            table_name=f"Nuevo_Leon_Financials_{year}",
+            metadata=metadata,
+            row_hash=config.get("row_hash", False),
+            partition_by=config.get("partition_by"),
+            year=year,
+        )
+        for year in years
+    }
+
+    # skip quarter files that have not changed since they were last loaded
+    year_quarters = []
+    files_skipped = 0
+    for year in years:
+        quarters = config.get("quarters") or [
+            q for file_year, q in discovered_files if file_year == year
+        ]
+        unchanged_quarters = set()
+        if source_manifest is not None:
+            unchanged_quarters = {
+                q
+                for q in quarters
+                if source_manifest.is_unchanged(
+                    get_financial_data_file_path(year=year, quarter=q)
+                )
+            }
+            # a rebuilt table needs every quarter of the year once one changed
+            if config.get("rebuild_tables") and unchanged_quarters != set(quarters):
+                unchanged_quarters = set()
+        for q in quarters:
+            if q in unchanged_quarters:
+                pipeline_logging.logger.info(
+                    "Skipping unchanged file "
+                    f"{get_financial_data_file_path(year=year, quarter=q)}"
+                )
+                files_skipped += 1
+            else:
+                year_quarters.append((year, q))
+
+    chunk_rows = config.get("chunk_rows")
+    if not year_quarters:
+        batches = iter(())
+    elif chunk_rows:
+        # extract and transform one bounded chunk at a time
+        pipeline_logging.logger.info(
+            f"Streaming Presupuesto files in chunks of {chunk_rows} rows"
+        )
+        batches = _stream_chunks(
+            year_quarters=year_quarters,
+            config=config,
+            pipeline_logging=pipeline_logging,
+            stage_metrics=stage_metrics,
+        )
+    else:
+        # extract and transform, in worker processes if configured
+        workers = config.get("workers", 1)
+        transform_cache = None
+        if config.get("transform_cache_path"):
+            transform_cache = TransformCache(
+                cache_folder_path=config.get("transform_cache_path"),
+                max_bytes=config.get("transform_cache_max_bytes", 1 << 30),
+            )
+        pipeline_logging.logger.info(
+            f"Extracting and transforming bulk data from Presupuesto Directory "
+            f"with {workers} worker(s)"
+        )
+        transformed_quarters = extract_transform_quarters(
+            year_quarters=year_quarters,
+            date_formats=config.get("date_formats", DATE_FORMATS),
+            workers=workers,
+            logger=pipeline_logging.logger,
+            transform_cache=transform_cache,
+            stage_metrics=stage_metrics,
+            csv_engine=config.get("csv_engine", "pandas"),
+        )
+        transformed_quarters = (
+            (
+                year,
+                q,
+                _compact_dataframe(
+                    df=df_transformed,
+                    config=config,
+                    pipeline_logging=pipeline_logging,
+                    label=f"{year} {q}",
+                ),
+            )
+            for year, q, df_transformed in transformed_quarters
+        )
+        if config.get("overlap_load"):
+            batches = transformed_quarters
+        else:
+            # load each year once all of its quarters are transformed
+            batches = (
+                (
+                    year,
+                    "all quarters",
+                    concat_financial_data(
+                        [df_transformed for _, _, df_transformed in year_results]
+                    ),
+                )
+                for year, year_results in groupby(
+                    transformed_quarters, key=lambda result: result[0]
+                )
+            )
+
+    def load_batch(batch: tuple) -> None:
+        year, label, df_transformed = batch
+        _load_dataframe(
+            df=df_transformed,
+            postgresql_client=postgresql_client,
+            table=tables[year],
+            metadata=metadata,
+            config=config,
+            row_counts=row_counts,
+            stage_metrics=stage_metrics,
+            rollup=rollup,
+            quarantine=quarantine,
+        )
+        pipeline_logging.logger.info(
+            f"Loaded {year} {label} to postgres ({len(df_transformed)} rows)"
+        )
+
+    # load
+    if config.get("overlap_load"):
+        pipeline_logging.logger.info("Loading batches while the next are transformed")
+        run_overlapped(
+            batches=batches,
+            load_batch=load_batch,
+            queue_size=config.get("load_queue_size", 2),
+        )
+    else:
+        for batch in batches:
+            load_batch(batch)
+
+    if source_manifest is not None:
+        for year, q in year_quarters:
+            source_manifest.record(get_financial_data_file_path(year=year, quarter=q))
+    if config.get("rebuild_partitions") or config.get("rebuild_tables"):
+        pipeline_logging.logger.info(f"Rows replaced: {row_counts['rows_replaced']}")
+    elif row_counts:
+        pipeline_logging.logger.info(
+            f"Rows inserted: {row_counts['rows_inserted']}, "
+            f"updated: {row_counts['rows_updated']}, "
+            f"unchanged: {row_counts['rows_unchanged']}"
+        )
+    if quarantine is not None:
+        pipeline_logging.logger.info(quarantine.describe())
     pipeline_logging.logger.info("Pipeline run successful")
+    run_stats = {
+        "files_processed": len(year_quarters),
+        "files_skipped": files_skipped,
+        **row_counts,
+        "stages": stage_metrics.to_dict(),
+    }
+    if quarantine is not None:
+        run_stats["rows_quarantined"] = quarantine.rows_quarantined
+        run_stats["validation"] = dict(quarantine.rule_counts)
+    return run_stats
 
 
 def run_pipeline_schedule(
@@ -86,27 +379,58 @@ def run_pipeline_schedule(
     pipeline_logging = PipelineLogging(
         pipeline_name=pipeline_name,
         log_folder_path=pipeline_config.get("config").get("log_folder_path"),
+        capture=pipeline_config.get("config").get("log_capture", "file"),
+        log_format=pipeline_config.get("config").get("log_format", "text"),
+        max_log_chars=pipeline_config.get("config").get("max_log_chars", 1_000_000),
     )
     metadata_logger = MetaDataLogging(
         pipeline_name=pipeline_name,
         postgresql_client=postgresql_logging_client,
         config=pipeline_config.get("config"),
     )
+    stage_metrics = StageMetrics()
     try:
         metadata_logger.log()  # log start
-        pipeline(
-            config=pipeline_config.get("config"), pipeline_logging=pipeline_logging
+        source_manifest = None
+        if pipeline_config.get("config").get("skip_unchanged_files"):
+            source_manifest = SourceManifest(
+                pipeline_name=pipeline_name,
+                postgresql_client=postgresql_logging_client,
+            )
+        run_stats = pipeline(
+            config=pipeline_config.get("config"),
+            pipeline_logging=pipeline_logging,
+            source_manifest=source_manifest,
+            stage_metrics=stage_metrics,
         )
         metadata_logger.log(
-            status=MetaDataLoggingStatus.RUN_SUCCESS, logs=pipeline_logging.get_logs()
+            status=MetaDataLoggingStatus.RUN_SUCCESS,
+            logs=pipeline_logging.get_logs(),
+            run_stats=run_stats,
         )  # log end
-        pipeline_logging.logger.handlers.clear()
+        metrics_textfile_path = pipeline_config.get("config").get(
+            "metrics_textfile_path"
+        )
+        if metrics_textfile_path:
+            stage_metrics.write_prometheus_textfile(
+                file_path=metrics_textfile_path,
+                pipeline_name=pipeline_name,
+                run_id=metadata_logger.run_id,
+            )
+        pipeline_logging.close()
     except BaseException as e:
         pipeline_logging.logger.error(f"Pipeline run failed. See detailed logs: {e}")
         metadata_logger.log(
-            status=MetaDataLoggingStatus.RUN_FAILURE, logs=pipeline_logging.get_logs()
+            status=MetaDataLoggingStatus.RUN_FAILURE,
+            logs=pipeline_logging.get_logs(),
+            run_stats={"stages": stage_metrics.to_dict()},
         )  # log error
-        pipeline_logging.logger.handlers.clear()
+        # make sure the failure is recorded
+        if not metadata_logger.flush():
+            pipeline_logging.logger.error(
+                "The failed run could not be written to the metadata log"
+            )
+        pipeline_logging.close()
 
 
 if __name__ == "__main__":
@@ -137,14 +461,34 @@ if __name__ == "__main__":
             f"Missing {yaml_file_path} file! Please create the yaml file with at least a `name` key for the pipeline name."
         )
 
-    # set schedule
-    schedule.every(pipeline_config.get("schedule").get("run_seconds")).seconds.do(
-        run_pipeline_schedule,
-        pipeline_name=PIPELINE_NAME,
-        postgresql_logging_client=postgresql_logging_client,
-        pipeline_config=pipeline_config,
-    )
+    # exit cleanly on SIGTERM so queued metadata logs are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    schedule_config = pipeline_config.get("schedule")
+    if schedule_config.get("trigger", "schedule") == "watch":
+        # run when presupuesto files arrive, with the schedule as a safety net
+        watch_and_run(
+            directory=get_financial_data_directory(),
+            run=lambda: run_pipeline_schedule(
+                pipeline_name=PIPELINE_NAME,
+                postgresql_logging_client=postgresql_logging_client,
+                pipeline_config=pipeline_config,
+            ),
+            debounce_seconds=schedule_config.get("debounce_seconds", 2),
+            watch_method=schedule_config.get("watch_method", "auto"),
+            poll_seconds=schedule_config.get("poll_seconds"),
+            run_seconds=schedule_config.get("run_seconds"),
+            max_concurrent_runs=schedule_config.get("max_concurrent_runs", 1),
+        )
+    else:
+        # set schedule
+        schedule.every(schedule_config.get("run_seconds")).seconds.do(
+            run_pipeline_schedule,
+            pipeline_name=PIPELINE_NAME,
+            postgresql_logging_client=postgresql_logging_client,
+            pipeline_config=pipeline_config,
+        )
 
-    while True:
-        schedule.run_pending()
-        time.sleep(pipeline_config.get("schedule").get("poll_seconds"))
+        while True:
+            schedule.run_pending()
+            time.sleep(schedule_config.get("poll_seconds"))
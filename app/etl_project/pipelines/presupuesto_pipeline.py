@@ -1,22 +1,84 @@
 import os
+import signal
+import sys
 import time
+from collections import Counter
 from pathlib import Path
 import yaml
+import pandas as pd
 from dotenv import load_dotenv
 import schedule
-from sqlalchemy import Table, Column, Integer, String, MetaData, Float, Date
+from sqlalchemy import MetaData, Table
 from etl_project.assets.presupuesto_etl import (
-    extract_financial_data,
+    DATE_FORMATS,
+    build_financials_table,
+    extract_financial_data_chunks,
+    filter_changed_rows,
+    get_financial_data_directory,
+    get_financial_data_file_path,
     transform_financial_data,
     load,
 )
+from etl_project.assets.pipeline_execution import transform_quarter
 from etl_project.assets.pipeline_logging import PipelineLogging
+from etl_project.assets.run_triggers import watch_and_run
+from etl_project.assets.data_validation import RowQuarantine
+from etl_project.assets.financial_rollups import FinancialsRollup
 from etl_project.assets.metadata_logging import MetaDataLogging, MetaDataLoggingStatus
+from etl_project.assets.source_manifest import SourceManifest
+from etl_project.assets.stage_metrics import StageMetrics
+from etl_project.assets.transform_cache import TransformCache
 from etl_project.connectors.postgresql import PostgreSqlClient
 
 
-def pipeline(config: dict, pipeline_logging: PipelineLogging):
+def _load_dataframe(
+    df: pd.DataFrame,
+    postgresql_client: PostgreSqlClient,
+    table: Table,
+    metadata: MetaData,
+    config: dict,
+    row_counts: Counter,
+    stage_metrics: StageMetrics,
+    rollup: FinancialsRollup = None,
+    quarantine: RowQuarantine = None,
+) -> None:
+    """
+    Upserts transformed rows, skipping unchanged rows if `row_hash` is set.
+    With a `quarantine`, rows failing validation are quarantined instead of
+    loaded.
+    """
+    if quarantine is not None:
+        with stage_metrics.measure("validate", rows_in=len(df)) as stage:
+            df = quarantine.validate(df, source_table=table.name)
+            stage.rows_out = len(df)
+            stage.rows_rejected = stage.rows_in - len(df)
+    with stage_metrics.measure("load", rows_in=len(df)) as stage:
+        if config.get("row_hash"):
+            df, changed_row_counts = filter_changed_rows(
+                df=df, postgresql_client=postgresql_client, table=table
+            )
+            row_counts.update(changed_row_counts)
+        load(
+            df=df,
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            load_method="upsert",
+            batch_size=config.get("upsert_batch_rows", 100_000),
+            commit_every_batch=config.get("commit_every_batch", False),
+            rollup=rollup,
+        )
+        stage.rows_out = len(df)
+
+
+def pipeline(
+    config: dict,
+    pipeline_logging: PipelineLogging,
+    source_manifest: SourceManifest = None,
+    stage_metrics: StageMetrics = None,
+) -> dict:
     pipeline_logging.logger.info("Starting pipeline run")
+    stage_metrics = stage_metrics or StageMetrics()
 
     # set up environment variables
     pipeline_logging.logger.info("Getting pipeline environment variables")
@@ -26,45 +88,145 @@ def pipeline(config: dict, pipeline_logging: PipelineLogging):
     DB_PASSWORD = os.environ.get("DB_PASSWORD")
     PORT = os.environ.get("PORT")
 
-    # extract
-    pipeline_logging.logger.info("Extracting data from Presupuesto CSV files")
-    extracted_quarter_data = extract_financial_data(
+    # skip the quarter file if it has not changed since it was last loaded
+    file_path = get_financial_data_file_path(
         year=config.get("year"), quarter=config.get("quarter")
     )
-    # transform
-    pipeline_logging.logger.info("Transforming Presupuesto dataframes")
-    df_transformed = transform_financial_data(df=extracted_quarter_data)
+    if source_manifest is not None and source_manifest.is_unchanged(file_path):
+        pipeline_logging.logger.info(f"Skipping unchanged file {file_path}")
+        pipeline_logging.logger.info("Pipeline run successful")
+        return {"files_processed": 0, "files_skipped": 1}
 
-    # load
-    pipeline_logging.logger.info("Loading data to postgres")
+    # clients share one pooled engine per database across scheduled runs
     postgresql_client = PostgreSqlClient(
         server_name=SERVER_NAME,
         database_name=DATABASE_NAME,
         username=DB_USERNAME,
         password=DB_PASSWORD,
         port=PORT,
+        **config.get("database_pool", {}),
     )
     metadata = MetaData()
-    table = Table(
-        f"Nuevo_Leon_Financials_{config.get('year')}_{config.get('quarter')}",
-        metadata,
-        Column("DATE", Date, primary_key=True),
-        Column("CURRENCY", String),
-        Column("REVENUE", Float),
-        Column("EXPENSES", Float),
-        Column("TAX_INCOME", Float),
-        Column("DEBT", Float),
-        Column("GDP_CONTRIBUTION_PERCENTAGE", Float),
-        Column("QUARTER", String),
-    )
-    load(
-        df=df_transformed,
-        postgresql_client=postgresql_client,
-        table=table,
+    row_counts = Counter()
+    rollup = None
+    if config.get("rollup_periods"):
+        rollup = FinancialsRollup(
+            postgresql_client=postgresql_client, periods=config.get("rollup_periods")
+        )
+    quarantine = None
+    if config.get("validate_rows"):
+        quarantine = RowQuarantine(postgresql_client=postgresql_client)
+    table = build_financials_table(
+        table_name=f"Nuevo_Leon_Financials_{config.get('year')}_{config.get('quarter')}",
         metadata=metadata,
-        load_method="upsert",
+        row_hash=config.get("row_hash", False),
     )
+
+    chunk_rows = config.get("chunk_rows")
+    if chunk_rows:
+        # extract, transform and load one bounded chunk at a time
+        pipeline_logging.logger.info(
+            f"Streaming Presupuesto CSV file in chunks of {chunk_rows} rows"
+        )
+        loaded_rows = 0
+        for chunk_number, extracted_chunk in enumerate(
+            stage_metrics.measure_chunks(
+                "extract",
+                extract_financial_data_chunks(
+                    year=config.get("year"),
+                    quarter=config.get("quarter"),
+                    chunk_rows=chunk_rows,
+                    csv_engine=config.get("csv_engine", "pandas"),
+                ),
+                bytes_read=(
+                    os.path.getsize(file_path) if os.path.exists(file_path) else 0
+                ),
+            ),
+            start=1,
+        ):
+            with stage_metrics.measure(
+                "transform", rows_in=len(extracted_chunk)
+            ) as stage:
+                df_transformed = transform_financial_data(
+                    df=extracted_chunk,
+                    date_formats=config.get("date_formats", DATE_FORMATS),
+                    logger=pipeline_logging.logger,
+                )
+                stage.set_output(df_transformed)
+            _load_dataframe(
+                df=df_transformed,
+                postgresql_client=postgresql_client,
+                table=table,
+                metadata=metadata,
+                config=config,
+                row_counts=row_counts,
+                stage_metrics=stage_metrics,
+                rollup=rollup,
+                quarantine=quarantine,
+            )
+            loaded_rows += len(df_transformed)
+            pipeline_logging.logger.info(
+                f"Loaded chunk {chunk_number} ({len(df_transformed)} rows, "
+                f"{loaded_rows} rows so far)"
+            )
+    else:
+        # extract and transform, or read the transformed file from the cache
+        transform_cache = None
+        if config.get("transform_cache_path"):
+            transform_cache = TransformCache(
+                cache_folder_path=config.get("transform_cache_path"),
+                max_bytes=config.get("transform_cache_max_bytes", 1 << 30),
+            )
+        pipeline_logging.logger.info(
+            "Extracting and transforming data from Presupuesto CSV files"
+        )
+        df_transformed = transform_quarter(
+            year=config.get("year"),
+            quarter=config.get("quarter"),
+            date_formats=config.get("date_formats", DATE_FORMATS),
+            logger=pipeline_logging.logger,
+            transform_cache=transform_cache,
+            stage_metrics=stage_metrics,
+            csv_engine=config.get("csv_engine", "pandas"),
+        )
+        if transform_cache is not None:
+            transform_cache.evict()
+
+        # load
+        pipeline_logging.logger.info("Loading data to postgres")
+        _load_dataframe(
+            df=df_transformed,
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            config=config,
+            row_counts=row_counts,
+            stage_metrics=stage_metrics,
+            rollup=rollup,
+            quarantine=quarantine,
+        )
+
+    if source_manifest is not None:
+        source_manifest.record(file_path)
+    if row_counts:
+        pipeline_logging.logger.info(
+            f"Rows inserted: {row_counts['rows_inserted']}, "
+            f"updated: {row_counts['rows_updated']}, "
+            f"unchanged: {row_counts['rows_unchanged']}"
+        )
+    if quarantine is not None:
+        pipeline_logging.logger.info(quarantine.describe())
     pipeline_logging.logger.info("Pipeline run successful")
+    run_stats = {
+        "files_processed": 1,
+        "files_skipped": 0,
+        **row_counts,
+        "stages": stage_metrics.to_dict(),
+    }
+    if quarantine is not None:
+        run_stats["rows_quarantined"] = quarantine.rows_quarantined
+        run_stats["validation"] = dict(quarantine.rule_counts)
+    return run_stats
 
 
 def run_pipeline_schedule(
@@ -75,27 +237,58 @@ def run_pipeline_schedule(
     pipeline_logging = PipelineLogging(
         pipeline_name=pipeline_name,
         log_folder_path=pipeline_config.get("config").get("log_folder_path"),
+        capture=pipeline_config.get("config").get("log_capture", "file"),
+        log_format=pipeline_config.get("config").get("log_format", "text"),
+        max_log_chars=pipeline_config.get("config").get("max_log_chars", 1_000_000),
     )
     metadata_logger = MetaDataLogging(
         pipeline_name=pipeline_name,
         postgresql_client=postgresql_logging_client,
         config=pipeline_config.get("config"),
     )
+    stage_metrics = StageMetrics()
     try:
         metadata_logger.log()  # log start
-        pipeline(
-            config=pipeline_config.get("config"), pipeline_logging=pipeline_logging
+        source_manifest = None
+        if pipeline_config.get("config").get("skip_unchanged_files"):
+            source_manifest = SourceManifest(
+                pipeline_name=pipeline_name,
+                postgresql_client=postgresql_logging_client,
+            )
+        run_stats = pipeline(
+            config=pipeline_config.get("config"),
+            pipeline_logging=pipeline_logging,
+            source_manifest=source_manifest,
+            stage_metrics=stage_metrics,
         )
         metadata_logger.log(
-            status=MetaDataLoggingStatus.RUN_SUCCESS, logs=pipeline_logging.get_logs()
+            status=MetaDataLoggingStatus.RUN_SUCCESS,
+            logs=pipeline_logging.get_logs(),
+            run_stats=run_stats,
         )  # log end
-        pipeline_logging.logger.handlers.clear()
+        metrics_textfile_path = pipeline_config.get("config").get(
+            "metrics_textfile_path"
+        )
+        if metrics_textfile_path:
+            stage_metrics.write_prometheus_textfile(
+                file_path=metrics_textfile_path,
+                pipeline_name=pipeline_name,
+                run_id=metadata_logger.run_id,
+            )
+        pipeline_logging.close()
     except BaseException as e:
         pipeline_logging.logger.error(f"Pipeline run failed. See detailed logs: {e}")
         metadata_logger.log(
-            status=MetaDataLoggingStatus.RUN_FAILURE, logs=pipeline_logging.get_logs()
+            status=MetaDataLoggingStatus.RUN_FAILURE,
+            logs=pipeline_logging.get_logs(),
+            run_stats={"stages": stage_metrics.to_dict()},
         )  # log error
-        pipeline_logging.logger.handlers.clear()
+        # make sure the failure is recorded
+        if not metadata_logger.flush():
+            pipeline_logging.logger.error(
+                "The failed run could not be written to the metadata log"
+            )
+        pipeline_logging.close()
 
 
 if __name__ == "__main__":
@@ -126,14 +319,34 @@ if __name__ == "__main__":
             f"Missing {yaml_file_path} file! Please create the yaml file with at least a `name` key for the pipeline name."
         )
 
-    # set schedule
-    schedule.every(pipeline_config.get("schedule").get("run_seconds")).seconds.do(
-        run_pipeline_schedule,
-        pipeline_name=PIPELINE_NAME,
-        postgresql_logging_client=postgresql_logging_client,
-        pipeline_config=pipeline_config,
-    )
+    # exit cleanly on SIGTERM so queued metadata logs are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    schedule_config = pipeline_config.get("schedule")
+    if schedule_config.get("trigger", "schedule") == "watch":
+        # run when presupuesto files arrive, with the schedule as a safety net
+        watch_and_run(
+            directory=get_financial_data_directory(),
+            run=lambda: run_pipeline_schedule(
+                pipeline_name=PIPELINE_NAME,
+                postgresql_logging_client=postgresql_logging_client,
+                pipeline_config=pipeline_config,
+            ),
+            debounce_seconds=schedule_config.get("debounce_seconds", 2),
+            watch_method=schedule_config.get("watch_method", "auto"),
+            poll_seconds=schedule_config.get("poll_seconds"),
+            run_seconds=schedule_config.get("run_seconds"),
+            max_concurrent_runs=schedule_config.get("max_concurrent_runs", 1),
+        )
+    else:
+        # set schedule
+        schedule.every(schedule_config.get("run_seconds")).seconds.do(
+            run_pipeline_schedule,
+            pipeline_name=PIPELINE_NAME,
+            postgresql_logging_client=postgresql_logging_client,
+            pipeline_config=pipeline_config,
+        )
 
-    while True:
-        schedule.run_pending()
-        time.sleep(pipeline_config.get("schedule").get("poll_seconds"))
+        while True:
+            schedule.run_pending()
+            time.sleep(schedule_config.get("poll_seconds"))
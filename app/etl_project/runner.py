@@ -0,0 +1,263 @@
+"""
+Runs any number of pipelines in one process, on a shared worker pool.
+
+Usage example:
+    python -m etl_project.runner etl_project/pipelines/presupuesto_pipeline.yaml \
+        etl_project/pipelines/bulk_presupuesto_pipeline.yaml --workers 4
+
+Each pipeline YAML is run by the `run_pipeline_schedule` of the module in
+etl_project.pipelines named by its `pipeline` key, or by its file name. The
+`schedule:` section of each YAML sets its trigger and interval as when the
+pipeline runs on its own, and `max_concurrent_runs` limits its runs in flight.
+"""
+
+import argparse
+import functools
+import importlib
+import logging
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import schedule
+import yaml
+from dotenv import load_dotenv
+from etl_project.assets.pipeline_logging import LOG_FORMAT
+from etl_project.assets.presupuesto_etl import get_financial_data_directory
+from etl_project.assets.run_triggers import (
+    CoalescingRunner,
+    create_file_watcher,
+    describe_changed_files,
+    run_trigger_loop,
+)
+from etl_project.connectors.postgresql import PostgreSqlClient
+
+# named explicitly, __name__ is "__main__" when run with python -m
+logger = logging.getLogger("etl_project.runner")
+
+
+def load_pipeline_configs(paths: list[str]) -> list[tuple[str, dict]]:
+    """
+    Loads pipeline YAML files, and the YAML files of directories.
+
+    Returns:
+        (pipeline module name, pipeline config) of each file
+    """
+    yaml_file_paths = []
+    for path in paths:
+        if Path(path).is_dir():
+            yaml_file_paths.extend(sorted(Path(path).glob("*.yaml")))
+        else:
+            yaml_file_paths.append(Path(path))
+    pipeline_configs = []
+    for yaml_file_path in yaml_file_paths:
+        with open(yaml_file_path) as yaml_file:
+            pipeline_config = yaml.safe_load(yaml_file)
+        if not pipeline_config or "name" not in pipeline_config:
+            raise Exception(
+                f"{yaml_file_path} needs at least a `name` key for the pipeline name."
+            )
+        module_name = pipeline_config.get("pipeline", yaml_file_path.stem)
+        pipeline_configs.append((module_name, pipeline_config))
+    names = [pipeline_config["name"] for _, pipeline_config in pipeline_configs]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise Exception(f"Pipeline names must be unique, found {sorted(duplicates)}")
+    return pipeline_configs
+
+
+def create_database_clients(
+    max_db_connections: int, pool_timeout: float
+) -> tuple[PostgreSqlClient, PostgreSqlClient]:
+    """
+    Creates the clients of the pipeline and logging databases, splitting
+    `max_db_connections` between their connection pools.
+
+    Clients share one engine per database, so every pipeline run in the
+    process uses these pools and waits up to `pool_timeout` seconds for a
+    free connection. The `database_pool` settings of the pipelines are not
+    used.
+
+    Returns:
+        The pipeline database client and the logging database client
+    """
+    connection_details = [
+        dict(
+            server_name=os.environ.get("SERVER_NAME"),
+            database_name=os.environ.get("DATABASE_NAME"),
+            username=os.environ.get("DB_USERNAME"),
+            password=os.environ.get("DB_PASSWORD"),
+            port=os.environ.get("PORT"),
+        ),
+        dict(
+            server_name=os.environ.get("LOGGING_SERVER_NAME"),
+            database_name=os.environ.get("LOGGING_DATABASE_NAME"),
+            username=os.environ.get("LOGGING_USERNAME"),
+            password=os.environ.get("LOGGING_PASSWORD"),
+            port=os.environ.get("LOGGING_PORT"),
+        ),
+    ]
+    databases = 1 if connection_details[0] == connection_details[1] else 2
+    pool_size = max(1, max_db_connections // databases)
+    postgresql_client, postgresql_logging_client = [
+        PostgreSqlClient(
+            **details,
+            pool_size=pool_size,
+            max_overflow=0,
+            pool_timeout=pool_timeout,
+        )
+        for details in connection_details
+    ]
+    return postgresql_client, postgresql_logging_client
+
+
+def run_pipelines(
+    pipeline_configs: list[tuple[str, dict]],
+    postgresql_logging_client: PostgreSqlClient,
+    workers: int = 4,
+    stop_event: threading.Event = None,
+) -> None:
+    """
+    Runs pipelines on their triggers until `stop_event` is set, on a pool of
+    `workers` threads.
+
+    Pipelines with the watch trigger share one watcher of the presupuesto
+    directory, which uses the largest `debounce_seconds` and the smallest
+    `poll_seconds` of those pipelines.
+    """
+    pipeline_modules = [
+        importlib.import_module(f"etl_project.pipelines.{module_name}")
+        for module_name, _ in pipeline_configs
+    ]
+    schedule_configs = [
+        pipeline_config.get("schedule", {}) for _, pipeline_config in pipeline_configs
+    ]
+    watch_configs = [
+        schedule_config
+        for schedule_config in schedule_configs
+        if schedule_config.get("trigger", "schedule") == "watch"
+    ]
+    poll_seconds = min(
+        schedule_config.get("poll_seconds", 2) for schedule_config in schedule_configs
+    )
+    watcher = None
+    if watch_configs:
+        watch_methods = {config.get("watch_method", "auto") for config in watch_configs}
+        if len(watch_methods) > 1:
+            raise Exception(
+                f"Pipelines in one runner must use the same watch_method, "
+                f"found {sorted(watch_methods)}"
+            )
+        watcher = create_file_watcher(
+            directory=get_financial_data_directory(),
+            watch_method=watch_methods.pop(),
+            poll_seconds=poll_seconds,
+        )
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="runner")
+    scheduler = schedule.Scheduler()
+    runners = []
+    watch_runners = []
+    for (module_name, pipeline_config), pipeline_module, schedule_config in zip(
+        pipeline_configs, pipeline_modules, schedule_configs
+    ):
+        runner = CoalescingRunner(
+            run=functools.partial(
+                pipeline_module.run_pipeline_schedule,
+                pipeline_name=pipeline_config.get("name"),
+                postgresql_logging_client=postgresql_logging_client,
+                pipeline_config=pipeline_config,
+            ),
+            executor=executor,
+            max_concurrent_runs=schedule_config.get("max_concurrent_runs", 1),
+            name=pipeline_config.get("name"),
+        )
+        runners.append(runner)
+        if schedule_config.get("run_seconds"):
+            scheduler.every(schedule_config.get("run_seconds")).seconds.do(
+                runner.request, reason="schedule"
+            )
+        if schedule_config in watch_configs:
+            watch_runners.append(runner)
+            runner.request(reason="start")
+        logger.info(
+            f"Loaded {pipeline_config.get('name')} ({module_name}), "
+            f"trigger {schedule_config.get('trigger', 'schedule')}"
+        )
+
+    def request_watch_runs(file_names: set[str]) -> None:
+        for runner in watch_runners:
+            runner.request(reason=describe_changed_files(file_names))
+
+    try:
+        run_trigger_loop(
+            scheduler=scheduler,
+            watcher=watcher,
+            on_files_changed=request_watch_runs,
+            debounce_seconds=max(
+                (config.get("debounce_seconds", 2) for config in watch_configs),
+                default=2,
+            ),
+            poll_seconds=poll_seconds,
+            stop_event=stop_event,
+        )
+    finally:
+        logger.info("Stopping, waiting for the runs in flight")
+        for runner in runners:
+            runner.close()
+        executor.shutdown()
+        if watcher is not None:
+            watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "pipeline_paths",
+        nargs="+",
+        help="pipeline YAML files, or directories of them",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="pipeline runs in flight at once"
+    )
+    parser.add_argument(
+        "--max-db-connections",
+        type=int,
+        default=20,
+        help="connections open at once across the pipeline and logging databases",
+    )
+    parser.add_argument(
+        "--db-pool-timeout",
+        type=float,
+        default=300,
+        help="seconds a run waits for a free database connection",
+    )
+    args = parser.parse_args()
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    runner_logger = logging.getLogger("etl_project")
+    runner_logger.addHandler(handler)
+    runner_logger.setLevel(logging.INFO)
+
+    load_dotenv()
+    pipeline_configs = load_pipeline_configs(args.pipeline_paths)
+    _, postgresql_logging_client = create_database_clients(
+        max_db_connections=args.max_db_connections,
+        pool_timeout=args.db_pool_timeout,
+    )
+
+    # exit cleanly on SIGTERM so runs in flight finish and metadata logs are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    run_pipelines(
+        pipeline_configs=pipeline_configs,
+        postgresql_logging_client=postgresql_logging_client,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl_project.assets.data_validation import (
+    VALIDATION_RULES,
+    RowQuarantine,
+    validate_financial_data,
+)
+
+
+@pytest.fixture
+def setup_transformed_df():
+    return pd.DataFrame(
+        {
+            "DATE": pd.to_datetime(["2024-01-01", None, "2024-01-03", "2024-01-04"]),
+            "REVENUE": [130.27, 88.38, -1.0, 121.09],
+            "EXPENSES": [81.47, 59.41, 83.55, np.nan],
+            "TAX_INCOME": [56.11, 33.61, 74.5, 11.91],
+            "DEBT": [619.4, 802.9, 819.75, 684.56],
+            "GDP_CONTRIBUTION_PERCENTAGE": [3.76, 3.3, 101.0, 1.9],
+            "CURRENCY": ["MXN", "MXN", "MXN", None],
+            "QUARTER": ["2024Q1", "NaT", "2024Q1", "2024Q1"],
+        }
+    )
+
+
+def test_validate_financial_data_reports_each_failed_rule(setup_transformed_df):
+    df, quarantined, rule_counts = validate_financial_data(setup_transformed_df)
+
+    assert list(df["REVENUE"]) == [130.27]
+    assert list(quarantined["REASON_CODES"]) == [
+        "invalid_date",
+        "negative_revenue,gdp_contribution_out_of_range",
+        "missing_currency,missing_expenses",
+    ]
+    assert set(rule_counts) == set(VALIDATION_RULES)
+    assert rule_counts["negative_revenue"] == 1
+    assert rule_counts["missing_debt"] == 0
+
+
+def test_validate_financial_data_returns_valid_frame_as_is(setup_transformed_df):
+    valid_df = setup_transformed_df.iloc[[0]]
+    df, quarantined, _ = validate_financial_data(valid_df)
+
+    assert df is valid_df
+    assert quarantined.empty
+    assert "REASON_CODES" in quarantined
+
+
+def test_row_quarantine_stores_failing_rows(postgres_client, setup_transformed_df):
+    client = postgres_client
+    table_name = "sample_financials_quarantine"
+    client.drop_table(table_name)
+    quarantine = RowQuarantine(
+        postgresql_client=client, quarantine_table_name=table_name
+    )
+
+    df = quarantine.validate(setup_transformed_df, source_table="sample_financials")
+
+    assert len(df) == 1
+    rows = sorted(
+        client.select_all(table=quarantine.table), key=lambda row: row["REVENUE"]
+    )
+    assert [(row["SOURCE_TABLE"], row["REASON_CODES"]) for row in rows] == [
+        ("sample_financials", "negative_revenue,gdp_contribution_out_of_range"),
+        ("sample_financials", "invalid_date"),
+        ("sample_financials", "missing_currency,missing_expenses"),
+    ]
+    assert rows[1]["DATE"] is None
+    assert quarantine.rows_quarantined == 3
+    assert "invalid_date: 1" in quarantine.describe()
+
+    client.drop_table(table_name)
+
+
+def test_row_quarantine_keeps_one_row_per_failing_row(
+    postgres_client, setup_transformed_df
+):
+    client = postgres_client
+    table_name = "sample_financials_quarantine"
+    client.drop_table(table_name)
+    quarantine = RowQuarantine(
+        postgresql_client=client, quarantine_table_name=table_name
+    )
+
+    # the same file validated by two scheduled runs
+    quarantine.validate(setup_transformed_df.copy(), source_table="sample_financials")
+    first_rows = client.select_all(table=quarantine.table)
+    quarantine.validate(setup_transformed_df.copy(), source_table="sample_financials")
+    second_rows = client.select_all(table=quarantine.table)
+
+    assert len(first_rows) == len(second_rows) == 3
+    assert {row["ROW_HASH"] for row in second_rows} == {
+        row["ROW_HASH"] for row in first_rows
+    }
+    assert quarantine.rows_quarantined == 6
+
+    client.drop_table(table_name)
@@ -0,0 +1,82 @@
+import pytest
+import pandas as pd
+from sqlalchemy import MetaData
+from etl_project.assets.financial_rollups import FinancialsRollup
+from etl_project.assets.presupuesto_etl import build_financials_table, load
+
+
+def make_financials(dates: list[str], revenue: float, gdp: float) -> pd.DataFrame:
+    dates = pd.to_datetime(dates)
+    return pd.DataFrame(
+        {
+            "DATE": dates,
+            "CURRENCY": "MXN",
+            "REVENUE": revenue,
+            "EXPENSES": 1.0,
+            "TAX_INCOME": 2.0,
+            "DEBT": 3.0,
+            "GDP_CONTRIBUTION_PERCENTAGE": gdp,
+            "QUARTER": dates.to_period("Q").astype(str),
+        }
+    )
+
+
+def aggregate(df: pd.DataFrame) -> pd.DataFrame:
+    """Aggregates rows per quarter the way the rollup does."""
+    return (
+        df.groupby("QUARTER")
+        .agg(
+            ROW_COUNT=("DATE", "size"),
+            REVENUE=("REVENUE", "sum"),
+            AVG_GDP_CONTRIBUTION_PERCENTAGE=("GDP_CONTRIBUTION_PERCENTAGE", "mean"),
+        )
+        .reset_index(drop=True)
+    )
+
+
+@pytest.mark.parametrize("partition_by", [None, "quarter"])
+def test_upserts_update_rollup_incrementally(postgres_client, partition_by):
+    client = postgres_client
+    table_name = "sample_rollup_financials"
+    client.drop_table(table_name)
+    client.drop_table("sample_financials_rollup")
+    rollup = FinancialsRollup(
+        postgresql_client=client,
+        periods=["quarter", "month"],
+        rollup_table_name="sample_financials_rollup",
+    )
+    metadata = MetaData()
+    table = build_financials_table(
+        table_name=table_name, metadata=metadata, partition_by=partition_by, year=2024
+    )
+
+    first = make_financials(["2024-01-01", "2024-02-01", "2024-04-01"], 10.0, 1.0)
+    # updates one row, with NaN GDP values, and inserts another
+    second = make_financials(["2024-02-01", "2024-05-01"], 100.0, float("nan"))
+    for df in (first, second):
+        load(
+            df=df,
+            postgresql_client=client,
+            table=table,
+            metadata=metadata,
+            rollup=rollup,
+        )
+
+    expected = aggregate(pd.concat([first.iloc[[0, 2]], second]))
+    quarters = rollup.read(source_table=table_name)
+    assert list(quarters["PERIOD"]) == ["2024Q1", "2024Q2"]
+    pd.testing.assert_frame_equal(
+        quarters[["ROW_COUNT", "REVENUE", "AVG_GDP_CONTRIBUTION_PERCENTAGE"]],
+        expected,
+        check_dtype=False,
+    )
+    months = rollup.read(source_table=table_name, period_type="month")
+    assert list(months["PERIOD"]) == ["2024-01", "2024-02", "2024-04", "2024-05"]
+    assert list(months["REVENUE"]) == [10.0, 100.0, 10.0, 100.0]
+
+    # recomputing from all rows gives the same aggregates
+    rollup.refresh(table)
+    pd.testing.assert_frame_equal(rollup.read(source_table=table_name), quarters)
+
+    client.drop_table(table_name)
+    client.drop_table("sample_financials_rollup")
@@ -0,0 +1,68 @@
+from sqlalchemy.exc import OperationalError
+from etl_project.assets.metadata_logging import (
+    MetaDataLogging,
+    MetaDataLoggingStatus,
+)
+
+LOG_TABLE_NAME = "test_pipeline_logs"
+
+
+def test_metadata_logging_writes_batched_rows(postgres_client):
+    first_run = MetaDataLogging(
+        pipeline_name="test_pipeline",
+        postgresql_client=postgres_client,
+        config={"year": 2024},
+        log_table_name=LOG_TABLE_NAME,
+    )
+    second_run = MetaDataLogging(
+        pipeline_name="test_pipeline",
+        postgresql_client=postgres_client,
+        log_table_name=LOG_TABLE_NAME,
+    )
+    first_run.log()
+    second_run.log()
+    first_run.log(
+        status=MetaDataLoggingStatus.RUN_SUCCESS, logs="done", run_stats={"rows": 1}
+    )
+    assert first_run.flush(timeout=10)
+
+    assert first_run.writer is second_run.writer
+    assert second_run.run_id > first_run.run_id
+    rows = postgres_client.engine.execute(
+        first_run.table.select().where(
+            first_run.table.c.run_id.in_([first_run.run_id, second_run.run_id])
+        )
+    ).all()
+    assert sorted((row.run_id, row.status) for row in rows) == [
+        (first_run.run_id, MetaDataLoggingStatus.RUN_START),
+        (first_run.run_id, MetaDataLoggingStatus.RUN_SUCCESS),
+        (second_run.run_id, MetaDataLoggingStatus.RUN_START),
+    ]
+    success_row = next(
+        row for row in rows if row.status == MetaDataLoggingStatus.RUN_SUCCESS
+    )
+    assert success_row.config == {"year": 2024}
+    assert success_row.run_stats == {"rows": 1}
+
+
+def test_metadata_logging_flush_reports_failed_writes(postgres_client, monkeypatch):
+    run = MetaDataLogging(
+        pipeline_name="test_pipeline",
+        postgresql_client=postgres_client,
+        log_table_name=LOG_TABLE_NAME,
+    )
+
+    def fail(connection):
+        raise OperationalError("select nextval", {}, Exception("connection lost"))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(run.writer, "next_run_id", fail)
+        run.log()
+        assert not run.flush(timeout=10)
+
+    # the kept rows are written by the next flush once the database recovers
+    assert run.flush(timeout=10)
+    rows = postgres_client.engine.execute(
+        run.table.select().where(run.table.c.run_id == run.run_id)
+    ).all()
+    assert [row.status for row in rows] == [MetaDataLoggingStatus.RUN_START]
@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+from etl_project.assets.pipeline_execution import (
+    extract_transform_quarters,
+    from_columnar_payload,
+    run_overlapped,
+    to_columnar_payload,
+)
+from etl_project.assets.transform_cache import TransformCache
+
+
+def test_columnar_payload_round_trip():
+    df = pd.DataFrame(
+        {
+            "DATE": pd.to_datetime(["2024-01-01", None]),
+            "CURRENCY": ["MXN", None],
+            "REVENUE": [130.27, None],
+        }
+    )
+
+    pd.testing.assert_frame_equal(from_columnar_payload(to_columnar_payload(df)), df)
+
+
+def test_extract_transform_quarters_matches_serial_path():
+    year_quarters = [(2024, "Q1"), (2024, "Q2"), (2024, "Q3"), (2024, "Q4")]
+
+    serial = list(extract_transform_quarters(year_quarters, workers=1))
+    parallel = list(extract_transform_quarters(year_quarters, workers=2))
+
+    assert [result[:2] for result in parallel] == year_quarters
+    for (_, _, df_serial), (_, _, df_parallel) in zip(serial, parallel):
+        pd.testing.assert_frame_equal(df_parallel, df_serial)
+
+
+def test_extract_transform_quarters_workers_write_the_transform_cache(tmp_path):
+    year_quarters = [(2024, "Q1"), (2024, "Q2")]
+    transform_cache = TransformCache(cache_folder_path=str(tmp_path))
+
+    parallel = list(
+        extract_transform_quarters(
+            year_quarters, workers=2, transform_cache=transform_cache
+        )
+    )
+    cached = list(
+        extract_transform_quarters(year_quarters, transform_cache=transform_cache)
+    )
+
+    assert len(list(tmp_path.iterdir())) == 2
+    for (_, _, df_parallel), (_, _, df_cached) in zip(parallel, cached):
+        pd.testing.assert_frame_equal(df_cached, df_parallel)
+
+
+def test_run_overlapped_loads_batches_in_order():
+    loaded = []
+
+    run_overlapped(batches=iter(range(10)), load_batch=loaded.append, queue_size=2)
+
+    assert loaded == list(range(10))
+
+
+def test_run_overlapped_propagates_load_errors():
+    produced = []
+
+    def batches():
+        for batch in range(100):
+            produced.append(batch)
+            yield batch
+
+    def load_batch(batch):
+        if batch == 1:
+            raise RuntimeError("load failed")
+
+    with pytest.raises(RuntimeError, match="load failed"):
+        run_overlapped(batches=batches(), load_batch=load_batch, queue_size=2)
+
+    # the bounded queue stops the producer shortly after the failure
+    assert len(produced) < 10
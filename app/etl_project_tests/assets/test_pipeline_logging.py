@@ -0,0 +1,65 @@
+import json
+from etl_project.assets.pipeline_logging import PipelineLogging
+
+
+def test_memory_capture_truncates_oldest_lines():
+    pipeline_logging = PipelineLogging(
+        pipeline_name="test_memory_capture",
+        log_folder_path=None,
+        capture="memory",
+        max_log_chars=200,
+    )
+    for line_number in range(100):
+        pipeline_logging.logger.info(f"line {line_number}")
+    logs = pipeline_logging.get_logs()
+    pipeline_logging.close()
+
+    assert len(logs) < 300
+    assert logs.startswith("... ")
+    assert "earlier log lines truncated" in logs
+    assert logs.rstrip().endswith("line 99")
+
+
+def test_memory_capture_starts_empty_each_run():
+    for run in range(3):
+        pipeline_logging = PipelineLogging(
+            pipeline_name="test_memory_runs",
+            log_folder_path=None,
+            capture="memory",
+            log_format="json",
+        )
+        pipeline_logging.logger.info(f"run {run}")
+        assert len(pipeline_logging.logger.handlers) == 2
+        entries = [
+            json.loads(line) for line in pipeline_logging.get_logs().splitlines()
+        ]
+        pipeline_logging.close()
+
+        assert [entry["message"] for entry in entries] == [f"run {run}"]
+        assert entries[0]["level"] == "INFO"
+        assert entries[0]["name"] == "test_memory_runs"
+        assert pipeline_logging.logger.handlers == []
+
+
+def test_memory_capture_keeps_overlapping_runs_apart():
+    first_run, second_run = [
+        PipelineLogging(
+            pipeline_name="test_memory_overlap",
+            log_folder_path=None,
+            capture="memory",
+        )
+        for _ in range(2)
+    ]
+    first_run.logger.info("first run started")
+    second_run.logger.info("second run started")
+    second_run.close()
+    first_run.logger.info("first run finished")
+
+    first_logs = first_run.get_logs()
+    first_run.close()
+
+    assert "first run started" in first_logs
+    assert "first run finished" in first_logs
+    assert "second run" not in first_logs
+    assert second_run.get_logs().splitlines()[0].endswith("second run started")
+    assert len(second_run.get_logs().splitlines()) == 1
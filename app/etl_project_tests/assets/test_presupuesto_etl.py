@@ -1,7 +1,26 @@
+import os
 import pytest
 import pandas as pd
 from datetime import datetime
-from etl_project.assets.presupuesto_etl import transform_financial_data
+from etl_project.assets.presupuesto_etl import (
+    add_row_hash,
+    clean_numeric_columns,
+    compact_financial_data,
+    concat_financial_data,
+    discover_financial_data_files,
+    extract_financial_data_file,
+    extract_financial_data_file_chunks,
+    get_date_partitions,
+    get_financial_data_file_path,
+    get_memory_usage,
+    parse_dates,
+    read_financial_data_csv,
+    restore_financial_data,
+    split_partitions,
+    transform_financial_data,
+)
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), "..", "data", "presupuestos")
 
 
 @pytest.fixture
@@ -68,3 +87,254 @@ def test_transform_financial_data(setup_input_df_financial_data, setup_transform
 
     # Compare
     pd.testing.assert_frame_equal(df_transformed, expected_df, check_exact=True)
+
+
+def test_parse_dates_mixed_formats():
+    dates = pd.Series(["2024/01/01", "02-01-2024", "not a date", None, "2024/01/01"])
+
+    parsed, unparsed_count = parse_dates(dates)
+
+    expected = pd.Series(
+        pd.to_datetime(["2024-01-01", "2024-01-02", None, None, "2024-01-01"])
+    )
+    pd.testing.assert_series_equal(parsed, expected)
+    assert unparsed_count == 2
+
+
+def test_parse_dates_matches_row_by_row_parsing():
+    def parse_date(date_str):
+        for fmt in ("%Y/%m/%d", "%d-%m-%Y"):
+            try:
+                return pd.to_datetime(date_str, format=fmt)
+            except ValueError:
+                continue
+        return pd.NaT
+
+    for file_name in sorted(os.listdir(DATA_FOLDER)):
+        dates = pd.read_csv(os.path.join(DATA_FOLDER, file_name))["Date"]
+
+        parsed, _ = parse_dates(dates)
+
+        pd.testing.assert_series_equal(parsed, dates.apply(parse_date))
+
+
+def test_clean_numeric_columns_flags_rejected_values():
+    df = pd.DataFrame(
+        {
+            "Revenue": ["$1,130.27", "-$5.00", "not a number", None],
+            "GDP Contribution": ["3.76%", "", "4.5 %", "12 MXN 3"],
+        }
+    )
+
+    df_cleaned, rejected = clean_numeric_columns(df, ("Revenue", "GDP Contribution"))
+
+    expected_df = pd.DataFrame(
+        {
+            "Revenue": [1130.27, -5.00, None, None],
+            "GDP Contribution": [3.76, None, 4.5, None],
+        }
+    )
+    expected_rejected = pd.DataFrame(
+        {
+            "Revenue": [False, False, True, False],
+            "GDP Contribution": [False, False, False, True],
+        }
+    )
+    pd.testing.assert_frame_equal(df_cleaned, expected_df)
+    pd.testing.assert_frame_equal(rejected, expected_rejected)
+
+
+def test_clean_numeric_columns_strips_only_whole_tokens():
+    df = pd.DataFrame(
+        {
+            "Revenue": ["emp 12", "Nope 5", "sexo 7", "12e", "MEX$ 1,619.40 "],
+            "GDP Contribution": ["3,5%", "1,2,3", "% 4.5", "pesos", "$12,345%"],
+        }
+    )
+
+    df_cleaned, rejected = clean_numeric_columns(df, ("Revenue", "GDP Contribution"))
+
+    expected_df = pd.DataFrame(
+        {
+            "Revenue": [None, None, None, None, 1619.40],
+            "GDP Contribution": [None, None, 4.5, None, 12345.0],
+        }
+    )
+    expected_rejected = pd.DataFrame(
+        {
+            "Revenue": [True, True, True, True, False],
+            "GDP Contribution": [True, True, False, False, False],
+        }
+    )
+    pd.testing.assert_frame_equal(df_cleaned, expected_df)
+    pd.testing.assert_frame_equal(rejected, expected_rejected)
+
+
+def test_add_row_hash_changes_only_for_modified_rows(setup_transformed_df):
+    df_hashed = add_row_hash(setup_transformed_df.copy())
+    df_modified = setup_transformed_df.copy()
+    df_modified.loc[1, "REVENUE"] = 151.00
+    df_modified = add_row_hash(df_modified)
+
+    assert df_hashed["ROW_HASH"].dtype == "int64"
+    assert df_hashed.loc[0, "ROW_HASH"] == df_modified.loc[0, "ROW_HASH"]
+    assert df_hashed.loc[1, "ROW_HASH"] != df_modified.loc[1, "ROW_HASH"]
+
+
+def test_xlsx_chunks_match_csv(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    csv_path = get_financial_data_file_path(2024, "Q1")
+    df_csv = pd.read_csv(csv_path, dtype=str)
+    xlsx_path = tmp_path / "Nuevo_Leon_Financials_2024_Q1_daily.xlsx"
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(list(df_csv.columns))
+    for row in df_csv.itertuples(index=False):
+        sheet.append([None if pd.isna(value) else value for value in row])
+    workbook.save(xlsx_path)
+
+    chunks = list(extract_financial_data_file_chunks(str(xlsx_path), chunk_rows=40))
+
+    assert [len(chunk) for chunk in chunks] == [40, 40, len(df_csv) - 80]
+    pd.testing.assert_frame_equal(
+        transform_financial_data(pd.concat(chunks, ignore_index=True)),
+        transform_financial_data(pd.read_csv(csv_path)),
+    )
+    assert discover_financial_data_files(str(tmp_path)) == {
+        (2024, "Q1"): str(xlsx_path)
+    }
+
+
+def test_xlsx_percent_formatted_cells_keep_their_percentage(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    xlsx_path = tmp_path / "Nuevo_Leon_Financials_2024_Q1_daily.xlsx"
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(
+        ["Date", "Revenue", "Expenses", "Tax Income", "Debt", "GDP Contribution"]
+        + ["Currency"]
+    )
+    sheet.append([datetime(2024, 1, 1), 130.27, 81.47, 56.11, 619.4, 0.0376, "MXN"])
+    sheet.append(["2024/01/02", 88.38, 59.41, 33.61, 802.9, "3.3%", "MXN"])
+    # a percent cell, as Excel stores a typed in 3.76%
+    sheet["F2"].number_format = "0.00%"
+    workbook.save(xlsx_path)
+
+    (chunk,) = extract_financial_data_file_chunks(str(xlsx_path), chunk_rows=10)
+
+    assert list(chunk["GDP Contribution"]) == ["3.76%", "3.3%"]
+    df = transform_financial_data(chunk)
+    assert list(df["GDP_CONTRIBUTION_PERCENTAGE"]) == [3.76, 3.3]
+
+
+def test_pyarrow_csv_engine_matches_pandas(tmp_path):
+    csv_path = tmp_path / "Nuevo_Leon_Financials_2024_Q1_daily.csv"
+    csv_path.write_text(
+        "Date,Revenue,Expenses,Tax Income,Debt,GDP Contribution,Currency,Notes\n"
+        '2024/01/01,$130.27,81.47 MXN,56.11 pesos,"1,619.40 MEX$",3.76%,Pesos,a\n'
+        "02-01-2024,,N/A,33.61 pesos,802.90 MEX$,3.3%,,b\n"
+        "2024/13/01,N/D,59.41 MXN,None,802.90 MEX$,nan,mex,c\n"
+    )
+    df_pandas = transform_financial_data(extract_financial_data_file(str(csv_path)))
+
+    df_arrow = transform_financial_data(
+        extract_financial_data_file(str(csv_path), csv_engine="pyarrow")
+    )
+    df_table = transform_financial_data(read_financial_data_csv(str(csv_path)))
+
+    # only the presupuesto columns are read
+    pd.testing.assert_frame_equal(df_arrow, df_pandas.drop(columns="NOTES"))
+    pd.testing.assert_frame_equal(df_table, df_arrow)
+    assert df_arrow.attrs["rows_rejected"] == df_pandas.attrs["rows_rejected"] == 1
+
+
+def test_pyarrow_csv_engine_chunks():
+    csv_path = get_financial_data_file_path(2024, "Q1")
+
+    chunks = list(
+        extract_financial_data_file_chunks(
+            csv_path, chunk_rows=40, csv_engine="pyarrow"
+        )
+    )
+
+    assert [len(chunk) for chunk in chunks] == [40, 40, 10]
+    pd.testing.assert_frame_equal(
+        transform_financial_data(pd.concat(chunks, ignore_index=True)),
+        transform_financial_data(pd.read_csv(csv_path)),
+    )
+
+
+def test_pyarrow_csv_engine_transform_matches_pandas_at_scale(tmp_path):
+    # a year of daily rows for a few dozen sources, as in the bulk pipeline
+    csv_path = tmp_path / "Nuevo_Leon_Financials_2024_Q1_daily.csv"
+    sample = pd.read_csv(get_financial_data_file_path(2024, "Q1"))
+    pd.concat([sample] * 250, ignore_index=True).to_csv(csv_path, index=False)
+    df_pandas = transform_financial_data(extract_financial_data_file(str(csv_path)))
+
+    df_arrow = transform_financial_data(
+        extract_financial_data_file(str(csv_path), csv_engine="pyarrow")
+    )
+
+    assert len(df_arrow) == 22500
+    pd.testing.assert_frame_equal(df_arrow, df_pandas)
+
+
+@pytest.mark.parametrize("string_dtype", ["category", "string[pyarrow]"])
+def test_compact_dtypes_restore_same_values(string_dtype):
+    quarters = [
+        transform_financial_data(pd.read_csv(get_financial_data_file_path(2024, q)))
+        for q in ["Q1", "Q2"]
+    ]
+    expected = add_row_hash(pd.concat(quarters, ignore_index=True))
+
+    compacted = [
+        compact_financial_data(df.copy(), string_dtype=string_dtype) for df in quarters
+    ]
+    combined = concat_financial_data(compacted)
+
+    assert combined["REVENUE"].dtype == "float32"
+    assert get_memory_usage(combined) < get_memory_usage(expected)
+    pd.testing.assert_frame_equal(
+        add_row_hash(restore_financial_data(combined)), expected
+    )
+
+
+def test_compact_dtypes_keep_float64_when_values_would_change():
+    df = pd.DataFrame(
+        {
+            "CURRENCY": ["MXN", "MXN"],
+            "QUARTER": ["2024Q1", "2024Q1"],
+            "REVENUE": [130.27, 123456789.01],
+            "EXPENSES": [81.47, None],
+            "TAX_INCOME": [56.11, 1.5],
+            "DEBT": [619.4, 2.0],
+            "GDP_CONTRIBUTION_PERCENTAGE": [3.76, 0.5],
+        }
+    )
+
+    compacted = compact_financial_data(df.copy())
+
+    assert compacted["REVENUE"].dtype == "float64"
+    assert compacted["EXPENSES"].dtype == "float32"
+    pd.testing.assert_frame_equal(restore_financial_data(compacted), df)
+
+
+def test_split_partitions_by_quarter():
+    partitions = get_date_partitions("financials", 2024)
+    df = pd.DataFrame(
+        {
+            "DATE": pd.to_datetime(
+                ["2024-01-01", "2024-03-31", "2024-04-01", "2024-12-31", "2025-01-01"]
+            )
+        }
+    )
+
+    partition_frames = split_partitions(df, "financials", partitions)
+
+    assert list(partitions) == [f"financials_q{quarter}" for quarter in range(1, 5)]
+    assert {name: len(frame) for name, frame in partition_frames.items()} == {
+        "financials_q1": 2,
+        "financials_q2": 1,
+        "financials_q4": 1,
+        "financials_default": 1,
+    }
@@ -0,0 +1,123 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from etl_project.assets.run_triggers import (
+    CoalescingRunner,
+    InotifyWatcher,
+    PollingWatcher,
+    watch_and_run,
+)
+
+FILE_NAME = "Nuevo_Leon_Financials_2024_Q1_daily.csv"
+
+
+def _write_file(file_path, text: str = "Date\n") -> None:
+    with open(file_path, "w") as file:
+        file.write(text)
+
+
+def test_polling_watcher_reports_new_and_changed_files(tmp_path):
+    watcher = PollingWatcher(str(tmp_path), poll_seconds=0.01)
+    _write_file(tmp_path / FILE_NAME)
+    _write_file(tmp_path / "notes.txt")
+
+    assert watcher.wait(timeout=1) == {FILE_NAME}
+    assert watcher.wait(timeout=0.05) == set()
+
+
+def test_inotify_watcher_reports_written_files(tmp_path):
+    try:
+        watcher = InotifyWatcher(str(tmp_path))
+    except OSError:
+        pytest.skip("inotify is not available")
+    try:
+        _write_file(tmp_path / FILE_NAME)
+        _write_file(tmp_path / "notes.txt")
+
+        assert watcher.wait(timeout=1) == {FILE_NAME}
+        assert watcher.wait(timeout=0.05) == set()
+    finally:
+        watcher.close()
+
+
+def test_coalescing_runner_queues_one_follow_up_run():
+    started = threading.Event()
+    release = threading.Event()
+
+    def run():
+        started.set()
+        release.wait(timeout=5)
+
+    runner = CoalescingRunner(run=run)
+    runner.request(reason="first")
+    started.wait(timeout=5)
+    for _ in range(3):
+        runner.request(reason="during run")
+    release.set()
+
+    assert runner.wait_idle(timeout=5)
+    runner.close()
+    assert runner.runs == 2
+
+
+@pytest.mark.parametrize("watch_method", ["auto", "polling"])
+def test_watch_and_run_debounces_file_events(tmp_path, watch_method):
+    runs = []
+    stop_event = threading.Event()
+    watch_thread = threading.Thread(
+        target=watch_and_run,
+        kwargs=dict(
+            directory=str(tmp_path),
+            run=lambda: runs.append(time.monotonic()),
+            debounce_seconds=0.3,
+            watch_method=watch_method,
+            poll_seconds=0.02,
+            run_on_start=False,
+            stop_event=stop_event,
+        ),
+    )
+    watch_thread.start()
+    time.sleep(0.1)
+    for quarter in ["Q1", "Q2", "Q3"]:
+        _write_file(tmp_path / f"Nuevo_Leon_Financials_2024_{quarter}_daily.csv")
+        time.sleep(0.05)
+    time.sleep(1)
+    stop_event.set()
+    watch_thread.join(timeout=5)
+
+    assert len(runs) == 1
+
+
+def test_coalescing_runners_share_an_executor():
+    release = threading.Event()
+    in_flight = []
+    peak_in_flight = []
+    lock = threading.Lock()
+
+    def run():
+        with lock:
+            in_flight.append(1)
+            peak_in_flight.append(len(in_flight))
+        release.wait(timeout=5)
+        with lock:
+            in_flight.pop()
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    runners = [
+        CoalescingRunner(run=run, executor=executor, max_concurrent_runs=2)
+        for _ in range(2)
+    ]
+    for runner in runners:
+        for _ in range(4):
+            runner.request(reason="test")
+    time.sleep(0.1)
+    release.set()
+
+    for runner in runners:
+        assert runner.wait_idle(timeout=5)
+        runner.close()
+    executor.shutdown()
+    # two runs each, then one coalesced follow-up each
+    assert [runner.runs for runner in runners] == [3, 3]
+    assert max(peak_in_flight) == 4
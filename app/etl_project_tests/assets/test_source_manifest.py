@@ -0,0 +1,65 @@
+import os
+import pytest
+from etl_project.assets import source_manifest as source_manifest_module
+
+
+@pytest.fixture
+def hashed_files(monkeypatch):
+    """Records the files whose content hash is computed."""
+    compute_file_hash = source_manifest_module.compute_file_hash
+    hashed = []
+
+    def record_file_hash(file_path, *args, **kwargs):
+        hashed.append(file_path)
+        return compute_file_hash(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(source_manifest_module, "compute_file_hash", record_file_hash)
+    return hashed
+
+
+@pytest.fixture
+def recorded_file(tmp_path, open_manifest):
+    file_path = tmp_path / "Nuevo_Leon_Financials_2024_Q1_daily.csv"
+    file_path.write_text("DATE,REVENUE\n2024-01-01,100.0\n")
+    manifest = open_manifest()
+    assert not manifest.is_unchanged(str(file_path))
+    manifest.record(str(file_path))
+    return file_path
+
+
+def test_unchanged_file_is_skipped_without_hashing(
+    recorded_file, open_manifest, hashed_files
+):
+    assert open_manifest().is_unchanged(str(recorded_file))
+    assert hashed_files == []
+
+
+def test_touched_file_is_skipped_and_recorded_with_new_mtime(
+    recorded_file, open_manifest, hashed_files
+):
+    mtime = os.stat(recorded_file).st_mtime + 60
+    os.utime(recorded_file, (mtime, mtime))
+
+    manifest = open_manifest()
+    assert manifest.is_unchanged(str(recorded_file))
+    assert len(hashed_files) == 1
+    assert manifest._get_entries()[os.path.realpath(recorded_file)].mtime == mtime
+
+    # the next run trusts the recorded mtime again
+    assert open_manifest().is_unchanged(str(recorded_file))
+    assert len(hashed_files) == 1
+
+
+def test_changed_file_is_loaded(recorded_file, open_manifest):
+    stat = os.stat(recorded_file)
+    # same size and a new mtime, so only the content hash tells them apart
+    recorded_file.write_text("DATE,REVENUE\n2024-01-01,200.0\n")
+    os.utime(recorded_file, (stat.st_atime, stat.st_mtime + 60))
+
+    assert not open_manifest().is_unchanged(str(recorded_file))
+
+
+def test_missing_file_is_not_unchanged(recorded_file, open_manifest):
+    recorded_file.unlink()
+
+    assert not open_manifest().is_unchanged(str(recorded_file))
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl_project.assets.pipeline_execution import extract_transform_quarters
+from etl_project.assets.stage_metrics import StageMetrics, reset_peak_memory
+
+
+def test_stage_metrics_add_up_calls():
+    stage_metrics = StageMetrics()
+    chunks = [pd.DataFrame({"value": range(3)}), pd.DataFrame({"value": range(2)})]
+
+    for chunk in stage_metrics.measure_chunks("extract", chunks, bytes_read=100):
+        with stage_metrics.measure("transform", rows_in=len(chunk)) as stage:
+            chunk.attrs["rows_rejected"] = 1
+            stage.set_output(chunk)
+
+    stages = stage_metrics.to_dict()
+    assert stages["extract"]["rows_out"] == 5
+    assert stages["extract"]["bytes_read"] == 100
+    assert stages["transform"]["rows_in"] == 5
+    assert stages["transform"]["rows_rejected"] == 2
+
+
+def test_stage_metrics_merge_worker_stages():
+    stage_metrics = StageMetrics()
+    list(
+        extract_transform_quarters(
+            [(2024, "Q1"), (2024, "Q2")], workers=2, stage_metrics=stage_metrics
+        )
+    )
+
+    stages = stage_metrics.to_dict()
+    assert stages["transform"]["rows_in"] == stages["extract"]["rows_out"] > 0
+    assert stages["extract"]["bytes_read"] > 0
+
+
+def test_stage_metrics_peak_memory_is_measured_per_stage():
+    if not reset_peak_memory():
+        pytest.skip("the peak resident memory cannot be reset here")
+    stage_metrics = StageMetrics()
+
+    with stage_metrics.measure("allocate"):
+        block = np.ones(2**23)  # 64 MiB
+        del block
+    with stage_metrics.measure("idle"):
+        pass
+
+    stages = stage_metrics.to_dict()
+    assert (
+        stages["allocate"]["peak_memory_bytes"]
+        > stages["idle"]["peak_memory_bytes"] + 2**25
+    )
+
+
+def test_stage_metrics_leave_out_the_peak_memory_of_overlapping_stages():
+    run, concurrent_run = StageMetrics(), StageMetrics()
+
+    with run.measure("load"):
+        # a stage of another run that starts and ends during the load
+        with concurrent_run.measure("transform"):
+            pass
+
+    assert run.to_dict()["load"]["peak_memory_bytes"] is None
+    assert concurrent_run.to_dict()["transform"]["peak_memory_bytes"] is None
+
+
+def test_stage_metrics_prometheus_textfile(tmp_path):
+    stage_metrics = StageMetrics()
+    stage_metrics.record("load", seconds=0.5, rows_in=10, rows_out=10)
+    file_path = tmp_path / "presupuesto.prom"
+
+    stage_metrics.write_prometheus_textfile(
+        str(file_path), pipeline_name="presupuesto_pipeline", run_id=7
+    )
+
+    lines = file_path.read_text().splitlines()
+    assert (
+        'presupuesto_stage_rows_out{pipeline="presupuesto_pipeline",stage="load"} 10'
+        in lines
+    )
+    assert 'presupuesto_last_run_id{pipeline="presupuesto_pipeline"} 7' in lines
+    assert list(tmp_path.iterdir()) == [file_path]
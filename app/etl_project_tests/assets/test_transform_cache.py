@@ -0,0 +1,39 @@
+import os
+import shutil
+import pandas as pd
+from etl_project.assets.pipeline_execution import transform_quarter
+from etl_project.assets.presupuesto_etl import get_financial_data_file_path
+from etl_project.assets.transform_cache import TransformCache
+
+
+def test_transform_cache_round_trip(tmp_path):
+    transform_cache = TransformCache(cache_folder_path=str(tmp_path))
+
+    created = transform_quarter(2024, "Q1", transform_cache=transform_cache)
+    cached = transform_quarter(2024, "Q1", transform_cache=transform_cache)
+
+    pd.testing.assert_frame_equal(cached, created)
+    pd.testing.assert_frame_equal(cached, transform_quarter(2024, "Q1"))
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_transform_cache_key_follows_source_content(tmp_path):
+    source_path = tmp_path / "Nuevo_Leon_Financials_2024_Q1_daily.csv"
+    shutil.copy(get_financial_data_file_path(2024, "Q1"), source_path)
+    transform_cache = TransformCache(cache_folder_path=str(tmp_path / "cache"))
+
+    cache_path = transform_cache.get_cache_path(str(source_path))
+    with open(source_path, "a") as source_file:
+        source_file.write("\n")
+
+    assert transform_cache.get_cache_path(str(source_path)) != cache_path
+
+
+def test_transform_cache_evict_and_invalidate(tmp_path):
+    transform_cache = TransformCache(cache_folder_path=str(tmp_path), max_bytes=0)
+    for quarter in ["Q1", "Q2"]:
+        transform_quarter(2024, quarter, transform_cache=transform_cache)
+
+    assert transform_cache.invalidate(["Nuevo_Leon_Financials_2024_Q1_daily.csv"]) == 1
+    assert transform_cache.evict() == 1
+    assert os.listdir(tmp_path) == []
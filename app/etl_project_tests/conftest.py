@@ -0,0 +1,35 @@
+import os
+import pytest
+from dotenv import load_dotenv
+from etl_project.assets.source_manifest import SourceManifest
+from etl_project.connectors.postgresql import PostgreSqlClient
+
+
+@pytest.fixture
+def postgres_client():
+    load_dotenv()
+    client = PostgreSqlClient(
+        server_name=os.getenv("SERVER_NAME"),
+        database_name=os.getenv("DATABASE_NAME"),
+        username=os.getenv("DB_USERNAME"),
+        password=os.getenv("DB_PASSWORD"),
+        port=os.getenv("PORT"),
+    )
+    return client
+
+
+@pytest.fixture
+def open_manifest(postgres_client):
+    """Opens a source manifest on a test table, as a new pipeline run would."""
+    manifest_table_name = "test_source_manifest"
+    postgres_client.drop_table(manifest_table_name)
+
+    def open_run_manifest() -> SourceManifest:
+        return SourceManifest(
+            pipeline_name="test_pipeline",
+            postgresql_client=postgres_client,
+            manifest_table_name=manifest_table_name,
+        )
+
+    yield open_run_manifest
+    postgres_client.drop_table(manifest_table_name)
@@ -1,23 +1,12 @@
+import math
 import pytest
 import os
-from dotenv import load_dotenv
-from sqlalchemy import Table, Column, Integer, String, MetaData
+import pandas as pd
+from datetime import date
+from sqlalchemy import Table, Column, Date, Float, Integer, String, MetaData, event
 from etl_project.connectors.postgresql import PostgreSqlClient
 
 
-@pytest.fixture
-def postgres_client():
-    load_dotenv()
-    client = PostgreSqlClient(
-        server_name=os.getenv("SERVER_NAME"),
-        database_name=os.getenv("DATABASE_NAME"),
-        username=os.getenv("DB_USERNAME"),
-        password=os.getenv("DB_PASSWORD"),
-        port=os.getenv("PORT"),
-    )
-    return client
-
-
 @pytest.fixture
 def sample_table():
     name = "sample_table"
@@ -48,3 +37,241 @@ def test_insert_functionality(postgres_client, sample_table):
     assert len(retrieved_data) == 3
 
     client.drop_table(table_name)
+
+
+def test_copy_insert_functionality(postgres_client, sample_table):
+    client = postgres_client
+    table_name, table, metadata = sample_table
+
+    client.drop_table(table_name)
+
+    sample_data = pd.DataFrame(
+        [
+            {"id": 1, "content": "super"},
+            {"id": 2, "content": 'fake, "quoted"'},
+            {"id": 3, "content": None},
+        ]
+    )
+    client.copy_insert(data=sample_data, table=table, metadata=metadata)
+
+    retrieved_data = client.select_all(table=table)
+    assert sorted(retrieved_data, key=lambda row: row["id"]) == [
+        {"id": 1, "content": "super"},
+        {"id": 2, "content": 'fake, "quoted"'},
+        {"id": 3, "content": None},
+    ]
+
+    client.drop_table(table_name)
+
+
+def test_staged_upsert_functionality(postgres_client, sample_table):
+    client = postgres_client
+    table_name, table, metadata = sample_table
+
+    client.drop_table(table_name)
+
+    client.insert(
+        data=[{"id": 1, "content": "super"}, {"id": 2, "content": "fake"}],
+        table=table,
+        metadata=metadata,
+    )
+    sample_data = pd.DataFrame(
+        [
+            {"id": 2, "content": "updated"},
+            {"id": 3, "content": "data"},
+            {"id": 4, "content": "more"},
+        ]
+    )
+    client.staged_upsert(data=sample_data, table=table, metadata=metadata, batch_size=2)
+
+    retrieved_data = client.select_all(table=table)
+    assert sorted(retrieved_data, key=lambda row: row["id"]) == [
+        {"id": 1, "content": "super"},
+        {"id": 2, "content": "updated"},
+        {"id": 3, "content": "data"},
+        {"id": 4, "content": "more"},
+    ]
+
+    client.drop_table(table_name)
+
+
+def test_staged_upsert_keeps_nan_amounts(postgres_client):
+    client = postgres_client
+    table_name = "sample_amounts"
+    metadata = MetaData()
+    table = Table(
+        table_name,
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("amount", Float),
+        Column("content", String),
+    )
+    client.drop_table(table_name)
+
+    client.insert(
+        data=[{"id": 1, "amount": float("nan"), "content": "insert"}],
+        table=table,
+        metadata=metadata,
+    )
+    sample_data = pd.DataFrame(
+        {"id": [2, 3], "amount": [float("nan"), 1.5], "content": [None, "upsert"]}
+    )
+    client.staged_upsert(data=sample_data, table=table, metadata=metadata)
+
+    rows = sorted(client.select_all(table=table), key=lambda row: row["id"])
+    # NaN is stored as NaN, not NULL, like the INSERT statements store it
+    assert [math.isnan(row["amount"]) for row in rows] == [True, True, False]
+    assert [row["content"] for row in rows] == ["insert", None, "upsert"]
+
+    client.drop_table(table_name)
+
+
+def test_clients_share_engine_and_known_tables(postgres_client, sample_table):
+    table_name, table, metadata = sample_table
+    other_client = PostgreSqlClient(
+        server_name=os.getenv("SERVER_NAME"),
+        database_name=os.getenv("DATABASE_NAME"),
+        username=os.getenv("DB_USERNAME"),
+        password=os.getenv("DB_PASSWORD"),
+        port=os.getenv("PORT"),
+    )
+    assert other_client.engine is postgres_client.engine
+
+    postgres_client.drop_table(table_name)
+    postgres_client.create_table(metadata=metadata)
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(other_client.engine, "before_cursor_execute", record_statement)
+    try:
+        other_client.ensure_tables(metadata)
+        assert statements == []
+    finally:
+        event.remove(other_client.engine, "before_cursor_execute", record_statement)
+
+    # a dropped table is forgotten and created again on the next load
+    other_client.drop_table(table_name)
+    other_client.insert(
+        data=[{"id": 1, "content": "super"}], table=table, metadata=metadata
+    )
+    assert other_client.select_all(table=table) == [{"id": 1, "content": "super"}]
+
+    postgres_client.drop_table(table_name)
+
+
+def test_replace_partition_swaps_one_partition(postgres_client):
+    client = postgres_client
+    table_name = "sample_partitioned_table"
+    metadata = MetaData()
+    table = Table(
+        table_name,
+        metadata,
+        Column("day", Date, primary_key=True),
+        Column("content", String),
+        postgresql_partition_by='RANGE ("day")',
+    )
+    partitions = {
+        f"{table_name}_h1": (date(2024, 1, 1), date(2024, 7, 1)),
+        f"{table_name}_h2": (date(2024, 7, 1), date(2025, 1, 1)),
+    }
+    client.drop_table(table_name)
+    client.create_table(metadata=metadata)
+    client.ensure_partitions(table=table, partitions=partitions)
+    client.insert(
+        data=[
+            {"day": date(2024, 1, 1), "content": "old"},
+            {"day": date(2024, 2, 1), "content": "old"},
+            {"day": date(2024, 8, 1), "content": "kept"},
+        ],
+        table=table,
+        metadata=metadata,
+    )
+
+    client.replace_partition(
+        data=pd.DataFrame([{"day": date(2024, 3, 1), "content": "new"}]),
+        table=table,
+        partition_name=f"{table_name}_h1",
+        bounds=partitions[f"{table_name}_h1"],
+        partition_column="day",
+    )
+
+    assert sorted(client.select_all(table=table), key=lambda row: row["day"]) == [
+        {"day": date(2024, 3, 1), "content": "new"},
+        {"day": date(2024, 8, 1), "content": "kept"},
+    ]
+    # the swapped in table keeps the partition's names and primary key
+    h1_table = client.get_partition_table(table, f"{table_name}_h1")
+    client.staged_upsert(
+        data=pd.DataFrame([{"day": date(2024, 3, 1), "content": "upserted"}]),
+        table=h1_table,
+        metadata=h1_table.metadata,
+    )
+    assert client.select_all(table=h1_table) == [
+        {"day": date(2024, 3, 1), "content": "upserted"}
+    ]
+
+    client.drop_table(table_name)
+
+
+def test_copy_overwrite_swaps_in_shadow_table(postgres_client, sample_table):
+    client = postgres_client
+    table_name, table, metadata = sample_table
+    client.drop_table(table_name)
+    client.drop_table(f"{table_name}_previous")
+    client.insert(data=[{"id": 1, "content": "old"}], table=table, metadata=metadata)
+
+    client.copy_overwrite(
+        data=pd.DataFrame([{"id": 2, "content": "new"}]),
+        table=table,
+        metadata=metadata,
+        keep_previous=True,
+    )
+    assert client.select_all(table=table) == [{"id": 2, "content": "new"}]
+    previous_rows = client.engine.execute(
+        f'select id, content from "{table_name}_previous"'
+    ).all()
+    assert [tuple(row) for row in previous_rows] == [(1, "old")]
+
+    # a failed load leaves the live table as it was
+    with pytest.raises(Exception):
+        client.copy_overwrite(
+            data=pd.DataFrame([{"id": 3, "content": "a"}, {"id": 3, "content": "b"}]),
+            table=table,
+            metadata=metadata,
+        )
+    assert client.select_all(table=table) == [{"id": 2, "content": "new"}]
+
+    client.drop_table(table_name)
+    client.drop_table(f"{table_name}_previous")
+
+
+def test_streaming_reads_project_and_filter(postgres_client, sample_table):
+    client = postgres_client
+    table_name, table, metadata = sample_table
+    client.drop_table(table_name)
+    client.insert(
+        data=[
+            {"id": id, "content": "even" if id % 2 == 0 else "odd"} for id in range(7)
+        ],
+        table=table,
+        metadata=metadata,
+    )
+
+    batches = list(
+        client.iter_row_batches(
+            table, columns=["id"], where={"content": "even"}, batch_size=3
+        )
+    )
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert sorted(row["id"] for batch in batches for row in batch) == [0, 2, 4, 6]
+    assert batches[0][0].keys() == {"id"}
+
+    chunks = list(client.iter_dataframes(table, where=table.c.id >= 5, chunk_rows=10))
+    assert len(chunks) == 1
+    assert sorted(chunks[0]["id"]) == [5, 6]
+    assert list(chunks[0].columns) == ["id", "content"]
+
+    client.drop_table(table_name)
@@ -2,6 +2,11 @@ import pytest
 import os
 import csv
 import re
+from etl_project.assets.data_validation import validate_financial_data
+from etl_project.assets.presupuesto_etl import (
+    extract_financial_data_file,
+    transform_financial_data,
+)
 
 # Define the folder where the generated financial data is stored
 DATA_FOLDER = os.path.join(os.path.dirname(__file__), "presupuestos")
@@ -108,3 +113,14 @@ def test_financial_data_numeric_values(get_csv_files):
                 ), f"Invalid GDP Contribution: {row['GDP Contribution']}"
             except ValueError as e:
                 pytest.fail(f"Invalid numeric value found in row: {row} | Error: {e}")
+
+
+def test_financial_data_files_pass_validation(get_csv_files):
+    """Ensure every row of every CSV file passes the pipeline's validation rules."""
+    for file_name in get_csv_files:
+        df = transform_financial_data(
+            extract_financial_data_file(os.path.join(DATA_FOLDER, file_name))
+        )
+        _, quarantined, rule_counts = validate_financial_data(df)
+        failed_rules = {code: count for code, count in rule_counts.items() if count}
+        assert quarantined.empty, f"{file_name} has invalid rows: {failed_rules}"
@@ -0,0 +1,84 @@
+import os
+import shutil
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from etl_project.assets import presupuesto_etl
+from etl_project.assets.pipeline_logging import PipelineLogging
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), "..", "data", "presupuestos")
+
+
+@pytest.fixture
+def financial_data_year(tmp_path, monkeypatch):
+    """
+    Points the pipelines to a presupuestos directory holding the 2024 Q1
+    sample file as Q1 of a year without real presupuesto tables, and returns
+    that year.
+    """
+    year = 2099
+    shutil.copy(
+        os.path.join(DATA_FOLDER, "Nuevo_Leon_Financials_2024_Q1_daily.csv"),
+        tmp_path / f"Nuevo_Leon_Financials_{year}_Q1_daily.csv",
+    )
+    monkeypatch.setattr(
+        presupuesto_etl, "get_financial_data_directory", lambda: str(tmp_path)
+    )
+    return year
+
+
+@pytest.fixture
+def pipeline_logging():
+    pipeline_logging = PipelineLogging(
+        pipeline_name="test_pipeline", log_folder_path=None, capture="memory"
+    )
+    yield pipeline_logging
+    pipeline_logging.close()
+
+
+@pytest.fixture
+def read_table(postgres_client):
+    """Reads the rows of a table, in `DATE` order."""
+
+    def read(table_name: str) -> pd.DataFrame:
+        with postgres_client.engine.connect() as connection:
+            return pd.read_sql(
+                text(f'SELECT * FROM "{table_name}" ORDER BY "DATE"'), connection
+            )
+
+    return read
+
+
+@pytest.fixture
+def record_stages(monkeypatch):
+    """
+    Records the rows of each chunk a pipeline module extracts, and of each
+    frame it transforms and loads, in the order they happen.
+    """
+    events = []
+
+    def record(module) -> list[tuple[str, int]]:
+        extract_chunks = module.extract_financial_data_chunks
+        transform, load = module.transform_financial_data, module.load
+
+        def record_extract_chunks(**kwargs):
+            for chunk in extract_chunks(**kwargs):
+                events.append(("extract", len(chunk)))
+                yield chunk
+
+        def record_transform(df, **kwargs):
+            events.append(("transform", len(df)))
+            return transform(df, **kwargs)
+
+        def record_load(df, **kwargs):
+            events.append(("load", len(df)))
+            return load(df, **kwargs)
+
+        monkeypatch.setattr(
+            module, "extract_financial_data_chunks", record_extract_chunks
+        )
+        monkeypatch.setattr(module, "transform_financial_data", record_transform)
+        monkeypatch.setattr(module, "load", record_load)
+        return events
+
+    return record
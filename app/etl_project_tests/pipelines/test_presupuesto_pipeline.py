@@ -0,0 +1,65 @@
+import pandas as pd
+from etl_project.pipelines import presupuesto_pipeline
+
+
+def test_chunked_run_loads_the_same_rows_one_chunk_at_a_time(
+    record_stages,
+    postgres_client,
+    financial_data_year,
+    pipeline_logging,
+    read_table,
+):
+    config = {"year": financial_data_year, "quarter": "Q1"}
+    table_name = f"Nuevo_Leon_Financials_{financial_data_year}_Q1"
+    postgres_client.drop_table(f'"{table_name}"')
+    presupuesto_pipeline.pipeline(config=config, pipeline_logging=pipeline_logging)
+    expected = read_table(table_name)
+    postgres_client.drop_table(f'"{table_name}"')
+
+    events = record_stages(presupuesto_pipeline)
+    run_stats = presupuesto_pipeline.pipeline(
+        config={**config, "chunk_rows": 40}, pipeline_logging=pipeline_logging
+    )
+
+    # each chunk is loaded before the next one is extracted
+    assert events == [
+        ("extract", 40),
+        ("transform", 40),
+        ("load", 40),
+        ("extract", 40),
+        ("transform", 40),
+        ("load", 40),
+        ("extract", 10),
+        ("transform", 10),
+        ("load", 10),
+    ]
+    assert run_stats["stages"]["extract"]["rows_out"] == 90
+    assert run_stats["stages"]["load"]["rows_out"] == 90
+    pd.testing.assert_frame_equal(read_table(table_name), expected)
+
+    postgres_client.drop_table(f'"{table_name}"')
+
+
+def test_unchanged_file_is_skipped_on_the_next_run(
+    postgres_client, financial_data_year, pipeline_logging, open_manifest
+):
+    config = {"year": financial_data_year, "quarter": "Q1"}
+    table_name = f"Nuevo_Leon_Financials_{financial_data_year}_Q1"
+    postgres_client.drop_table(f'"{table_name}"')
+
+    first_run_stats = presupuesto_pipeline.pipeline(
+        config=config,
+        pipeline_logging=pipeline_logging,
+        source_manifest=open_manifest(),
+    )
+    second_run_stats = presupuesto_pipeline.pipeline(
+        config=config,
+        pipeline_logging=pipeline_logging,
+        source_manifest=open_manifest(),
+    )
+
+    assert first_run_stats["files_processed"] == 1
+    assert first_run_stats["files_skipped"] == 0
+    assert second_run_stats == {"files_processed": 0, "files_skipped": 1}
+
+    postgres_client.drop_table(f'"{table_name}"')
@@ -0,0 +1,34 @@
+import pytest
+import yaml
+from etl_project.runner import load_pipeline_configs
+
+
+def _write_yaml(file_path, pipeline_config: dict) -> None:
+    with open(file_path, "w") as yaml_file:
+        yaml.safe_dump(pipeline_config, yaml_file)
+
+
+def test_load_pipeline_configs_resolves_modules(tmp_path):
+    _write_yaml(tmp_path / "bulk_presupuesto_pipeline.yaml", {"name": "bulk"})
+    _write_yaml(
+        tmp_path / "bulk_2023.yaml",
+        {"name": "bulk_2023", "pipeline": "bulk_presupuesto_pipeline"},
+    )
+
+    pipeline_configs = load_pipeline_configs([str(tmp_path)])
+
+    assert [
+        (module_name, pipeline_config["name"])
+        for module_name, pipeline_config in pipeline_configs
+    ] == [
+        ("bulk_presupuesto_pipeline", "bulk_2023"),
+        ("bulk_presupuesto_pipeline", "bulk"),
+    ]
+
+
+def test_load_pipeline_configs_rejects_duplicate_names(tmp_path):
+    for file_name in ["presupuesto_pipeline.yaml", "bulk_presupuesto_pipeline.yaml"]:
+        _write_yaml(tmp_path / file_name, {"name": "presupuesto"})
+
+    with pytest.raises(Exception, match="unique"):
+        load_pipeline_configs([str(tmp_path)])